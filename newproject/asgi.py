@@ -19,11 +19,11 @@ django.setup()
 
 django_asgi_app = get_asgi_application()
 
+from spt.routing import websocket_urlpatterns  # noqa: E402  (needs the app registry)
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter([
-            # WebSocket routing will be added here
-        ])
+        URLRouter(websocket_urlpatterns)
     ),
 })
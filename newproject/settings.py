@@ -24,7 +24,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-d0=a(&lt9nun89axj=y#-!m5ua9^0t8$8qggmy@i!8dfmp68mm'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# SPT_DEBUG=0 turns it off, e.g. for benchmarks (see spt/management/commands/bench_http.py).
+DEBUG = os.environ.get('SPT_DEBUG', '1') != '0'
 
 ALLOWED_HOSTS = ['*']
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its totals cover the other middleware too (see spt/instrumentation.py).
+    'spt.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,11 +86,56 @@ ASGI_APPLICATION = 'newproject.asgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SPT_DB_PATH points the project at another database file, such as a
+        # generated load-test dataset.
+        'NAME': os.environ.get('SPT_DB_PATH') or BASE_DIR / 'db.sqlite3',
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# The catalog version counter (spt/cache.py) must be shared by every worker
+# process. LocMemCache is per process and only suits a single worker;
+# SPT_CACHE_DIR switches to a file-based cache all workers on a host share.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'spt-default',
+    }
+}
+if os.environ.get('SPT_CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['SPT_CACHE_DIR'],
+    }
+
+# Catalog response cache (see spt/cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+CATALOG_CACHE_ENABLED = True
+
+# Seconds the admin dashboard's metrics are cached (0 disables)
+ADMIN_DASHBOARD_CACHE_TIMEOUT = 30
+
+# Upper bounds of the base_price buckets reported by /api/products/facets/
+PRODUCT_PRICE_BUCKETS = [100, 500, 1000, 5000]
+
+# Seconds a cart's stock reservation is held (see spt/reservations.py)
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Seconds an Idempotency-Key response is kept for replay (see spt/idempotency.py)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Order numbers (see spt/order_numbers.py)
+ORDER_NUMBER_GENERATOR = 'spt.order_numbers.sequential_order_number'
+ORDER_NUMBER_BLOCK_SIZE = 100
+
+# Rows fetched and encoded per chunk by the order exports (see spt/exports.py)
+EXPORT_CHUNK_SIZE = 2000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -160,3 +208,31 @@ CHANNEL_LAYERS = {
         'BACKEND': 'channels.layers.InMemoryChannelLayer'
     }
 }
+
+# Several Daphne workers on one host must share groups: point
+# SPT_CHANNEL_LAYER_DB at a SQLite file they can all open (see
+# spt/channel_layers.py).
+if os.environ.get('SPT_CHANNEL_LAYER_DB'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'spt.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {'path': os.environ['SPT_CHANNEL_LAYER_DB']},
+        }
+    }
+
+# One JSON line per request from spt.instrumentation. SPT_QUERY_LOG_LEVEL=INFO
+# logs every request; the default keeps only slow or query-heavy ones.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'spt.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('SPT_QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
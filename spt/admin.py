@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     ProductCategory, Product, ProductVariant, Customer,
-    Cart, CartItem, Order, OrderItem, Inventory
+    Cart, CartItem, Order, OrderItem, Inventory, StockReservation,
+    IdempotencyKey, DailySalesRollup, ProductDailySales
 )
 
 
@@ -15,7 +16,8 @@ class ProductCategoryAdmin(admin.ModelAdmin):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'base_price', 'is_active', 'created_at']
     list_filter = ['category', 'is_active', 'created_at']
-    search_fields = ['name', 'description']
+    search_fields = ['name', 'sku', 'description']
+    readonly_fields = ['total_stock', 'in_stock']
 
 
 @admin.register(ProductVariant)
@@ -61,3 +63,29 @@ class InventoryAdmin(admin.ModelAdmin):
     list_display = ['variant', 'total_stock', 'available_stock', 'reorder_level']
     search_fields = ['variant__product__name']
 
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['cart', 'variant', 'quantity', 'expires_at']
+    list_filter = ['expires_at']
+    search_fields = ['cart__user__username', 'variant__sku']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'status_code', 'created_at']
+    search_fields = ['key', 'user__username']
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'status', 'order_count', 'revenue']
+    list_filter = ['status']
+    date_hierarchy = 'date'
+
+
+@admin.register(ProductDailySales)
+class ProductDailySalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'product', 'quantity', 'revenue']
+    search_fields = ['product__name']
+    date_hierarchy = 'date'
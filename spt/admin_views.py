@@ -1,13 +1,24 @@
 """
 Admin dashboard views for data visualization and analytics
 """
+from django.conf import settings
+from django.core.cache import caches
 from django.shortcuts import render
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Sum, Count, Q
+from django.db.models import Case, Count, DateField, F, Prefetch, Q, Sum, Value, When
 from django.utils import timezone
+from collections import defaultdict
 from datetime import timedelta
 from decimal import Decimal
-from .models import Order, OrderItem, Product, ProductVariant, Customer, Cart
+from rest_framework.exceptions import NotFound
+from .cache import get_cache_stats, single_flight
+from .exports import EXPORTS, ExportError, streaming_response
+from .instrumentation import get_query_stats
+from .models import (
+    Order, OrderItem, Product, ProductVariant, Customer, Cart, DailySalesRollup, ProductDailySales
+)
+from .pagination import decode_cursor, encode_cursor, keyset_filter
 import json
 
 
@@ -16,110 +27,105 @@ def is_admin(user):
     return user.is_staff or user.is_superuser
 
 
-@login_required
-@user_passes_test(is_admin)
-def admin_dashboard(request):
+DASHBOARD_CACHE_KEY = 'admin:dashboard'
+
+STATUS_COLORS = {
+    'PENDING': '#f59e0b',
+    'CONFIRMED': '#8b5cf6',
+    'PROCESSING': '#3b82f6',
+    'SHIPPED': '#06b6d4',
+    'DELIVERED': '#10b981',
+    'CANCELLED': '#ef4444',
+}
+
+
+def dashboard_context():
     """
-    Main admin dashboard with key metrics and visualizations
+    Compute the dashboard's metrics and chart data
     """
     # Get date range (last 30 days by default)
-    today = timezone.now().date()
+    today = timezone.localdate()
     last_30_days = today - timedelta(days=30)
+    recent = Q(date__gte=last_30_days)
     
-    # Calculate key metrics
-    total_orders = Order.objects.count()
-    total_revenue = Order.objects.aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0.00')
+    # Order metrics come from the daily rollups (see spt/rollups.py), so
+    # their cost does not grow with the order history. One grouped query
+    # returns a row per status and day of the last 30 days plus one per
+    # status for everything older; the totals, the status counts and the
+    # daily chart are all summed from those rows.
+    rollups = DailySalesRollup.objects.order_by().values(
+        'status', day=Case(When(recent, then=F('date')), default=Value(None), output_field=DateField()),
+    ).annotate(orders=Sum('order_count'), revenue=Sum('revenue'))
+    total_orders, total_revenue = 0, Decimal('0.00')
+    orders_last_30, revenue_last_30 = 0, Decimal('0.00')
+    status_counts = defaultdict(int)
+    daily = defaultdict(lambda: [Decimal('0.00'), 0])
+    for row in rollups:
+        orders, revenue = row['orders'] or 0, row['revenue'] or Decimal('0.00')
+        total_orders += orders
+        total_revenue += revenue
+        status_counts[row['status']] += orders
+        if row['day'] is not None:
+            orders_last_30 += orders
+            revenue_last_30 += revenue
+            daily[row['day']][0] += revenue
+            daily[row['day']][1] += orders
     
-    completed_orders = Order.objects.filter(status='completed').count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    
-    total_customers = Customer.objects.count()
-    total_products = Product.objects.count()
-    
-    # Recent 30 days metrics
-    orders_last_30 = Order.objects.filter(
-        created_at__date__gte=last_30_days
-    ).count()
-    revenue_last_30 = Order.objects.filter(
-        created_at__date__gte=last_30_days
-    ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+    # Customer and product counts in one statement
+    created_recently = Q(created_at__date__gte=last_30_days)
+    counts = {
+        row['kind']: row for row in Customer.objects.order_by().values(kind=Value('customers')).annotate(
+            total=Count('pk'), recent=Count('pk', filter=created_recently),
+        ).union(Product.objects.order_by().values(kind=Value('products')).annotate(
+            total=Count('pk'), recent=Count('pk', filter=created_recently),
+        ), all=True)
+    }
+    customers = counts.get('customers', {'total': 0, 'recent': 0})
     
-    # Top products by sales
-    top_products = OrderItem.objects.values(
+    # Top products by sales; rollup revenue is
+    # (price_at_purchase + variant_price_at_purchase) * quantity.
+    top_products = list(ProductDailySales.objects.values(
         'product__name',
         'product__id'
     ).annotate(
         total_sold=Sum('quantity'),
-        total_revenue=Sum('price')
-    ).order_by('-total_sold')[:5]
-    
-    # Orders by status
-    orders_by_status = Order.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('status')
-    
-    # Daily sales last 30 days
-    daily_sales = Order.objects.filter(
-        created_at__date__gte=last_30_days
-    ).extra(
-        select={'date': 'DATE(created_at)'}
-    ).values('date').annotate(
-        revenue=Sum('total_amount'),
-        orders=Count('id')
-    ).order_by('date')
+        total_revenue=Sum('revenue')
+    ).order_by('-total_sold')[:5])
     
     # Prepare chart data for daily sales
     daily_dates = []
     daily_revenues = []
     daily_orders = []
     
-    for sale in daily_sales:
-        daily_dates.append(str(sale['date']))
-        daily_revenues.append(float(sale['revenue'] or 0))
-        daily_orders.append(sale['orders'])
-    
-    # Prepare status data
-    status_labels = []
-    status_counts = []
-    status_colors = {
-        'pending': '#f59e0b',
-        'processing': '#3b82f6',
-        'completed': '#10b981',
-        'cancelled': '#ef4444'
-    }
-    
-    for status in orders_by_status:
-        status_labels.append(status['status'].capitalize())
-        status_counts.append(status['count'])
+    for date in sorted(daily):
+        revenue, orders = daily[date]
+        daily_dates.append(str(date))
+        daily_revenues.append(float(revenue))
+        daily_orders.append(orders)
     
-    # Top products data
-    product_names = [p['product__name'] for p in top_products]
-    product_quantities = [int(p['total_sold'] or 0) for p in top_products]
-    product_ids = [p['product__id'] for p in top_products]
+    # Orders by status, in STATUS_CHOICES order
+    orders_by_status = [
+        (status, label, status_counts[status])
+        for status, label in Order.STATUS_CHOICES
+        if status_counts[status]
+    ]
     
     # Stock levels - Low stock alert (less than 50 units)
-    low_stock_items = ProductVariant.objects.filter(
+    low_stock_items = list(ProductVariant.objects.filter(
         stock_quantity__lt=50
-    ).select_related('product').order_by('stock_quantity')[:10]
-    
-    # Customer growth
-    new_customers_last_30 = Customer.objects.filter(
-        created_at__date__gte=last_30_days
-    ).count()
+    ).select_related('product').order_by('stock_quantity')[:10])
     
-    context = {
+    return {
         'total_orders': total_orders,
         'total_revenue': f"{total_revenue:.2f}",
-        'completed_orders': completed_orders,
-        'pending_orders': pending_orders,
-        'total_customers': total_customers,
-        'total_products': total_products,
+        'completed_orders': status_counts['DELIVERED'],
+        'pending_orders': status_counts['PENDING'],
+        'total_customers': customers['total'],
+        'total_products': counts.get('products', {'total': 0})['total'],
         'orders_last_30': orders_last_30,
         'revenue_last_30': f"{revenue_last_30:.2f}",
-        'new_customers_last_30': new_customers_last_30,
-        'top_products': list(top_products),
+        'new_customers_last_30': customers['recent'],
+        'top_products': top_products,
         'low_stock_items': low_stock_items,
         'daily_chart_data': {
             'labels': daily_dates,
@@ -127,47 +133,102 @@ def admin_dashboard(request):
             'orders': daily_orders
         },
         'status_chart_data': {
-            'labels': status_labels,
-            'data': status_counts,
-            'colors': [status_colors.get(s['status'], '#6b7280') for s in orders_by_status]
+            'labels': [label for _, label, _ in orders_by_status],
+            'data': [count for _, _, count in orders_by_status],
+            'colors': [STATUS_COLORS.get(status, '#6b7280') for status, _, _ in orders_by_status]
         },
         'product_chart_data': {
-            'labels': product_names,
-            'data': product_quantities,
+            'labels': [p['product__name'] for p in top_products],
+            'data': [int(p['total_sold'] or 0) for p in top_products],
         }
     }
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_dashboard(request):
+    """
+    Main admin dashboard with key metrics and visualizations
+    """
+    # Cached briefly; only one request at a time recomputes an expired copy.
+    timeout = getattr(settings, 'ADMIN_DASHBOARD_CACHE_TIMEOUT', 30)
+    if timeout:
+        context = single_flight(caches['default'], DASHBOARD_CACHE_KEY, dashboard_context, timeout)
+    else:
+        context = dashboard_context()
     
     return render(request, 'admin_dashboard.html', context)
 
 
+ADMIN_ORDERS_PAGE_SIZE = 20
+ADMIN_ORDERS_ORDERING = ('-created_at', '-id')
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_orders(request):
     """
     Admin panel for order management
+    
+    Pages are navigated by keyset (``?after=`` / ``?before=`` cursors) so
+    every page costs the same however deep it is, and the total shown is the
+    rollup count rather than a ``COUNT(*)`` over the table.
+    
+    Template context: ``orders``, ``statuses`` (status values, as before),
+    ``status_choices`` (``(value, label)`` pairs), ``current_status``,
+    ``estimated_total`` and ``next_cursor`` / ``previous_cursor`` (None at
+    either end) in place of the former ``page_obj``.
     """
-    # Get all orders with filtering
-    orders = Order.objects.select_related('customer').prefetch_related('items').order_by('-created_at')
+    # Orders with their user, lines, products and variants in three queries
+    orders = Order.objects.select_related('user').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product', 'variant'))
+    )
     
     # Filter by status if provided
+    status_choices = Order.STATUS_CHOICES
     status_filter = request.GET.get('status')
+    if status_filter not in dict(status_choices):
+        status_filter = None
     if status_filter:
         orders = orders.filter(status=status_filter)
     
-    # Get unique statuses for filter dropdown
-    statuses = Order.objects.values_list('status', flat=True).distinct()
+    # Keyset navigation: rows after the last one shown, or before the first
+    ordering = ADMIN_ORDERS_ORDERING
+    after, before = request.GET.get('after'), request.GET.get('before')
+    try:
+        if before:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+            orders = orders.filter(keyset_filter(ordering, decode_cursor(before, Order, ordering)))
+        elif after:
+            orders = orders.filter(keyset_filter(ordering, decode_cursor(after, Order, ordering)))
+    except NotFound:
+        raise Http404('Invalid cursor')
+    page = list(orders.order_by(*ordering)[:ADMIN_ORDERS_PAGE_SIZE + 1])
+    has_more = len(page) > ADMIN_ORDERS_PAGE_SIZE
+    page = page[:ADMIN_ORDERS_PAGE_SIZE]
+    if before:
+        page.reverse()
     
-    # Pagination
-    from django.core.paginator import Paginator
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    def cursor(order):
+        return encode_cursor([getattr(order, field.lstrip('-')) for field in ADMIN_ORDERS_ORDERING])
+    
+    has_next = has_more if not before else True
+    has_previous = has_more if before else bool(after)
+    
+    # Estimated total from the daily rollups
+    rollups = DailySalesRollup.objects.all()
+    if status_filter:
+        rollups = rollups.filter(status=status_filter)
+    estimated_total = rollups.aggregate(total=Sum('order_count'))['total'] or 0
     
     context = {
-        'page_obj': page_obj,
-        'orders': page_obj.object_list,
-        'statuses': statuses,
+        'orders': page,
+        'statuses': [value for value, _ in status_choices],
+        'status_choices': status_choices,
         'current_status': status_filter,
+        'estimated_total': estimated_total,
+        'next_cursor': cursor(page[-1]) if page and has_next else None,
+        'previous_cursor': cursor(page[0]) if page and has_previous else None,
     }
     
     return render(request, 'admin_orders.html', context)
@@ -179,15 +240,14 @@ def admin_products(request):
     """
     Admin panel for product management and inventory
     """
-    # Get all products with variant info
-    products = Product.objects.prefetch_related('variants').annotate(
-        total_stock=Sum('variants__stock_quantity'),
+    # Get all products with variant info (total_stock is a maintained column)
+    products = Product.objects.select_related('category').prefetch_related('variants').annotate(
         total_variants=Count('variants')
     ).order_by('-created_at')
     
     # Calculate inventory metrics
-    total_stock = ProductVariant.objects.aggregate(
-        total=Sum('stock_quantity')
+    total_stock = Product.objects.aggregate(
+        total=Sum('total_stock')
     )['total'] or 0
     
     low_stock = ProductVariant.objects.filter(
@@ -213,3 +273,41 @@ def admin_products(request):
     }
     
     return render(request, 'admin_products.html', context)
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_cache_stats(request):
+    """
+    Catalog response cache counters
+    """
+    return JsonResponse(get_cache_stats())
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_query_stats(request):
+    """
+    Per-view query counts and timings of this process (see spt/instrumentation.py)
+    """
+    return JsonResponse(get_query_stats())
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export(request, kind):
+    """
+    Stream all orders or order lines as CSV or NDJSON
+    
+    ``?format=csv|ndjson``, ``?start=`` / ``?end=`` (inclusive order dates)
+    and ``?status=`` narrow the export.
+    """
+    if kind not in EXPORTS:
+        raise Http404('Unknown export')
+    try:
+        return streaming_response(
+            request, kind, request.GET.get('format', 'csv'),
+            start=request.GET.get('start'), end=request.GET.get('end'), status=request.GET.get('status'),
+        )
+    except ExportError as exc:
+        return HttpResponseBadRequest(str(exc))
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class SptConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'spt'
+
+    def ready(self):
+        from django.core import checks
+        from django.db.models.signals import post_migrate
+        from . import cache, signals
+
+        post_migrate.connect(signals.ensure_product_search_index, sender=self)
+        checks.register(cache.check_catalog_cache, checks.Tags.caches)
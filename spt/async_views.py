@@ -0,0 +1,169 @@
+"""
+Async variants of the cart and order viewsets.
+
+DRF dispatches synchronously, so under an ASGI server every request to a
+regular viewset is handed to a worker thread. ``AsyncViewSetMixin`` gives a
+viewset a coroutine ``dispatch``: handlers written as ``async def`` run on the
+event loop and use Django's async ORM, so one worker can keep many slow
+clients in flight. Handlers that are still synchronous (and anything that
+needs a transaction, which Django does not support in async code) run through
+``sync_to_async`` as before.
+
+Authentication, permissions and content negotiation are unchanged; the
+session user is loaded with ``request.auser()`` first so that DRF's
+``SessionAuthentication`` never touches the database from the event loop.
+"""
+from functools import update_wrapper
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import aprefetch_related_objects
+from django.shortcuts import aget_object_or_404
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .cart import CartOperationError, apply_cart_operations
+from .conditional import acompute_validators, aconditional_response
+from .idempotency import idempotent
+from .models import Cart, CartItem, Order, Product, ProductVariant
+from .pagination import CreatedAtKeysetPagination, wants_keyset
+from .serializers import CartBatchSerializer, CartItemSerializer, CartSerializer, OrderSerializer
+from .views import CartViewSet, OrderViewSet
+
+
+class AsyncViewSetMixin:
+    """Coroutine ``dispatch`` for DRF viewsets"""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        auser = getattr(request, 'auser', None)
+        if auser is not None:
+            request.user = await auser()
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncCartViewSet(AsyncViewSetMixin, CartViewSet):
+    """``CartViewSet`` with async list, add and update_quantity"""
+
+    async def aserialize_cart(self, cart):
+        await aprefetch_related_objects([cart], *CartSerializer.get_prefetches())
+        summary = await cart.aget_summary()
+        return CartSerializer(cart, context={'summary': summary}).data
+
+    async def list(self, request):
+        """Get user's cart"""
+        cart, _ = await Cart.objects.aget_or_create(user=request.user)
+        return Response(await self.aserialize_cart(cart))
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    async def add(self, request):
+        """Add item to cart"""
+        cart, _ = await Cart.objects.aget_or_create(user=request.user)
+        product_id = request.data.get('product_id')
+        variant_id = request.data.get('variant_id')
+        quantity = int(request.data.get('quantity', 1))
+
+        if not product_id:
+            return Response({'error': 'product_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        product = await aget_object_or_404(Product, id=product_id)
+        variant = None
+        if variant_id:
+            variant = await aget_object_or_404(ProductVariant, id=variant_id)
+
+        operation = {'op': 'add', 'product_id': product.id, 'variant_id': variant.id if variant else None, 'quantity': quantity}
+        serializer = CartBatchSerializer(data={'operations': [operation]})
+        serializer.is_valid(raise_exception=True)
+        try:
+            # The upsert runs in a transaction, which needs a sync thread.
+            await sync_to_async(apply_cart_operations)(cart, serializer.validated_data['operations'])
+        except CartOperationError as exc:
+            return Response({'error': exc.errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart_item = await CartItem.objects.filter(cart=cart, product=product, variant=variant).afirst()
+        cart_item.product, cart_item.variant = product, variant
+        serializer = CartItemSerializer(cart_item)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    async def update_quantity(self, request):
+        """Update item quantity"""
+        cart = await aget_object_or_404(Cart, user=request.user)
+        item_id = request.data.get('item_id')
+        quantity = int(request.data.get('quantity', 1))
+
+        if not item_id:
+            return Response({'error': 'item_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart_item = await aget_object_or_404(CartItem.objects.select_related('product', 'variant'), id=item_id, cart=cart)
+        cart_item.quantity = max(1, quantity)
+        await cart_item.asave()
+
+        serializer = CartItemSerializer(cart_item)
+        return Response(serializer.data)
+
+
+class AsyncOrderViewSet(AsyncViewSetMixin, OrderViewSet):
+    """``OrderViewSet`` with async list, retrieve and track"""
+
+    async def list(self, request):
+        """Get user's orders"""
+        orders = OrderSerializer.setup_eager_loading(Order.objects.filter(user=request.user))
+        if wants_keyset(request):
+            paginator = CreatedAtKeysetPagination()
+            page = await paginator.apaginate_queryset(orders, request, view=self)
+            serializer = OrderSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = OrderSerializer([order async for order in orders], many=True)
+        return Response(serializer.data)
+
+    async def retrieve(self, request, pk=None):
+        """Get specific order"""
+        return await aconditional_response(request, await self.aget_order_validators(request, pk), self._aretrieve, pk=pk)
+
+    async def _aretrieve(self, request, pk=None):
+        order = await aget_object_or_404(OrderSerializer.setup_eager_loading(Order.objects.all()), id=pk, user=request.user)
+        serializer = OrderSerializer(order)
+        return Response(serializer.data)
+
+    async def aget_order_validators(self, request, pk):
+        orders = Order.objects.filter(id=pk, user=request.user)
+        return await acompute_validators(request, orders, counts=('pk', 'items'))
+
+    @action(detail=True, methods=['get'])
+    async def track(self, request, pk=None):
+        """Track order status"""
+        return await aconditional_response(request, await self.aget_order_validators(request, pk), self._aretrieve, pk=pk)
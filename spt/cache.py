@@ -0,0 +1,184 @@
+"""
+Versioned response cache for the read-only catalog endpoints.
+
+Cached responses are keyed by a catalog version counter. Any write to a
+product, variant or category bumps the version (see ``spt.signals``), which
+orphans every cached response at once instead of deleting keys one by one.
+
+The counter lives in the catalog cache itself, so every worker process must
+share that cache (Redis, Memcached, a file-based or database cache). With a
+per-process backend such as ``LocMemCache`` a write only invalidates the
+worker that made it, and the others serve stale pages until the timeout;
+the ``spt.W001`` system check warns about that.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+PER_PROCESS_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def get_catalog_cache():
+    """Cache backend used for catalog responses"""
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def check_catalog_cache(app_configs, **kwargs):
+    """Warn when the catalog cache cannot be shared between worker processes"""
+    if not getattr(settings, 'CATALOG_CACHE_ENABLED', True):
+        return []
+    alias = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend not in PER_PROCESS_BACKENDS:
+        return []
+    return [checks.Warning(
+        f'The catalog cache {alias!r} uses {backend.rsplit(".", 1)[-1]}, which each process keeps to '
+        'itself: catalog writes in one worker will not invalidate the pages cached by the others.',
+        hint='Point CACHES[CATALOG_CACHE_ALIAS] at a shared backend (e.g. set SPT_CACHE_DIR), '
+             'run a single worker, or set CATALOG_CACHE_ENABLED = False.',
+        id='spt.W001',
+    )]
+
+
+def _incr(cache, key):
+    """Increment a counter, creating it if it was evicted or never set"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_catalog_version():
+    """Current catalog version"""
+    cache = get_catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version key lost to eviction never
+        # restarts at a number whose cached responses may still be around.
+        seed = time.time_ns()
+        cache.add(VERSION_KEY, seed, timeout=None)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response.
+
+    Signal handlers call this for ordinary saves and deletes; code that
+    changes catalog rows with ``QuerySet.update()`` or ``bulk_*`` must call it
+    itself.
+    """
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_catalog_version()
+
+
+def get_cache_stats():
+    """Hit/miss counters for the catalog cache"""
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        'version': get_catalog_version(),
+        'hits': hits,
+        'misses': misses,
+    }
+
+
+def reset_cache_stats():
+    cache = get_catalog_cache()
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def get_cache_key(request, view, name='response'):
+    """Key for a cached value, scoped to the current catalog version"""
+    media_type = getattr(request, 'accepted_media_type', '') or ''
+    path_hash = hashlib.sha1(f'{request.get_full_path()}|{media_type}'.encode()).hexdigest()
+    return f'catalog:v{get_catalog_version()}:{view.basename}:{view.action}:{name}:{path_hash}'
+
+
+def cached_response(view, request, handler, *args, **kwargs):
+    """Serve ``handler`` from the catalog cache.
+
+    Only successful responses are stored. The cached value is the serialized
+    ``response.data``, so content negotiation still happens per request.
+    """
+    if not getattr(settings, 'CATALOG_CACHE_ENABLED', True) or request.method != 'GET':
+        return handler(request, *args, **kwargs)
+
+    cache = get_catalog_cache()
+    key = get_cache_key(request, view)
+    cached = cache.get(key)
+    if cached is not None:
+        _incr(cache, HITS_KEY)
+        return Response(cached)
+
+    _incr(cache, MISSES_KEY)
+    response = handler(request, *args, **kwargs)
+    if response.status_code == 200:
+        cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    return response
+
+
+class CatalogCacheMixin:
+    """Cache ``list`` and ``retrieve`` responses of a catalog viewset"""
+
+    def get_cached(self, request, name, compute):
+        """Cache any other per-request value under the catalog version"""
+        if not getattr(settings, 'CATALOG_CACHE_ENABLED', True):
+            return compute()
+        cache = get_catalog_cache()
+        key = get_cache_key(request, self, name)
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return value
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(self, request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(self, request, super().retrieve, *args, **kwargs)
+
+
+def single_flight(cache, key, compute, timeout, lock_timeout=30, wait=0.05):
+    """Cached ``compute()`` that only one caller recomputes at a time.
+
+    The value is stored with its refresh deadline and kept for another
+    ``timeout`` after it, so while one caller (holding ``<key>:lock``)
+    recomputes an expired value the others keep serving the stale one. With no
+    value at all they wait for the refresh, up to ``lock_timeout`` seconds,
+    and compute it themselves only if it never arrives.
+    """
+    lock_key = f'{key}:lock'
+    deadline = None
+    while True:
+        entry = cache.get(key)
+        now = time.time()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        if cache.add(lock_key, 1, timeout=lock_timeout):
+            try:
+                value = compute()
+                cache.set(key, (time.time() + timeout, value), timeout * 2)
+            finally:
+                cache.delete(lock_key)
+            return value
+        if entry is not None:
+            return entry[1]
+        deadline = deadline or now + lock_timeout
+        if now >= deadline:
+            return compute()
+        time.sleep(wait)
@@ -0,0 +1,168 @@
+"""
+Batch cart mutations.
+
+A batch of add/set/remove operations is first folded into one final
+instruction per cart line, so repeated operations on a line cost nothing
+extra, then applied inside one transaction:
+
+* removes are a single ``DELETE``;
+* adds are ``INSERT ... ON CONFLICT DO UPDATE SET quantity = quantity +
+  excluded.quantity`` upserts against the ``(cart, product, variant)`` unique
+  constraint, so concurrent adds to the same line never lose an increment;
+* sets are ``bulk_create(update_conflicts=True)`` upserts.
+
+SQL treats NULLs as distinct in unique constraints, so lines without a
+variant cannot conflict; those use an ``F()`` update followed by an insert
+when no row matched.
+"""
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CartItem, Product, ProductVariant
+
+
+class CartOperationError(Exception):
+    """Raised with a list of ``{'index': i, 'error': message}`` problems"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _line_filter(keys):
+    condition = Q()
+    for product_id, variant_id in keys:
+        if variant_id is None:
+            condition |= Q(product_id=product_id, variant__isnull=True)
+        else:
+            condition |= Q(product_id=product_id, variant_id=variant_id)
+    return condition
+
+
+def fold_operations(cart, operations):
+    """Reduce ``operations`` to ``{(product_id, variant_id): (action, quantity)}``.
+
+    ``action`` is ``'add'``, ``'set'`` or ``'remove'``; applying the folded
+    instructions gives the same cart as applying the operations in order.
+    """
+    errors = []
+    product_ids = {op['product_id'] for op in operations if op.get('product_id') is not None}
+    variant_ids = {op['variant_id'] for op in operations if op.get('variant_id') is not None}
+    item_ids = {op['item_id'] for op in operations if op.get('item_id') is not None}
+
+    products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)) if product_ids else set()
+    variants = ProductVariant.objects.only('id', 'product_id').in_bulk(variant_ids) if variant_ids else {}
+    items = {
+        item.pk: (item.product_id, item.variant_id)
+        for item in CartItem.objects.filter(cart=cart, pk__in=item_ids).only('id', 'product_id', 'variant_id')
+    } if item_ids else {}
+
+    lines = {}
+    for index, op in enumerate(operations):
+        if op.get('item_id') is not None:
+            if op['item_id'] not in items:
+                errors.append({'index': index, 'error': f"Cart item {op['item_id']} not found"})
+                continue
+            key = items[op['item_id']]
+        else:
+            key = (op['product_id'], op.get('variant_id'))
+            if key[0] not in products:
+                errors.append({'index': index, 'error': f'Product {key[0]} not found'})
+                continue
+            if key[1] is not None:
+                variant = variants.get(key[1])
+                if variant is None or variant.product_id != key[0]:
+                    errors.append({'index': index, 'error': f'Variant {key[1]} not found for product {key[0]}'})
+                    continue
+
+        action, quantity = lines.get(key, ('add', 0))
+        if op['op'] == 'remove' or (op['op'] == 'set' and op['quantity'] < 1):
+            lines[key] = ('remove', 0)
+        elif op['op'] == 'set':
+            lines[key] = ('set', op['quantity'])
+        elif action == 'remove':
+            lines[key] = ('set', op['quantity'])
+        else:
+            lines[key] = (action, quantity + op['quantity'])
+
+    if errors:
+        raise CartOperationError(errors)
+    return lines
+
+
+def _upsert_adds(cart, adds, connection, now):
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(c) for c in (
+        'cart_id', 'product_id', 'variant_id', 'quantity', 'created_at', 'updated_at',
+    ))
+    sql = (
+        f'INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s) '
+        f'ON CONFLICT (cart_id, product_id, variant_id) DO UPDATE SET '
+        f'quantity = {table}.quantity + excluded.quantity, updated_at = excluded.updated_at'
+    )
+    stamp = connection.ops.adapt_datetimefield_value(now)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (cart.pk, product_id, variant_id, quantity, stamp, stamp)
+            for (product_id, variant_id), quantity in adds.items()
+        ])
+
+
+def _add_without_conflict_target(cart, adds, now):
+    """Additive write for lines that cannot use ``ON CONFLICT``"""
+    for (product_id, variant_id), quantity in adds.items():
+        updated = CartItem.objects.filter(_line_filter([(product_id, variant_id)]), cart=cart).update(
+            quantity=F('quantity') + quantity, updated_at=now,
+        )
+        if not updated:
+            CartItem.objects.create(cart=cart, product_id=product_id, variant_id=variant_id, quantity=quantity)
+
+
+def _set_without_conflict_target(cart, sets, now):
+    for (product_id, variant_id), quantity in sets.items():
+        updated = CartItem.objects.filter(_line_filter([(product_id, variant_id)]), cart=cart).update(
+            quantity=quantity, updated_at=now,
+        )
+        if not updated:
+            CartItem.objects.create(cart=cart, product_id=product_id, variant_id=variant_id, quantity=quantity)
+
+
+def apply_cart_operations(cart, operations):
+    """Apply validated cart operations atomically.
+
+    Raises ``CartOperationError`` (before writing anything) when an operation
+    refers to a missing product, variant or cart item.
+    """
+    lines = fold_operations(cart, operations)
+    removes = [key for key, (action, _) in lines.items() if action == 'remove']
+    adds = {key: quantity for key, (action, quantity) in lines.items() if action == 'add' and quantity}
+    sets = {key: quantity for key, (action, quantity) in lines.items() if action == 'set'}
+
+    using = router.db_for_write(CartItem)
+    connection = connections[using]
+    upsert = connection.features.supports_update_conflicts_with_target
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        if removes:
+            CartItem.objects.filter(_line_filter(removes), cart=cart).delete()
+
+        variant_adds = {key: q for key, q in adds.items() if key[1] is not None and upsert}
+        if variant_adds:
+            _upsert_adds(cart, variant_adds, connection, now)
+        _add_without_conflict_target(cart, {k: q for k, q in adds.items() if k not in variant_adds}, now)
+
+        variant_sets = {key: q for key, q in sets.items() if key[1] is not None and upsert}
+        if variant_sets:
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, product_id=product_id, variant_id=variant_id, quantity=quantity)
+                    for (product_id, variant_id), quantity in variant_sets.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'product', 'variant'],
+                update_fields=['quantity', 'updated_at'],
+            )
+        _set_without_conflict_target(cart, {k: q for k, q in sets.items() if k not in variant_sets}, now)
+    return lines
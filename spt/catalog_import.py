@@ -0,0 +1,275 @@
+"""
+Bulk catalog import from supplier feeds.
+
+A feed is CSV (with a header row) or JSON Lines, one row per variant. A row
+without ``variant_sku`` only describes its product:
+
+    product_sku, name, description, category, base_price, image_url, is_active,
+    variant_sku, variant_name, variant_type, additional_price, stock_quantity
+
+Products are keyed by ``Product.sku`` and variants by ``ProductVariant.sku``.
+The feed is read ``batch_size`` rows at a time. Each batch is compared with
+the stored rows, and only new or changed ones are written. Each of categories,
+products and variants takes one ``bulk_create(update_conflicts=True)`` on its
+unique key, in one transaction per batch. As ``bulk_*`` writes skip the model
+signals, the batch then recomputes the stock totals of the products and
+inventory rows it touched (``reconcile_stock``, ``reconcile_inventory``) and
+bumps the catalog cache once. Recomputing is one set-based ``UPDATE`` each,
+where ``apply_stock_changes`` would build a ``CASE`` with a branch per
+variant.
+
+The upserts only resolve SKU conflicts. A variant row whose product, name and
+type already belong to another SKU (stored, or earlier in the batch) is
+rejected before the write and reported with its line number. Should a batch
+still hit an ``IntegrityError`` (another writer, say), that batch is rolled
+back and reported and the import goes on with the next one.
+"""
+import csv
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from .cache import bump_catalog_version
+from .models import Product, ProductCategory, ProductVariant
+from .events import publish_stock
+from .reservations import reconcile_inventory
+from .stock import reconcile_stock
+
+PRODUCT_FIELDS = ('name', 'description', 'category_id', 'base_price', 'image_url', 'is_active')
+VARIANT_FIELDS = ('product_id', 'variant_name', 'variant_type', 'additional_price', 'stock_quantity')
+VARIANT_TYPES = dict(ProductVariant.VARIANT_TYPES)
+CENTS = Decimal('0.01')
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def read_rows(lines, input_format):
+    """Yield ``(line_number, row)`` from an open feed, one row at a time"""
+    if input_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif input_format == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as exc:
+                    yield number, exc
+    else:
+        raise CatalogImportError(f'Unknown format {input_format!r}')
+
+
+def _text(row, name, required=False):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise CatalogImportError(f'{name} is required')
+    return value
+
+
+def _amount(row, name):
+    try:
+        value = Decimal(_text(row, name) or '0').quantize(CENTS)
+    except InvalidOperation:
+        raise CatalogImportError(f'{name} must be a number')
+    if value < 0:
+        raise CatalogImportError(f'{name} must not be negative')
+    return value
+
+
+def _flag(row, name):
+    value = row.get(name, True)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n')
+
+
+def parse_row(row):
+    """Split a feed row into product and variant values (variant None if absent)"""
+    if not isinstance(row, dict):
+        raise CatalogImportError(f'Unreadable row: {row}')
+    product = {
+        'sku': _text(row, 'product_sku', required=True),
+        'name': _text(row, 'name', required=True),
+        'description': _text(row, 'description'),
+        'category': _text(row, 'category', required=True),
+        'base_price': _amount(row, 'base_price'),
+        'image_url': _text(row, 'image_url') or None,
+        'is_active': _flag(row, 'is_active'),
+    }
+    if not _text(row, 'variant_sku'):
+        return product, None
+    variant_type = _text(row, 'variant_type', required=True).upper()
+    if variant_type not in VARIANT_TYPES:
+        raise CatalogImportError(f'variant_type must be one of {", ".join(VARIANT_TYPES)}')
+    try:
+        stock = int(_text(row, 'stock_quantity') or 0)
+    except ValueError:
+        raise CatalogImportError('stock_quantity must be an integer')
+    if stock < 0:
+        raise CatalogImportError('stock_quantity must not be negative')
+    variant = {
+        'sku': _text(row, 'variant_sku'),
+        'product_sku': product['sku'],
+        'variant_name': _text(row, 'variant_name', required=True),
+        'variant_type': variant_type,
+        'additional_price': _amount(row, 'additional_price'),
+        'stock_quantity': stock,
+    }
+    return product, variant
+
+
+class CatalogImporter:
+    """Applies a feed batch by batch; ``stats`` and ``errors`` report the outcome"""
+
+    def __init__(self, batch_size=1000, max_errors=100):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.stats = Counter()
+        self.errors = []
+        self.categories = {}
+
+    def reject(self, number, message):
+        self.stats['rows_rejected'] += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((number, message))
+
+    def run(self, rows):
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            products, variants, lines = {}, {}, {}
+            accepted = 0
+            for number, row in batch:
+                try:
+                    if isinstance(row, Exception):
+                        raise CatalogImportError(f'Unreadable row: {row}')
+                    product, variant = parse_row(row)
+                except CatalogImportError as exc:
+                    self.reject(number, str(exc))
+                    continue
+                accepted += 1
+                # Later rows win when a feed repeats a SKU.
+                products[product['sku']] = product
+                if variant is not None:
+                    variants[variant['sku']] = variant
+                    lines[variant['sku']] = number
+            # A rolled-back batch also takes back any categories it created.
+            stats, categories = self.stats.copy(), self.categories.copy()
+            try:
+                with transaction.atomic():
+                    self.apply(products, variants, lines)
+            except IntegrityError as exc:
+                self.stats, self.categories = stats, categories
+                self.stats['rows_rejected'] += accepted
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((batch[0][0], f'lines {batch[0][0]}-{batch[-1][0]} not imported: {exc}'))
+        return self.stats
+
+    def apply(self, products, variants, lines):
+        self.stats['batches'] += 1
+        written = self.stats['products_written'] + self.stats['variants_written']
+        self.ensure_categories({product['category'] for product in products.values()})
+        product_ids, created = self.apply_products(products)
+        changed_products, changed_variants = self.apply_variants(variants, product_ids, lines)
+        if changed_products:
+            reconcile_stock(changed_products)
+            if changed_variants:
+                reconcile_inventory(changed_variants)
+            # Nobody can be watching a product created by this batch.
+            publish_stock(changed_products - created, changed_variants)
+        if self.stats['products_written'] + self.stats['variants_written'] > written:
+            transaction.on_commit(bump_catalog_version, robust=True)
+
+    def ensure_categories(self, names):
+        missing = names - self.categories.keys()
+        if not missing:
+            return
+        ProductCategory.objects.bulk_create(
+            [ProductCategory(name=name) for name in missing], ignore_conflicts=True,
+        )
+        self.categories.update(ProductCategory.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+    def apply_products(self, products):
+        """Write new and changed products; returns ``{sku: pk}`` for the batch and the created pks"""
+        stored = {
+            row[0]: row[1:]
+            for row in Product.objects.filter(sku__in=products).values_list('sku', 'pk', *PRODUCT_FIELDS)
+        }
+        product_ids = {sku: values[0] for sku, values in stored.items()}
+        pending = []
+        for sku, product in products.items():
+            category_id = self.categories[product.pop('category')]
+            values = {**product, 'category_id': category_id}
+            if sku in stored and stored[sku][1:] == tuple(values[field] for field in PRODUCT_FIELDS):
+                self.stats['products_unchanged'] += 1
+                continue
+            self.stats['products_updated' if sku in stored else 'products_created'] += 1
+            pending.append(Product(**values))
+        if pending:
+            Product.objects.bulk_create(
+                pending, update_conflicts=True, unique_fields=['sku'],
+                update_fields=[*PRODUCT_FIELDS, 'updated_at'],
+            )
+            self.stats['products_written'] += len(pending)
+            product_ids.update((product.sku, product.pk) for product in pending)
+        return product_ids, {pk for sku, pk in product_ids.items() if sku not in stored}
+
+    def apply_variants(self, variants, product_ids, lines):
+        """Write new and changed variants; returns the product and variant ids whose stock changed"""
+        stored = {
+            row[0]: row[1:]
+            for row in ProductVariant.objects.filter(sku__in=variants).values_list('sku', 'pk', *VARIANT_FIELDS)
+        }
+        # (product, name, type) -> SKU holding it. A key is never released
+        # within a batch, as the upsert may write its new holder first.
+        holders = {
+            (product_id, name, variant_type): sku
+            for product_id, name, variant_type, sku in ProductVariant.objects.filter(
+                product_id__in={product_ids[variant['product_sku']] for variant in variants.values()}
+            ).values_list('product_id', 'variant_name', 'variant_type', 'sku')
+        }
+        pending = []
+        changed_products, changed_variants = set(), set()
+        for sku, variant in variants.items():
+            product_id = product_ids[variant.pop('product_sku')]
+            values = {**variant, 'product_id': product_id}
+            key = (product_id, values['variant_name'], values['variant_type'])
+            holder = holders.setdefault(key, sku)
+            if holder != sku:
+                self.reject(lines[sku], (
+                    f'variant {values["variant_name"]} ({values["variant_type"]}) of this product '
+                    f'already has SKU {holder}'
+                ))
+                continue
+            old = stored.get(sku)
+            if old is not None and old[1:] == tuple(values[field] for field in VARIANT_FIELDS):
+                self.stats['variants_unchanged'] += 1
+                continue
+            self.stats['variants_updated' if old else 'variants_created'] += 1
+            pending.append(ProductVariant(**values))
+            if old is None:
+                changed_products.add(product_id)
+            elif (old[1], old[5]) != (product_id, values['stock_quantity']):
+                # Stored as (pk, product_id, ..., stock_quantity)
+                changed_products.update((old[1], product_id))
+                changed_variants.add(old[0])
+        if pending:
+            ProductVariant.objects.bulk_create(
+                pending, update_conflicts=True, unique_fields=['sku'],
+                update_fields=[*VARIANT_FIELDS, 'updated_at'],
+            )
+            self.stats['variants_written'] += len(pending)
+        return changed_products, changed_variants
+
+
+def import_catalog(rows, batch_size=1000):
+    """Import ``(line_number, row)`` pairs; returns the ``CatalogImporter``"""
+    importer = CatalogImporter(batch_size=batch_size)
+    importer.run(rows)
+    return importer
@@ -0,0 +1,271 @@
+"""
+A channel layer shared by worker processes on one host, backed by SQLite.
+
+``InMemoryChannelLayer`` only delivers within one process, so with several
+Daphne workers a ``group_send`` from one worker never reaches sockets held by
+another. ``SQLiteChannelLayer`` keeps messages and group memberships in a
+SQLite file (WAL mode) that every worker opens:
+
+* ``send`` / ``group_send`` insert rows; a channel at capacity raises
+  ``ChannelFull`` on ``send`` and is skipped by ``group_send``, as in the
+  other layers;
+* each event loop runs one poller that takes the messages of every channel
+  it is waiting on with a single ``DELETE ... RETURNING``, backing off from
+  ``poll_interval`` to ``max_poll_interval`` while idle, and buffers them
+  in memory until ``receive`` asks;
+* messages expire after ``expiry`` seconds and memberships after
+  ``group_expiry``; a channel whose messages expire unread is dropped from its
+  groups.
+
+``occupied_groups`` tells publishers which groups have members, so they can
+skip building events nobody would receive (see ``spt.events``).
+
+SQLite calls run on one dedicated thread per layer so they never block the
+event loop. Enable it with::
+
+    CHANNEL_LAYERS = {'default': {
+        'BACKEND': 'spt.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {'path': '/var/run/spt/channels.sqlite3'},
+    }}
+"""
+import asyncio
+import base64
+import json
+import random
+import sqlite3
+import string
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    body TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id);
+CREATE TABLE IF NOT EXISTS groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+CREATE INDEX IF NOT EXISTS groups_channel ON groups (channel);
+"""
+
+# SQLite's default limit on host parameters is 999 on old builds.
+MAX_PARAMS = 500
+
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    raise TypeError(f'Cannot send {type(value).__name__} over the channel layer')
+
+
+def _decode_value(value):
+    if len(value) == 1 and '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def encode_message(message):
+    return json.dumps(message, default=_encode_value, separators=(',', ':'))
+
+
+def decode_message(body):
+    return json.loads(body, object_hook=_decode_value)
+
+
+class _Receiver:
+    """Per event loop state: local message queues and the channels awaited"""
+
+    def __init__(self):
+        self.queues = {}
+        self.waiting = Counter()
+        self.poller = None
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.005, max_poll_interval=0.05, cleanup_interval=5, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.cleanup_interval = cleanup_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._connection = None
+        self._last_cleanup = 0
+        self._receivers = weakref.WeakKeyDictionary()
+
+    # Database access; only ever called on the layer's own thread.
+
+    def _db(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _write(self, operation, *args):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            if now - self._last_cleanup > self.cleanup_interval:
+                self._clean_expired(db, now)
+                self._last_cleanup = now
+            result = operation(db, now, *args)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return result
+
+    async def _run(self, operation, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._write, operation, *args))
+
+    def _clean_expired(self, db, now):
+        db.execute('DELETE FROM groups WHERE channel IN (SELECT channel FROM messages WHERE expires <= ?)', (now,))
+        db.execute('DELETE FROM messages WHERE expires <= ?', (now,))
+        db.execute('DELETE FROM groups WHERE expires <= ?', (now,))
+
+    def _insert(self, db, now, channel, body):
+        (queued,) = db.execute(
+            'SELECT COUNT(*) FROM messages WHERE channel = ? AND expires > ?', (channel, now),
+        ).fetchone()
+        if queued >= self.get_capacity(channel):
+            raise ChannelFull(channel)
+        db.execute('INSERT INTO messages (channel, body, expires) VALUES (?, ?, ?)', (channel, body, now + self.expiry))
+
+    def _insert_group(self, db, now, group, body):
+        members = db.execute(
+            'SELECT g.channel, COUNT(m.id) FROM groups g '
+            'LEFT JOIN messages m ON m.channel = g.channel AND m.expires > ? '
+            'WHERE g.group_name = ? AND g.expires > ? GROUP BY g.channel',
+            (now, group, now),
+        ).fetchall()
+        rows = [
+            (channel, body, now + self.expiry)
+            for channel, queued in members
+            if queued < self.get_capacity(channel)
+        ]
+        db.executemany('INSERT INTO messages (channel, body, expires) VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def _take(self, db, now, channels):
+        rows = []
+        for start in range(0, len(channels), MAX_PARAMS):
+            chunk = channels[start:start + MAX_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+            rows.extend(db.execute(
+                f'DELETE FROM messages WHERE channel IN ({placeholders}) RETURNING id, channel, body, expires', chunk,
+            ).fetchall())
+        rows.sort()
+        return [(channel, expires, decode_message(body)) for _, channel, body, expires in rows if expires > now]
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        await self._run(self._insert, channel, encode_message(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        receiver = self._receivers.setdefault(asyncio.get_running_loop(), _Receiver())
+        queue = receiver.queues.setdefault(channel, asyncio.Queue())
+        while not queue.empty():
+            expires, message = queue.get_nowait()
+            if expires > time.time():
+                return message
+
+        receiver.waiting[channel] += 1
+        if receiver.poller is None or receiver.poller.done():
+            receiver.poller = asyncio.ensure_future(self._poll(receiver))
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires > time.time():
+                    return message
+        finally:
+            receiver.waiting[channel] -= 1
+            if not receiver.waiting[channel]:
+                del receiver.waiting[channel]
+                if queue.empty():
+                    receiver.queues.pop(channel, None)
+
+    async def _poll(self, receiver):
+        delay = self.poll_interval
+        while receiver.waiting:
+            messages = await self._run(self._take, list(receiver.waiting))
+            for channel, expires, message in messages:
+                receiver.queues.setdefault(channel, asyncio.Queue()).put_nowait((expires, message))
+            delay = self.poll_interval if messages else min(delay * 2, self.max_poll_interval)
+            await asyncio.sleep(delay)
+
+    async def new_channel(self, prefix='specific.'):
+        return '%s.sqlite!%s' % (prefix, ''.join(random.choice(string.ascii_letters) for _ in range(12)))
+
+    async def flush(self):
+        def flush(db, now):
+            db.execute('DELETE FROM messages')
+            db.execute('DELETE FROM groups')
+        await self._run(flush)
+
+    async def close(self):
+        pass
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+
+        def add(db, now):
+            db.execute(
+                'INSERT OR REPLACE INTO groups (group_name, channel, expires) VALUES (?, ?, ?)',
+                (group, channel, now + self.group_expiry),
+            )
+        await self._run(add)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+
+        def discard(db, now):
+            db.execute('DELETE FROM groups WHERE group_name = ? AND channel = ?', (group, channel))
+        await self._run(discard)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        await self._run(self._insert_group, group, encode_message(message))
+
+    async def occupied_groups(self, groups):
+        """The names in ``groups`` that have at least one live member"""
+        def occupied(db, now, groups):
+            found = set()
+            for start in range(0, len(groups), MAX_PARAMS - 1):
+                chunk = groups[start:start + MAX_PARAMS - 1]
+                placeholders = ', '.join('?' * len(chunk))
+                found.update(name for (name,) in db.execute(
+                    f'SELECT DISTINCT group_name FROM groups WHERE group_name IN ({placeholders}) AND expires > ?',
+                    (*chunk, now),
+                ))
+            return found
+        return await self._run(occupied, list(groups))
@@ -0,0 +1,211 @@
+"""
+Checkout: turn a cart into an order.
+
+Everything runs in one transaction. The cart lines are read (and locked on
+backends that support ``SELECT ... FOR UPDATE``) in a single query and all
+stock problems are collected before anything is written. Lines fully covered
+by a live reservation of the cart (``spt.reservations``) skip validation and
+consume their hold. Stock is then taken with one conditional ``UPDATE ... SET
+stock_quantity = stock_quantity - n WHERE stock_quantity >= n`` over all the
+variants (``n`` picked per row by a ``CASE``), and the same guard on
+``Inventory.available_stock`` for unreserved lines, so two buyers racing for
+the last units can never drive a variant negative: the loser's update
+matches fewer rows than it has lines and the whole checkout rolls back.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Inventory, Order, OrderItem, ProductVariant, StockReservation
+from .order_numbers import get_order_number_generator
+from .reservations import release_quantities
+from .rollups import record_order_items
+from .stock import apply_stock_changes, delta_case, take_stock
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    def __init__(self):
+        super().__init__('Cart is empty')
+
+
+class InsufficientStock(CheckoutError):
+    """Raised with every cart line that cannot be fulfilled"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        super().__init__('; '.join(self.describe(line) for line in lines))
+
+    @staticmethod
+    def describe(line):
+        if line['variant']:
+            return f"Not enough stock for {line['product']} ({line['variant']}). Available: {line['available']}"
+        return f"Not enough stock for {line['product']}. Available: {line['available']}"
+
+
+def shortage_line(item, available):
+    return {
+        'item_id': item.pk,
+        'product_id': item.product_id,
+        'product': item.product.name,
+        'variant_id': item.variant_id,
+        'variant': item.variant.variant_name if item.variant else None,
+        'requested': item.quantity,
+        'available': available,
+    }
+
+
+def generate_order_number():
+    return get_order_number_generator()()
+
+
+def release_order_number(number):
+    """Give back a number no order was saved with, if the generator reuses them"""
+    release = getattr(get_order_number_generator(), 'release', None)
+    if release is not None:
+        release(number)
+
+
+def place_order(user, cart, shipping):
+    """Create an order from ``cart`` and empty it.
+
+    ``shipping`` holds ``address``, ``city``, ``state`` and ``pincode``.
+    Raises ``EmptyCart`` or ``InsufficientStock``; in both cases nothing is
+    written.
+
+    Call it outside any transaction (``ATOMIC_REQUESTS`` is off for the order
+    view). Inside one, the row locks and the stock events published on commit
+    both wait for the caller's transaction to end, and an outer rollback
+    skips the order number.
+    """
+    # Allocated before the transaction (see spt.order_numbers) and given
+    # back if the checkout rolls back. A commit hook failing after the order
+    # was saved must not free its number for reuse.
+    order_number = generate_order_number()
+    committed = False
+
+    def mark_committed():
+        nonlocal committed
+        committed = True
+
+    try:
+        return _place_order(user, cart, shipping, order_number, mark_committed)
+    except Exception:
+        if not committed:
+            release_order_number(order_number)
+        raise
+
+
+def _place_order(user, cart, shipping, order_number, on_commit):
+    with transaction.atomic():
+        # Registered first, so it runs before any other commit hook.
+        transaction.on_commit(on_commit)
+        items = list(
+            cart.items.select_related('product', 'variant', 'variant__inventory')
+            .select_for_update(of=('self',))
+            .order_by('pk')
+        )
+        if not items:
+            raise EmptyCart()
+
+        requested = defaultdict(int)
+        for item in items:
+            if item.variant_id:
+                requested[item.variant_id] += item.quantity
+
+        # A live reservation covering a variant's whole quantity is consumed;
+        # every other reservation of the cart is given back.
+        now = timezone.now()
+        reservations = list(cart.reservations.values_list('pk', 'variant_id', 'quantity', 'expires_at'))
+        held = {
+            variant_id for _, variant_id, quantity, expires_at in reservations
+            if expires_at > now and 0 < requested.get(variant_id, 0) <= quantity
+        }
+
+        # Validate every other line up front so the buyer sees all problems at once.
+        shortages = []
+        for item in items:
+            if item.variant_id in held:
+                continue
+            if item.variant:
+                available = item.variant.stock_quantity
+                inventory = getattr(item.variant, 'inventory', None)
+                if inventory is not None:
+                    available = min(available, inventory.available_stock)
+            else:
+                available = item.product.total_stock
+            if available < item.quantity:
+                shortages.append(shortage_line(item, available))
+        if shortages:
+            raise InsufficientStock(shortages)
+
+        if reservations:
+            release_quantities(
+                {variant_id: quantity for _, variant_id, quantity, _ in reservations},
+                consumed={variant_id: requested[variant_id] for variant_id in held},
+            )
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _, _ in reservations]).delete()
+
+        # Take stock, one UPDATE for the variants and one for the Inventory
+        # rows of unreserved lines. Fewer rows than lines means another buyer
+        # got there first.
+        unreserved = {
+            item.variant_id: requested[item.variant_id] for item in items
+            if item.variant_id not in held and getattr(item.variant, 'inventory', None) is not None
+        }
+        if requested:
+            quantities = delta_case('pk', requested)
+            short = take_stock(
+                ProductVariant.objects.filter(pk__in=requested, stock_quantity__gte=quantities),
+                requested, 'pk', 'stock_quantity',
+                stock_quantity=F('stock_quantity') - quantities, updated_at=now,
+            )
+            if not short and unreserved:
+                quantities = delta_case('variant_id', unreserved)
+                short = take_stock(
+                    Inventory.objects.filter(variant_id__in=unreserved, available_stock__gte=quantities),
+                    unreserved, 'variant_id', 'available_stock',
+                    total_stock=F('total_stock') - quantities,
+                    available_stock=F('available_stock') - quantities,
+                    updated_at=now,
+                )
+            if short:
+                raise InsufficientStock([
+                    shortage_line(item, short[item.variant_id]) for item in items if item.variant_id in short
+                ])
+
+        apply_stock_changes(
+            ((item.variant_id, item.product_id, -item.quantity) for item in items if item.variant_id),
+            inventory=False,
+        )
+
+        order = Order.objects.create(
+            user=user,
+            order_number=order_number,
+            total_amount=cart.get_total(),
+            shipping_address=shipping.get('address'),
+            shipping_city=shipping.get('city'),
+            shipping_state=shipping.get('state'),
+            shipping_pincode=shipping.get('pincode'),
+        )
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                variant=item.variant,
+                quantity=item.quantity,
+                price_at_purchase=item.product.base_price,
+                variant_price_at_purchase=item.variant.additional_price if item.variant else Decimal('0.00'),
+            )
+            for item in items
+        ])
+        record_order_items(order, order_items)
+
+        cart.items.all().delete()
+    return order
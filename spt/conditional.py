@@ -0,0 +1,128 @@
+"""
+Conditional GET support (ETag / Last-Modified) for API viewsets.
+
+Validators come from a single aggregate query over the queryset a response
+would be built from: the latest ``updated_at`` of the rows (and of any related
+rows the serializer renders) plus row counts, so deletions change the ETag
+too. A matching ``If-None-Match`` or ``If-Modified-Since`` is answered with
+``304 Not Modified`` before anything is serialized.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def _validator_aggregates(timestamps, counts):
+    aggregates = {}
+    for i, field in enumerate(timestamps):
+        aggregates[f'max_{i}'] = Max(field)
+    for i, field in enumerate(counts):
+        aggregates[f'count_{i}'] = Count(field, distinct=True)
+    return aggregates
+
+
+def _validators_from_values(request, values, timestamps):
+    modified = [values[f'max_{i}'] for i in range(len(timestamps)) if values[f'max_{i}'] is not None]
+    last_modified = max(modified) if modified else None
+
+    fingerprint = '|'.join([
+        request.get_full_path(),
+        getattr(request, 'accepted_media_type', '') or '',
+        *(str(values[key]) for key in sorted(values)),
+    ])
+    etag = quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+    return etag, last_modified
+
+
+def compute_validators(request, queryset, timestamps=('updated_at',), counts=('pk',)):
+    """Return ``(etag, last_modified)`` for the rows of ``queryset``"""
+    values = queryset.order_by().aggregate(**_validator_aggregates(timestamps, counts))
+    return _validators_from_values(request, values, timestamps)
+
+
+async def acompute_validators(request, queryset, timestamps=('updated_at',), counts=('pk',)):
+    values = await queryset.order_by().aaggregate(**_validator_aggregates(timestamps, counts))
+    return _validators_from_values(request, values, timestamps)
+
+
+def _not_modified(request, validators):
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def _set_validators(response, validators):
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    return response
+
+
+def conditional_response(request, validators, handler, *args, **kwargs):
+    """Answer from ``validators`` when possible, otherwise call ``handler``"""
+    if request.method not in ('GET', 'HEAD'):
+        return handler(request, *args, **kwargs)
+
+    response = _not_modified(request, validators)
+    if response is None:
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    return _set_validators(response, validators)
+
+
+async def aconditional_response(request, validators, handler, *args, **kwargs):
+    """``conditional_response`` for a coroutine ``handler``"""
+    if request.method not in ('GET', 'HEAD'):
+        return await handler(request, *args, **kwargs)
+
+    response = _not_modified(request, validators)
+    if response is None:
+        response = await handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    return _set_validators(response, validators)
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified handling for ``list`` and ``retrieve``.
+
+    ``validator_timestamps`` lists the ``updated_at`` lookups whose maximum
+    dates the response, ``validator_counts`` the lookups counted to catch
+    deletions. When the view also caches responses (``get_cached``), the
+    validators are cached alongside them.
+    """
+    validator_timestamps = ('updated_at',)
+    validator_counts = ('pk',)
+
+    def get_validators(self, request, queryset):
+        def compute():
+            return compute_validators(
+                request, queryset, self.validator_timestamps, self.validator_counts
+            )
+
+        get_cached = getattr(self, 'get_cached', None)
+        if get_cached is not None:
+            return get_cached(request, 'validators', compute)
+        return compute()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = self.get_validators(request, queryset)
+        return conditional_response(request, validators, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            # Let the regular lookup turn a malformed key into a 404.
+            return super().retrieve(request, *args, **kwargs)
+        validators = self.get_validators(request, queryset)
+        return conditional_response(request, validators, super().retrieve, *args, **kwargs)
@@ -0,0 +1,65 @@
+"""
+WebSocket consumers for live order tracking and stock levels.
+
+``ws/orders/<id>/`` is open to the order's owner (and staff);
+``ws/stock/<product_id>/`` to anyone. Each socket receives the current state
+as soon as it connects, then every event published by ``spt.events``.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .events import order_group, order_payload, stock_group, stock_payloads
+from .models import Order
+
+# Close codes in the 4000-4999 range are free for applications.
+UNAUTHORIZED = 4401
+NOT_FOUND = 4404
+
+
+class EventConsumer(AsyncJsonWebsocketConsumer):
+    """Joins one group and forwards its events to the client"""
+    group_name = None
+
+    async def join(self, group_name, initial):
+        self.group_name = group_name
+        await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.accept()
+        await self.send_json(initial)
+
+    async def disconnect(self, code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def send_event(self, event):
+        await self.send_json(event['payload'])
+
+    @classmethod
+    async def encode_json(cls, content):
+        return json.dumps(content, cls=DjangoJSONEncoder)
+
+
+class OrderConsumer(EventConsumer):
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=UNAUTHORIZED)
+            return
+        orders = Order.objects.all() if user.is_staff else Order.objects.filter(user=user)
+        order = await orders.filter(pk=self.scope['url_route']['kwargs']['order_id']).afirst()
+        if order is None:
+            await self.close(code=NOT_FOUND)
+            return
+        await self.join(order_group(order.pk), order_payload(order))
+
+
+class StockConsumer(EventConsumer):
+    async def connect(self):
+        product_id = self.scope['url_route']['kwargs']['product_id']
+        payloads = await sync_to_async(stock_payloads)([product_id])
+        if product_id not in payloads:
+            await self.close(code=NOT_FOUND)
+            return
+        await self.join(stock_group(product_id), payloads[product_id])
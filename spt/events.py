@@ -0,0 +1,95 @@
+"""
+Live updates pushed to WebSocket clients through the channel layer.
+
+Order trackers join ``order_<id>`` and receive an ``order`` event whenever the
+order's status or tracking number changes; product pages join
+``stock_<product_id>`` and receive a ``stock`` event whenever stock of one of
+its variants changes. Events are sent after the transaction commits, so
+clients never see a change that is later rolled back. Nothing is sent, and
+stock figures are not even read, when no channel layer is configured or no
+socket has joined the product's group. See ``spt.consumers`` for the sockets.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.db import transaction
+
+from .models import Product, ProductVariant
+
+
+def order_group(order_id):
+    return f'order_{order_id}'
+
+
+def stock_group(product_id):
+    return f'stock_{product_id}'
+
+
+def order_payload(order):
+    return {
+        'type': 'order',
+        'order_id': order.pk,
+        'order_number': order.order_number,
+        'status': order.status,
+        'tracking_number': order.tracking_number,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+    }
+
+
+def stock_payloads(product_ids, variant_ids=None):
+    """``{product_id: payload}`` with the current stock of each product.
+
+    Only the variants in ``variant_ids`` are listed; all of them when None.
+    """
+    payloads = {
+        pk: {'type': 'stock', 'product_id': pk, 'total_stock': total, 'in_stock': in_stock, 'variants': []}
+        for pk, total, in_stock in Product.objects.filter(pk__in=product_ids)
+        .values_list('pk', 'total_stock', 'in_stock')
+    }
+    variants = ProductVariant.objects.filter(product_id__in=payloads)
+    if variant_ids is not None:
+        variants = variants.filter(pk__in=variant_ids)
+    for pk, product_id, stock in variants.order_by('pk').values_list('pk', 'product_id', 'stock_quantity'):
+        payloads[product_id]['variants'].append({'variant_id': pk, 'stock_quantity': stock})
+    return payloads
+
+
+def subscribed_groups(channel_layer, groups):
+    """The ``groups`` that have members; all of them when the layer cannot tell"""
+    if isinstance(channel_layer, InMemoryChannelLayer):
+        return {group for group in groups if channel_layer.groups.get(group)}
+    occupied_groups = getattr(channel_layer, 'occupied_groups', None)  # spt.channel_layers
+    if occupied_groups is not None:
+        return async_to_sync(occupied_groups)(groups)
+    return set(groups)
+
+
+def send_event(group, payload):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    # The consumer handler is picked by the message type: spt.consumers.*.send_event
+    async_to_sync(channel_layer.group_send)(group, {'type': 'send.event', 'payload': payload})
+
+
+def publish_order(order):
+    """Send the order's status to its trackers once the transaction commits"""
+    payload = order_payload(order)
+    transaction.on_commit(lambda: send_event(order_group(order.pk), payload), robust=True)
+
+
+def publish_stock(product_ids, variant_ids):
+    """Send fresh stock figures for ``product_ids`` once the transaction commits"""
+    product_ids, variant_ids = set(product_ids), set(variant_ids)
+
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        groups = subscribed_groups(channel_layer, {stock_group(pk) for pk in product_ids})
+        subscribed = [pk for pk in product_ids if stock_group(pk) in groups]
+        if not subscribed:
+            return
+        for product_id, payload in stock_payloads(subscribed, variant_ids).items():
+            send_event(stock_group(product_id), payload)
+
+    transaction.on_commit(send, robust=True)
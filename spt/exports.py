@@ -0,0 +1,178 @@
+"""
+Streaming CSV / NDJSON exports of orders and order lines.
+
+Rows are read with ``values_list().iterator(chunk_size=...)`` and encoded a
+chunk at a time, so an export holds one chunk in memory whatever its size.
+The same generators back the staff download views and
+``manage.py export_orders``.
+
+Under ASGI a ``StreamingHttpResponse`` built on a plain iterator is read
+into a list before anything is sent, so ``streaming_response`` hands ASGI
+requests an async iterator that pulls each chunk on the ORM thread instead.
+"""
+import csv
+import io
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderItem
+
+# Column name -> values_list() field, per export
+EXPORTS = {
+    'orders': (Order, {
+        'order_id': 'id',
+        'order_number': 'order_number',
+        'created_at': 'created_at',
+        'status': 'status',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'total_amount': 'total_amount',
+        'shipping_city': 'shipping_city',
+        'shipping_state': 'shipping_state',
+        'shipping_pincode': 'shipping_pincode',
+        'tracking_number': 'tracking_number',
+    }),
+    'items': (OrderItem, {
+        'item_id': 'id',
+        'order_id': 'order_id',
+        'order_number': 'order__order_number',
+        'created_at': 'order__created_at',
+        'status': 'order__status',
+        'product_id': 'product_id',
+        'product_name': 'product__name',
+        'variant_id': 'variant_id',
+        'variant_sku': 'variant__sku',
+        'quantity': 'quantity',
+        'price_at_purchase': 'price_at_purchase',
+        'variant_price_at_purchase': 'variant_price_at_purchase',
+    }),
+}
+
+# Computed per row rather than in SQL: SQLite returns decimal arithmetic
+# unquantized ("12" rather than "12.00").
+COMPUTED_COLUMNS = {
+    'items': ('line_total', lambda quantity, price, variant_price: (price + variant_price) * quantity),
+}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def get_export_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_queryset(kind, start=None, end=None, status=None):
+    """``values_list`` queryset for an export, filtered by order date and status.
+
+    ``start`` and ``end`` are inclusive dates (or ISO strings); ``status``
+    must be one of ``Order.STATUS_CHOICES``.
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f'Unknown export {kind!r}')
+    model, columns = EXPORTS[kind]
+    prefix = '' if model is Order else 'order__'
+    filters = {}
+    # A half-open range of aware datetimes, [start 00:00, end + 1 day 00:00)
+    # in the current time zone, so the created_at index can be used; a
+    # __date lookup wraps the column in a function and scans every row.
+    for name, value, lookup, days in (('start', start, 'gte', 0), ('end', end, 'lt', 1)):
+        if value in (None, ''):
+            continue
+        try:
+            parsed = parse_date(value) if isinstance(value, str) else value
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ExportError(f'{name} must be a date (YYYY-MM-DD)')
+        midnight = datetime.combine(parsed + timedelta(days=days), time.min)
+        filters[f'{prefix}created_at__{lookup}'] = timezone.make_aware(midnight)
+    if status:
+        if status not in dict(Order.STATUS_CHOICES):
+            raise ExportError(f'Unknown status {status!r}')
+        filters[f'{prefix}status'] = status
+
+    # Primary key order walks the table's own index.
+    return model.objects.filter(**filters).order_by('id').values_list(*columns.values())
+
+
+def export_columns(kind):
+    columns = list(EXPORTS[kind][1])
+    if kind in COMPUTED_COLUMNS:
+        columns.append(COMPUTED_COLUMNS[kind][0])
+    return columns
+
+
+def export_rows(kind, queryset, chunk_size):
+    """Iterate ``queryset`` a chunk at a time, adding any computed column"""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if kind not in COMPUTED_COLUMNS:
+        return rows
+    compute = COMPUTED_COLUMNS[kind][1]
+    return (row + (compute(*row[-3:]),) for row in rows)
+
+
+def _csv_chunks(kind, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(kind))
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        if len(chunk) < chunk_size:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _ndjson_chunks(kind, rows, chunk_size):
+    columns = export_columns(kind)
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    while chunk := list(islice(rows, chunk_size)):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+def export_chunks(kind, output_format, start=None, end=None, status=None, chunk_size=None):
+    """Yield an export as text chunks of ``chunk_size`` rows"""
+    if output_format not in FORMATS:
+        raise ExportError(f'Unknown format {output_format!r}')
+    chunk_size = chunk_size or get_export_chunk_size()
+    rows = export_rows(kind, export_queryset(kind, start, end, status), chunk_size)
+    encode = _csv_chunks if output_format == 'csv' else _ndjson_chunks
+    return encode(kind, rows, chunk_size)
+
+
+async def _aiter_chunks(chunks):
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def streaming_response(request, kind, output_format, **filters):
+    """``StreamingHttpResponse`` downloading an export"""
+    chunks = export_chunks(kind, output_format, **filters)
+    content_type, extension = FORMATS[output_format]
+    response = StreamingHttpResponse(
+        _aiter_chunks(chunks) if isinstance(request, ASGIRequest) else chunks,
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+    return response
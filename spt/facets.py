@@ -0,0 +1,86 @@
+"""
+Facet counts for the product catalog.
+
+All facets come back from one statement: each facet is a grouped
+``values().annotate()`` query over the same product set and the four branches
+are combined with ``UNION ALL``. That saves three round trips, but the
+database still evaluates the product set once per branch; SQLite has no
+``GROUPING SETS`` to fold them into a single grouped pass.
+"""
+from django.conf import settings
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import Cast
+
+from .models import Product
+
+DEFAULT_PRICE_BUCKETS = [100, 500, 1000, 5000]
+
+
+def get_price_buckets():
+    """``(label, low, high)`` for each price bucket; ``high`` is None for the last"""
+    bounds = list(getattr(settings, 'PRODUCT_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+    lows = [0] + bounds
+    highs = bounds + [None]
+    return [
+        (f'{low}-{high}' if high is not None else f'{low}+', low, high)
+        for low, high in zip(lows, highs)
+    ]
+
+
+def _price_bucket_expression(buckets):
+    whens = [
+        When(base_price__lt=high, then=Value(label))
+        for label, low, high in buckets
+        if high is not None
+    ]
+    return Case(*whens, default=Value(buckets[-1][0]), output_field=CharField())
+
+
+def compute_facets(queryset):
+    """Facet counts for the products in ``queryset``.
+
+    Counts are numbers of distinct products, so a product with several
+    variants of one type is counted once for that type.
+    """
+    products = Product.objects.filter(pk__in=queryset.order_by().values('pk')).order_by()
+    buckets = get_price_buckets()
+
+    def facet(name, key, label, **filters):
+        return products.filter(**filters).values(
+            facet=Value(name, output_field=CharField()),
+            key=key,
+            label=label,
+        ).annotate(count=Count('pk', distinct=True))
+
+    price = _price_bucket_expression(buckets)
+    rows = facet(
+        'category', Cast('category_id', CharField()), F('category__name'),
+    ).union(
+        facet('variant_type', F('variants__variant_type'), F('variants__variant_type'), variants__isnull=False),
+        facet('variant', F('variants__variant_type'), F('variants__variant_name'), variants__isnull=False),
+        facet('price', price, price),
+        all=True,
+    )
+
+    result = {'category': [], 'variant_type': [], 'variant': [], 'price': []}
+    price_counts = {}
+    for row in rows:
+        if row['facet'] == 'category':
+            result['category'].append({'id': int(row['key']), 'name': row['label'], 'count': row['count']})
+        elif row['facet'] == 'variant_type':
+            result['variant_type'].append({'value': row['key'], 'count': row['count']})
+        elif row['facet'] == 'variant':
+            result['variant'].append({
+                'variant_type': row['key'], 'variant_name': row['label'], 'count': row['count'],
+            })
+        else:
+            price_counts[row['key']] = row['count']
+
+    result['category'].sort(key=lambda item: (-item['count'], item['name']))
+    result['variant_type'].sort(key=lambda item: (-item['count'], item['value']))
+    result['variant'].sort(key=lambda item: (-item['count'], item['variant_type'], item['variant_name']))
+    result['price'] = [
+        {'bucket': label, 'min': low, 'max': high, 'count': price_counts.get(label, 0)}
+        for label, low, high in buckets
+    ]
+    return result
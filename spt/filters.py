@@ -0,0 +1,48 @@
+"""
+Filter backends for the spt API
+"""
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .search import build_match_expression, search_index_available, SearchMatch, SearchRank
+
+
+class ProductSearchFilter(SearchFilter):
+    """Full-text product search ranked by relevance.
+
+    Uses the FTS5 index from ``spt.search`` when it exists: every search word
+    is matched as a prefix and results are ordered by bm25 relevance (an
+    explicit ``?ordering=`` still wins, since ``OrderingFilter`` runs after
+    this backend). Without the index this is the stock ``SearchFilter``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search_index_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        match = build_match_expression(terms)
+        if not match:
+            return super().filter_queryset(request, queryset, view)
+
+        # One join to the index serves both the MATCH and the rank; the
+        # isnull lookup makes it an INNER JOIN, so SQLite drives the query
+        # from the index instead of probing it once per product.
+        return queryset.filter(SearchMatch(match), search_index__isnull=False).alias(
+            search_rank=SearchRank()
+        ).order_by('search_rank', '-created_at', '-id')
+
+
+class InStockFilter(BaseFilterBackend):
+    """Filter products on the denormalized ``in_stock`` flag with ``?in_stock=true``"""
+    param = 'in_stock'
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.param)
+        if value is None:
+            return queryset
+        value = value.lower()
+        if value in ('1', 'true', 'yes'):
+            return queryset.filter(in_stock=True)
+        if value in ('0', 'false', 'no'):
+            return queryset.filter(in_stock=False)
+        return queryset
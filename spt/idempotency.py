@@ -0,0 +1,188 @@
+"""
+``Idempotency-Key`` support for unsafe API requests.
+
+A client that may retry a request sends the same ``Idempotency-Key`` header
+with every attempt. The first attempt claims the key for the user (one
+``INSERT`` guarded by the ``(user, key)`` unique constraint), runs the view
+and stores the status code and response body. Retries are answered from that
+row with a single lookup and never run the view again.
+
+* A retry that arrives while the first attempt is still running gets 409.
+* Reusing a key for a different request (method, path or body) gets 422.
+* 5xx responses and exceptions release the key so the request can be retried.
+
+Keys are honoured for ``IDEMPOTENCY_KEY_TTL`` seconds. An older row is
+treated as absent and claimed afresh by the next request with that key;
+``manage.py expire_idempotency_keys`` deletes such rows in batches.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def get_idempotency_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL))
+
+
+def request_fingerprint(request):
+    """sha256 of the method, path and parsed body of ``request``"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _rejected_key(key):
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return None
+
+
+def _reclaim_filter(record, fingerprint):
+    """Queryset claiming ``record`` again if it outlived the TTL, else ``None``
+
+    The ``created_at`` match makes the claim a compare-and-swap, so of several
+    requests reusing an expired key only one runs the view.
+    """
+    now = timezone.now()
+    if record.created_at > now - get_idempotency_ttl():
+        return None
+    return IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at), {
+        'request_hash': fingerprint, 'status_code': None, 'response': None, 'created_at': now,
+    }
+
+
+def _replay(record, fingerprint):
+    # ``record`` is None when a concurrent request reclaimed the key and the
+    # sweep deleted it in between; the client retries as for a 409.
+    if record is not None and record.request_hash != fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record is None or record.status_code is None:
+        return Response(
+            {'error': 'A request with this Idempotency-Key is still being processed'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(record.response, status=record.status_code, headers={REPLAY_HEADER: 'true'})
+
+
+def _stored_body(response):
+    # Store the body as the JSON renderer would send it, so replays match.
+    return json.loads(json.dumps(response.data, cls=JSONEncoder))
+
+
+def idempotent(view_method):
+    """Honour the ``Idempotency-Key`` header on a viewset method"""
+    if iscoroutinefunction(view_method):
+        return _async_idempotent(view_method)
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        rejected = _rejected_key(key)
+        if rejected is not None:
+            return rejected
+
+        fingerprint = request_fingerprint(request)
+        record, created = IdempotencyKey.objects.get_or_create(
+            user=request.user, key=key, defaults={'request_hash': fingerprint},
+        )
+        if not created:
+            reclaim = _reclaim_filter(record, fingerprint)
+            if reclaim is None:
+                return _replay(record, fingerprint)
+            rows, values = reclaim
+            if not rows.update(**values):
+                return _replay(IdempotencyKey.objects.filter(pk=record.pk).first(), fingerprint)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=response.status_code, response=_stored_body(response),
+            )
+        return response
+    return wrapper
+
+
+def _async_idempotent(view_method):
+    @wraps(view_method)
+    async def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return await view_method(self, request, *args, **kwargs)
+        rejected = _rejected_key(key)
+        if rejected is not None:
+            return rejected
+
+        fingerprint = request_fingerprint(request)
+        record, created = await IdempotencyKey.objects.aget_or_create(
+            user=request.user, key=key, defaults={'request_hash': fingerprint},
+        )
+        if not created:
+            reclaim = _reclaim_filter(record, fingerprint)
+            if reclaim is None:
+                return _replay(record, fingerprint)
+            rows, values = reclaim
+            if not await rows.aupdate(**values):
+                return _replay(await IdempotencyKey.objects.filter(pk=record.pk).afirst(), fingerprint)
+
+        try:
+            response = await view_method(self, request, *args, **kwargs)
+        except Exception:
+            await record.adelete()
+            raise
+        if response.status_code >= 500:
+            await record.adelete()
+        else:
+            await IdempotencyKey.objects.filter(pk=record.pk).aupdate(
+                status_code=response.status_code, response=_stored_body(response),
+            )
+        return response
+    return wrapper
+
+
+def expire_idempotency_keys(batch_size=1000, now=None):
+    """Delete keys older than the TTL in batches; returns how many were deleted"""
+    cutoff = (now or timezone.now()) - get_idempotency_ttl()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                IdempotencyKey.objects.filter(created_at__lt=cutoff)
+                .order_by('created_at').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                return deleted
+            IdempotencyKey.objects.filter(pk__in=batch).delete()
+        deleted += len(batch)
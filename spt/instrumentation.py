@@ -0,0 +1,207 @@
+"""
+Per-request database instrumentation.
+
+``QueryInstrumentationMiddleware`` wraps every request in
+``connection.execute_wrapper`` and records the number of queries, the time
+spent in them, the slowest one, and query shapes that ran more than once
+(the fingerprint is the SQL with its ``IN (%s, ...)`` lists collapsed, so
+an N+1 shows up as one shape repeated N times). It does not need ``DEBUG``.
+
+Each response gets a ``Server-Timing`` header (``db``, ``db-slowest``,
+``render``, ``total``) and each request one JSON log line on the
+``spt.queries`` logger, at WARNING when it crosses
+``QUERY_INSTRUMENTATION_SLOW_MS`` or ``QUERY_INSTRUMENTATION_MAX_QUERIES``.
+``render`` is only the renderer turning the response data into bytes (JSON,
+or a template); building serializer ``.data`` happens inside the view and
+counts towards ``total``.
+Totals per view name are kept in memory per process (``get_query_stats``,
+served to staff at ``/api/admin-query-stats/``).
+
+Database connections belong to a thread, and under ASGI the ORM runs on the
+request's thread-sensitive worker, so the async path installs the wrapper
+there. Streamed bodies are read after the middleware returns; their queries
+are not counted.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('spt.queries')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+MAX_SQL_LENGTH = 300
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """Query shape: the SQL template with variable-length ``IN`` lists collapsed"""
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable collecting one request's queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, None)
+        self.shapes = Counter()
+        self.render_started = self.render_duration = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+            self.shapes[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """``{shape: count}`` for shapes run more than once, most repeated first"""
+        return {shape: count for shape, count in self.shapes.most_common() if count > 1}
+
+    def start_render(self):
+        self.render_started = time.perf_counter()
+
+    def end_render(self, response):
+        self.render_duration = time.perf_counter() - self.render_started
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match.view_name if match is not None else 'unresolved'
+    return f'{request.method} {name}'
+
+
+def record_stats(view, entry):
+    with _stats_lock:
+        stats = _stats.setdefault(view, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0,
+            'render_ms': 0.0, 'total_ms': 0.0, 'duplicate_queries': 0,
+        })
+        stats['requests'] += 1
+        stats['queries'] += entry['queries']
+        stats['max_queries'] = max(stats['max_queries'], entry['queries'])
+        stats['db_ms'] += entry['db_ms']
+        stats['render_ms'] += entry['render_ms'] or 0
+        stats['total_ms'] += entry['total_ms']
+        stats['duplicate_queries'] += sum(count - 1 for count in entry['duplicates'].values())
+
+
+def get_query_stats():
+    """Per-view totals and averages since the process started (or the last reset)"""
+    with _stats_lock:
+        snapshot = {view: dict(stats) for view, stats in _stats.items()}
+    for stats in snapshot.values():
+        requests = stats['requests']
+        for field in ('queries', 'db_ms', 'render_ms', 'total_ms'):
+            stats[f'avg_{field}'] = round(stats[field] / requests, 2)
+        for field in ('db_ms', 'render_ms', 'total_ms'):
+            stats[field] = round(stats[field], 2)
+    return snapshot
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def server_timing(entry):
+    timings = [f'db;dur={entry["db_ms"]};desc="{entry["queries"]} queries"']
+    if entry['slowest_ms']:
+        timings.append(f'db-slowest;dur={entry["slowest_ms"]}')
+    if entry['render_ms'] is not None:
+        timings.append(f'render;dur={entry["render_ms"]}')
+    timings.append(f'total;dur={entry["total_ms"]}')
+    return ', '.join(timings)
+
+
+class QueryInstrumentationMiddleware:
+    """Query count, DB time and render time per request (sync and async)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'QUERY_INSTRUMENTATION_SLOW_MS', 500)
+        self.max_queries = getattr(settings, 'QUERY_INSTRUMENTATION_MAX_QUERIES', 50)
+        self.header = getattr(settings, 'QUERY_INSTRUMENTATION_HEADER', True)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        request._query_recorder = recorder
+        wrappers = self.install(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrappers.close()
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder, started = QueryRecorder(), time.perf_counter()
+        request._query_recorder = recorder
+        wrappers = await sync_to_async(self.install)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+        return self.finish(request, response, recorder, started)
+
+    def install(self, recorder):
+        """Wrap every connection of the current thread; close the stack to unwrap"""
+        wrappers = ExitStack()
+        for connection in connections.all():
+            wrappers.enter_context(connection.execute_wrapper(recorder))
+        return wrappers
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that.
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is not None:
+            recorder.start_render()
+            response.add_post_render_callback(recorder.end_render)
+        return response
+
+    def finish(self, request, response, recorder, started):
+        entry = {
+            'view': get_view_name(request),
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'slowest_ms': round(recorder.slowest[0] * 1000, 2),
+            'slowest_sql': (recorder.slowest[1] or '')[:MAX_SQL_LENGTH] or None,
+            'duplicates': {shape[:MAX_SQL_LENGTH]: count for shape, count in recorder.duplicates().items()},
+            'render_ms': None if recorder.render_duration is None else round(recorder.render_duration * 1000, 2),
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+        record_stats(entry['view'], entry)
+        if self.header:
+            response['Server-Timing'] = server_timing(entry)
+        slow = entry['db_ms'] >= self.slow_ms or entry['queries'] >= self.max_queries
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(entry), extra={'queries': entry})
+        return response
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from spt.models import DailySalesRollup, ProductDailySales
+from spt.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups used by the admin dashboard from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+
+        rebuild_rollups(since=since, batch_size=options['batch_size'])
+        daily = DailySalesRollup.objects.count()
+        products = ProductDailySales.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {daily} daily and {products} product-day rollup rows'))
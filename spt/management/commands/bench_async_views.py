@@ -0,0 +1,88 @@
+"""
+Compare the sync and async cart/order endpoints.
+
+Point ``SPT_DB_PATH`` at a scratch database: the command creates a benchmark
+user with a small cart and deletes them again unless ``--keep`` is given,
+even when the run is interrupted.
+"""
+import asyncio
+import os
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from spt.models import Cart, CartItem, ProductVariant
+
+ENDPOINTS = {
+    'cart': ('/api/cart/', '/api/async/cart/'),
+    'orders': ('/api/orders/', '/api/async/orders/'),
+}
+BENCH_USERNAME = 'bench-async-views'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare sync and async cart/order endpoints at several concurrency levels, '
+        'all served by one in-process ASGI event loop (one worker)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and level')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--endpoint', choices=[*ENDPOINTS, 'all'], default='all')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and cart')
+
+    def handle(self, *args, **options):
+        if not os.environ.get('SPT_DB_PATH'):
+            raise CommandError('Set SPT_DB_PATH to a scratch database; the benchmark writes to it')
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        try:
+            cart, _ = Cart.objects.get_or_create(user=user)
+            if not cart.items.exists():
+                variants = list(ProductVariant.objects.select_related('product')[:5])
+                if not variants:
+                    raise CommandError('No product variants; run add_sample_products first')
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product=variant.product, variant=variant, quantity=1) for variant in variants
+                ])
+
+            endpoints = ENDPOINTS if options['endpoint'] == 'all' else {options['endpoint']: ENDPOINTS[options['endpoint']]}
+            asyncio.run(self.bench(user, endpoints, options['requests'], options['concurrency']))
+        finally:
+            if not options['keep']:
+                # Takes the cart and its lines with it.
+                user.delete()
+
+    async def bench(self, user, endpoints, requests, levels):
+        client = AsyncClient()
+        await client.aforce_login(user)
+
+        self.stdout.write(f'{"path":<22} {"conc":>5} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8}')
+        for sync_path, async_path in endpoints.values():
+            for path in (sync_path, async_path):
+                await client.get(path)  # warm up
+                for concurrency in levels:
+                    rate, p50, p95 = await self.measure(client, path, requests, concurrency)
+                    self.stdout.write(f'{path:<22} {concurrency:>5} {rate:>9,.0f} {p50:>8.1f} {p95:>8.1f}')
+
+    async def measure(self, client, path, requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def fetch():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f'{path} returned {response.status_code}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return requests / elapsed, statistics.median(latencies) * 1000, p95 * 1000
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from spt.channel_layers import SQLiteChannelLayer
+
+GROUP = 'bench'
+
+
+def receive_in_process(path, messages, ready, results):
+    """Worker process: join the group and time receiving ``messages`` messages"""
+    async def run():
+        layer = SQLiteChannelLayer(path, capacity=messages)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.release()
+        received = 0
+        started = None
+        try:
+            while received < messages:
+                await asyncio.wait_for(layer.receive(channel), 10)
+                started = started or time.perf_counter()
+                received += 1
+        except asyncio.TimeoutError:
+            pass
+        results.put((received, time.perf_counter() - (started or time.perf_counter())))
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLiteChannelLayer with InMemoryChannelLayer, and check fan-out across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--group-size', type=int, default=100)
+        parser.add_argument('--processes', type=int, default=4, help='Receiver processes for the cross-process run')
+
+    def handle(self, *args, **options):
+        messages, group_size = options['messages'], options['group_size']
+        with tempfile.TemporaryDirectory() as tempdir:
+            layers = {
+                'in-memory': InMemoryChannelLayer(capacity=messages),
+                'sqlite': SQLiteChannelLayer(os.path.join(tempdir, 'layer.sqlite3'), capacity=messages),
+            }
+            for name, layer in layers.items():
+                send_rate, fanout_rate = asyncio.run(self.bench(layer, messages, group_size))
+                self.stdout.write(
+                    f'{name:<10} send+receive {send_rate:>10,.0f} msg/s   '
+                    f'group_send to {group_size} {fanout_rate:>10,.0f} deliveries/s'
+                )
+            if options['processes']:
+                self.cross_process(os.path.join(tempdir, 'processes.sqlite3'), options['processes'], messages)
+
+    async def bench(self, layer, messages, group_size):
+        channel = await layer.new_channel()
+        started = time.perf_counter()
+        for i in range(messages):
+            await layer.send(channel, {'type': 'bench', 'n': i})
+        for _ in range(messages):
+            await layer.receive(channel)
+        send_rate = messages / (time.perf_counter() - started)
+
+        members = [await layer.new_channel() for _ in range(group_size)]
+        for member in members:
+            await layer.group_add(GROUP, member)
+        sends = max(1, messages // group_size)
+        started = time.perf_counter()
+        for i in range(sends):
+            await layer.group_send(GROUP, {'type': 'bench', 'n': i})
+        for member in members:
+            for _ in range(sends):
+                await layer.receive(member)
+        fanout_rate = sends * group_size / (time.perf_counter() - started)
+        await layer.flush()
+        return send_rate, fanout_rate
+
+    def cross_process(self, path, processes, messages):
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Semaphore(0), context.Queue()
+        workers = [
+            context.Process(target=receive_in_process, args=(path, messages, ready, results))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.acquire()
+
+        async def send():
+            layer = SQLiteChannelLayer(path, capacity=messages)
+            for i in range(messages):
+                await layer.group_send(GROUP, {'type': 'bench', 'n': i})
+        started = time.perf_counter()
+        asyncio.run(send())
+        outcomes = [results.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        delivered = sum(received for received, _ in outcomes)
+        self.stdout.write(
+            f'cross-process: {messages} group_sends to {processes} processes, '
+            f'{delivered}/{messages * processes} delivered in {elapsed:.2f}s '
+            f'({delivered / elapsed:,.0f} deliveries/s)'
+        )
@@ -0,0 +1,158 @@
+"""
+Time order exports and measure their memory.
+
+Point ``SPT_DB_PATH`` at a scratch database: the command seeds up to
+``--items`` synthetic order lines (orders numbered ``BENCH-EXPORT-...``),
+runs each export in a forked child to read its peak RSS, and deletes the
+seeded rows again unless ``--keep`` is given. Throughput is computed from
+the rows each export actually wrote.
+"""
+import os
+import resource
+import time
+from decimal import Decimal
+from itertools import cycle
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from spt.exports import export_chunks, export_queryset
+from spt.models import Order, OrderItem, ProductVariant
+
+ORDER_PREFIX = 'BENCH-EXPORT-'
+BENCH_USERNAME = 'bench-exports'
+
+
+def export(mode, kind):
+    """Write one export to /dev/null; returns the number of rows written"""
+    with open(os.devnull, 'w') as output:
+        if mode == 'list':
+            # What a naive export does: read every row before writing any.
+            rows = list(export_queryset(kind))
+            for row in rows:
+                output.write(','.join(map(str, row)) + '\n')
+            return len(rows)
+        # Rows end in the writer's terminator ("\r\n" for CSV, whose first
+        # line is the header; "\n" for NDJSON, which escapes line breaks).
+        terminator = '\r\n' if mode == 'csv' else '\n'
+        lines = 0
+        for chunk in export_chunks(kind, mode):
+            output.write(chunk)
+            lines += chunk.count(terminator)
+        return lines - 1 if mode == 'csv' else lines
+
+
+class Command(BaseCommand):
+    help = (
+        'Create synthetic order lines, then time exporting them and measure each '
+        "export's peak RSS in a forked child process"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1_000_000, help='Synthetic order lines to have')
+        parser.add_argument('--items-per-order', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders created per bulk insert')
+        parser.add_argument('--modes', nargs='+', choices=['csv', 'ndjson', 'list'], default=['csv', 'ndjson', 'list'])
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic orders for the next run')
+
+    def handle(self, *args, **options):
+        if not os.environ.get('SPT_DB_PATH'):
+            raise CommandError('Set SPT_DB_PATH to a scratch database; the benchmark writes to it')
+        self.ensure_items(options['items'], options['items_per_order'], options['batch_size'])
+        try:
+            connections.close_all()
+            self.stdout.write(
+                f'{"export":<14} {"rows":>10} {"seconds":>8} {"rows/s":>10} {"peak RSS MB":>12} {"growth MB":>10}'
+            )
+            for mode in options['modes']:
+                rows, elapsed, before, after = self.in_child(mode, 'items')
+                self.stdout.write(
+                    f'items/{mode:<8} {rows:>10,} {elapsed:>8.1f} {rows / elapsed:>10,.0f} '
+                    f'{after / 1024:>12.1f} {(after - before) / 1024:>10.1f}'
+                )
+        finally:
+            if not options['keep']:
+                self.stdout.write(f'Deleted {self.delete_items():,} synthetic rows')
+
+    def delete_items(self):
+        """Remove the synthetic orders and their lines; returns the rows deleted"""
+        # Raw deletes, lines first: the ORM would load every order to run its
+        # delete signals, which would also take the never-recorded orders out
+        # of the sales rollups.
+        orders = Order.objects.filter(order_number__startswith=ORDER_PREFIX)
+        deleted = 0
+        with transaction.atomic():
+            for queryset in (OrderItem.objects.filter(order__in=orders), orders):
+                sql, params = queryset.values('pk').query.sql_with_params()
+                table = connections['default'].ops.quote_name(queryset.model._meta.db_table)
+                with connections['default'].cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {table} WHERE id IN ({sql})', params)
+                    deleted += cursor.rowcount
+            User.objects.filter(username=BENCH_USERNAME).delete()
+        return deleted
+
+    def ensure_items(self, items, per_order, batch_size):
+        existing = OrderItem.objects.filter(order__order_number__startswith=ORDER_PREFIX).count()
+        missing_orders = -(-(items - existing) // per_order)
+        if missing_orders <= 0:
+            return
+        variants = list(ProductVariant.objects.select_related('product')[:50])
+        if not variants:
+            raise CommandError('No product variants; run add_sample_products first')
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        next_number = Order.objects.filter(order_number__startswith=ORDER_PREFIX).count()
+        variant_cycle = cycle(variants)
+        started = time.perf_counter()
+
+        # bulk_create skips the rollup signals; these orders stay out of the
+        # dashboard until backfill_sales_rollups runs.
+        for offset in range(0, missing_orders, batch_size):
+            count = min(batch_size, missing_orders - offset)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(
+                        user=user, order_number=f'{ORDER_PREFIX}{next_number + offset + i:09d}',
+                        total_amount=Decimal('0.00'), shipping_address='Bench', shipping_city='Chennai',
+                        shipping_state='Tamil Nadu', shipping_pincode='600001',
+                    )
+                    for i in range(count)
+                ])
+                lines = []
+                for order in orders:
+                    for _ in range(per_order):
+                        variant = next(variant_cycle)
+                        lines.append(OrderItem(
+                            order=order, product=variant.product, variant=variant, quantity=1,
+                            price_at_purchase=variant.product.base_price,
+                            variant_price_at_purchase=variant.additional_price,
+                        ))
+                OrderItem.objects.bulk_create(lines)
+        self.stdout.write(
+            f'Created {missing_orders * per_order:,} order lines in {time.perf_counter() - started:.1f}s'
+        )
+
+    def in_child(self, mode, kind):
+        """Run one export in a forked child; returns (rows, seconds, RSS KB at start, peak RSS KB)"""
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_end)
+                before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                started = time.perf_counter()
+                rows = export(mode, kind)
+                elapsed = time.perf_counter() - started
+                after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                os.write(write_end, f'{rows} {elapsed} {before} {after}'.encode())
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_end)
+        with os.fdopen(read_end) as result:
+            report = result.read()
+        _, status = os.waitpid(pid, 0)
+        if status or not report:
+            raise CommandError(f'Export {mode} failed in the child process')
+        rows, elapsed, before, after = report.split()
+        return int(rows), float(elapsed), int(before), int(after)
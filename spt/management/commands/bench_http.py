@@ -0,0 +1,378 @@
+"""
+HTTP load benchmark of the spt API over real WSGI and ASGI servers.
+
+Point ``SPT_DB_PATH`` at a scratch database. The command migrates it, fills
+it with ``generate_load_data`` if it is empty, and signs in one session per
+virtual user (plus a staff session for the dashboard). It then snapshots the
+file so every server starts from the same data. Each server runs as a
+subprocess with ``SPT_DEBUG=0``: ``serve_wsgi`` for WSGI and ``daphne`` for
+ASGI. ``--concurrency`` threads drive a seeded, weighted mix of scenarios for
+``--warmup`` + ``--duration`` seconds over keep-alive connections.
+
+Results per server and endpoint (requests/s, p50/p95/p99 ms, error counts)
+are printed and, with ``--output``, saved as JSON. ``--baseline`` compares
+against an earlier file and exits non-zero when an endpoint's p95 grows, or
+its throughput falls, by more than ``--threshold``.
+"""
+import http.client
+import json
+import os
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from spt.models import Order, Product, ProductVariant
+
+# Scenario -> weight in the mix
+SCENARIOS = {
+    'browse': 25,
+    'product': 15,
+    'search': 12,
+    'cart_add': 14,
+    'cart_update': 8,
+    'checkout': 6,
+    'track': 15,
+    'dashboard': 5,
+}
+SEARCH_TERMS = ['cement', 'bricks', 'tmt', 'sand', 'tiles', 'product 1']
+SHIPPING = {'address': '1 Bench Road', 'city': 'Chennai', 'state': 'Tamil Nadu', 'pincode': '600001'}
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'rps': round(len(ordered) / elapsed, 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2) if ordered else None,
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2) if ordered else None,
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2) if ordered else None,
+        'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+        'non_2xx': sum(count for status, count in statuses.items() if not 200 <= status < 300),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """Endpoints whose p95 or throughput got worse than ``baseline`` by more than ``threshold``"""
+    regressions = []
+    for server, current in results.items():
+        previous = baseline.get('results', {}).get(server, {})
+        for endpoint, stats in current['endpoints'].items():
+            before = previous.get('endpoints', {}).get(endpoint)
+            if not before or not stats['requests'] or not before['requests']:
+                continue
+            if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                regressions.append(f'{server} {endpoint}: p95 {before["p95_ms"]} -> {stats["p95_ms"]} ms')
+            if stats['rps'] < before['rps'] * (1 - threshold):
+                regressions.append(f'{server} {endpoint}: {before["rps"]} -> {stats["rps"]} req/s')
+    return regressions
+
+
+class VirtualUser:
+    """One client thread: a session, a keep-alive connection and its own seeded choices"""
+
+    def __init__(self, port, fixture, catalog, staff_cookie, seed):
+        self.port = port
+        self.cookie = fixture['cookie']
+        self.csrf = fixture['csrf']
+        self.order_ids = list(fixture['order_ids'])
+        self.catalog = catalog
+        self.staff_cookie = staff_cookie
+        self.rng = random.Random(seed)
+        self.cart_items = []
+        self.connection = None
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def request(self, name, method, path, body=None, cookie=None):
+        headers = {'Accept': 'application/json', 'Cookie': cookie or self.cookie}
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers.update({'Content-Type': 'application/json', 'X-CSRFToken': self.csrf})
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=data, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            status, payload = 0, b''
+        if self.recording:
+            self.latencies[name].append(time.perf_counter() - started)
+            self.statuses[name][status] += 1
+        return status, payload
+
+    def run(self, record_at, stop_at):
+        while (now := time.perf_counter()) < stop_at:
+            self.recording = now >= record_at
+            scenario = self.rng.choices(list(SCENARIOS), weights=list(SCENARIOS.values()))[0]
+            getattr(self, scenario)()
+        if self.connection is not None:
+            self.connection.close()
+
+    def browse(self):
+        self.request('browse', 'GET', f'/api/products/?page={self.rng.randint(1, 5)}')
+
+    def product(self):
+        self.request('product', 'GET', f'/api/products/{self.rng.choice(self.catalog["products"])}/')
+
+    def search(self):
+        term = self.rng.choice(SEARCH_TERMS).replace(' ', '+')
+        self.request('search', 'GET', f'/api/products/?search={term}')
+
+    def cart_add(self):
+        product_id, variant_id = self.rng.choice(self.catalog['variants'])
+        status, payload = self.request('cart_add', 'POST', '/api/cart/add/', {
+            'product_id': product_id, 'variant_id': variant_id, 'quantity': 1,
+        })
+        if status == 201:
+            self.cart_items.append(json.loads(payload)['id'])
+
+    def cart_update(self):
+        if not self.cart_items:
+            return self.cart_add()
+        self.request('cart_update', 'POST', '/api/cart/update_quantity/', {
+            'item_id': self.rng.choice(self.cart_items), 'quantity': self.rng.randint(1, 3),
+        })
+
+    def checkout(self):
+        if not self.cart_items:
+            self.cart_add()
+        status, payload = self.request('checkout', 'POST', '/api/orders/', SHIPPING)
+        if status == 201:
+            self.order_ids.append(json.loads(payload)['id'])
+        else:
+            self.request('cart_clear', 'POST', '/api/cart/', {})
+        self.cart_items = []
+
+    def track(self):
+        if self.order_ids:
+            self.request('track', 'GET', f'/api/orders/{self.rng.choice(self.order_ids)}/track/')
+
+    def dashboard(self):
+        self.request('dashboard', 'GET', '/api/admin-dashboard/', cookie=self.staff_cookie)
+
+
+class Command(BaseCommand):
+    help = 'Drive a mixed API workload against the WSGI and ASGI servers and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=20, help='Measured seconds per server')
+        parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before that')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--orders', type=int, default=100000, help='Orders to generate for an empty database')
+        parser.add_argument('--port', type=int, default=8701)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=0.15, help='Allowed regression, as a fraction')
+
+    def handle(self, *args, **options):
+        if not os.environ.get('SPT_DB_PATH'):
+            raise CommandError('Set SPT_DB_PATH to a scratch database; the benchmark writes to it')
+        database = str(settings.DATABASES['default']['NAME'])
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        call_command('migrate', verbosity=0)
+        if not Order.objects.filter(order_number__startswith='LOAD-').exists():
+            self.stdout.write(f'Generating a dataset with {options["orders"]:,} orders...')
+            call_command('generate_load_data', orders=options['orders'], seed=options['seed'], stdout=self.stdout)
+        fixtures, catalog, staff_cookie = self.prepare(options['concurrency'], options['seed'])
+        connections.close_all()
+        snapshot = f'{database}.bench-snapshot'
+        shutil.copyfile(database, snapshot)
+
+        results = {}
+        try:
+            for server in options['servers']:
+                shutil.copyfile(snapshot, database)
+                results[server] = self.run_server(server, fixtures, catalog, staff_cookie, options)
+                self.report(server, results[server])
+        finally:
+            shutil.copyfile(snapshot, database)
+            os.remove(snapshot)
+
+        document = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'git_commit': self.git_commit(),
+                'python': sys.version.split()[0],
+                'django': django.get_version(),
+                'database': os.path.basename(database),
+                'orders': Order.objects.count(),
+                **{name: options[name] for name in ('concurrency', 'duration', 'warmup', 'seed')},
+                'scenarios': SCENARIOS,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(document, output, indent=2)
+            self.stdout.write(f'Saved {options["output"]}')
+
+        if baseline is not None:
+            regressions = find_regressions(results, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(f'REGRESSION {regression}')
+                raise CommandError(f'{len(regressions)} regressions beyond {options["threshold"]:.0%}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions beyond {options["threshold"]:.0%}'))
+
+    def prepare(self, concurrency, seed):
+        """Sessions for the virtual users and the staff user, and catalog ids to pick from"""
+        rng = random.Random(f'{seed}:bench')
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        backend = settings.AUTHENTICATION_BACKENDS[0]
+
+        def cookie_for(user, csrf):
+            session = store()
+            session.update({
+                SESSION_KEY: str(user.pk), BACKEND_SESSION_KEY: backend,
+                HASH_SESSION_KEY: user.get_session_auth_hash(),
+            })
+            session.create()
+            return f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={csrf}'
+
+        buyers = list(
+            User.objects.filter(username__startswith='load-', orders__isnull=False).distinct().order_by('pk')[:concurrency]
+        )
+        if len(buyers) < concurrency:
+            raise CommandError(f'Only {len(buyers)} users with orders; generate a larger dataset')
+        fixtures = []
+        for user in buyers:
+            csrf = get_random_string(32, string.ascii_letters + string.digits)
+            fixtures.append({
+                'cookie': cookie_for(user, csrf),
+                'csrf': csrf,
+                'order_ids': list(Order.objects.filter(user=user).order_by('-pk').values_list('pk', flat=True)[:50]),
+            })
+        staff, _ = User.objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        staff_cookie = cookie_for(staff, get_random_string(32, string.ascii_letters + string.digits))
+
+        products = list(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+        variants = list(ProductVariant.objects.filter(stock_quantity__gt=0).values_list('product_id', 'pk'))
+        catalog = {
+            'products': rng.sample(products, min(len(products), 2000)),
+            'variants': rng.sample(variants, min(len(variants), 2000)),
+        }
+        return fixtures, catalog, staff_cookie
+
+    def server_command(self, server, port):
+        if server == 'wsgi':
+            return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'serve_wsgi', '--port', str(port)]
+        return [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'newproject.asgi:application']
+
+    def run_server(self, server, fixtures, catalog, staff_cookie, options):
+        port = options['port']
+        env = dict(os.environ, SPT_DEBUG='0', DJANGO_SETTINGS_MODULE='newproject.settings')
+        # The server logs a traceback per 500; a pipe nobody drains would
+        # fill up and stall it, so its output goes to a file.
+        log = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            self.server_command(server, port), cwd=settings.BASE_DIR, env=env,
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            self.wait_until_ready(process, port, log)
+            users = [
+                VirtualUser(port, fixture, catalog, staff_cookie, f'{options["seed"]}:{server}:{i}')
+                for i, fixture in enumerate(fixtures)
+            ]
+            started = time.perf_counter()
+            record_at = started + options['warmup']
+            stop_at = record_at + options['duration']
+            threads = [threading.Thread(target=user.run, args=(record_at, stop_at)) for user in users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+
+        # Rates are over the measured window; requests still in flight at its
+        # end are counted but do not stretch it.
+        elapsed = options['duration']
+        latencies, statuses = defaultdict(list), defaultdict(Counter)
+        for user in users:
+            for name, values in user.latencies.items():
+                latencies[name].extend(values)
+                statuses[name].update(user.statuses[name])
+        return {
+            'endpoints': {name: summarize(latencies[name], statuses[name], elapsed) for name in sorted(latencies)},
+            'total': summarize(
+                [value for values in latencies.values() for value in values],
+                sum(statuses.values(), Counter()), elapsed,
+            ),
+        }
+
+    def wait_until_ready(self, process, port, log, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'Server exited: {log.read().decode()[-2000:]}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/api/categories/')
+                if connection.getresponse().status == 200:
+                    return
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'Server on port {port} did not start within {timeout}s')
+
+    def report(self, server, result):
+        self.stdout.write(f'\n{server}: {result["total"]["rps"]:,.1f} req/s, {result["total"]["errors"]} errors')
+        self.stdout.write(f'{"endpoint":<12} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"non-2xx":>8}')
+        for name, stats in result['endpoints'].items():
+            self.stdout.write(
+                f'{name:<12} {stats["rps"]:>8,.1f} {stats["p50_ms"]:>8} {stats["p95_ms"]:>8} '
+                f'{stats["p99_ms"]:>8} {stats["non_2xx"]:>8}'
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,78 @@
+"""
+Measure Order insert throughput with each order number scheme.
+
+Point ``SPT_DB_PATH`` at a scratch database: the command inserts ``--count``
+orders per scheme and deletes them again unless ``--keep`` is given, even
+when the run is interrupted.
+"""
+import os
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from spt.models import Order
+from spt.order_numbers import random_order_number, sequential_order_number
+
+BENCH_USERNAME = 'bench-order-numbers'
+
+SCHEMES = {
+    'sequential': sequential_order_number,
+    'random': random_order_number,
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure Order insert throughput with each order number scheme'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Orders inserted per scheme')
+        parser.add_argument('--scheme', choices=[*SCHEMES, 'all'], default='all')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark orders')
+
+    def handle(self, *args, **options):
+        if not os.environ.get('SPT_DB_PATH'):
+            raise CommandError('Set SPT_DB_PATH to a scratch database; the benchmark writes to it')
+        count = options['count']
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        schemes = SCHEMES if options['scheme'] == 'all' else {options['scheme']: SCHEMES[options['scheme']]}
+        created = []
+        try:
+            for name, generate in schemes.items():
+                collisions = 0
+                started = time.perf_counter()
+                for _ in range(count):
+                    # One autocommit insert per order, as checkout does.
+                    try:
+                        created.append(Order.objects.create(
+                            user=user,
+                            order_number=generate(),
+                            total_amount=Decimal('0.00'),
+                            shipping_address='benchmark',
+                            shipping_city='benchmark',
+                            shipping_state='benchmark',
+                            shipping_pincode='000000',
+                        ).pk)
+                    except IntegrityError:
+                        collisions += 1
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{name:<10} {count} inserts in {elapsed:.2f}s '
+                    f'({count / elapsed:,.0f} orders/s, {collisions} collisions)'
+                )
+
+            if 'random' in schemes:
+                # Birthday bound for 32 random bits, over the orders already
+                # stored plus one scheme's worth.
+                stored = Order.objects.exclude(pk__in=created).count()
+                for orders in (stored + count, 1_000_000):
+                    self.stdout.write(
+                        f'random scheme: ~{orders * (orders - 1) / 2 / 2 ** 32:,.1f} expected collisions '
+                        f'among {orders:,} orders'
+                    )
+        finally:
+            if not options['keep']:
+                Order.objects.filter(pk__in=created).delete()
+                user.delete()
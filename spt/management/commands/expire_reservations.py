@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from spt.reservations import expire_reservations, reconcile_inventory
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations back to inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Also recompute every Inventory row from variant stock and live reservations')
+
+    def handle(self, *args, **options):
+        released = expire_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
+
+        if options['reconcile']:
+            repaired = reconcile_inventory()
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {repaired} inventory rows'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from spt.exports import EXPORTS, FORMATS, ExportError, export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or order lines as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--start', help='First order date (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last order date (YYYY-MM-DD)')
+        parser.add_argument('--status')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export_chunks(
+                options['kind'], options['format'], start=options['start'], end=options['end'],
+                status=options['status'], chunk_size=options['chunk_size'],
+            )
+        except ExportError as exc:
+            raise CommandError(exc)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,350 @@
+"""
+Fabricate a realistically sized and skewed dataset for load and scale tests.
+
+Rows are written with ``executemany`` in fixed-size batches, one transaction
+per batch, with primary keys allocated here so later tables can reference
+earlier ones without reading them back. Every table draws from its own
+``Random`` seeded from ``--seed`` and the table name, so a run is
+reproducible and changing one volume leaves the other tables' choices alone.
+
+Skew: product popularity and orders per user follow Zipf-like weights over a
+shuffled ranking (a few hot products and heavy buyers), and order dates
+follow a yearly season, a weekly cycle and growth over ``--days``.
+
+Generated rows are marked with the ``load-`` / ``LOAD-`` prefixes;
+``--reset`` removes them first. Denormalized counters are written directly
+and the sales rollups are rebuilt at the end, so the dataset is consistent.
+"""
+import math
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from spt.cache import bump_catalog_version
+from spt.models import (
+    Cart, CartItem, Customer, IdempotencyKey, Inventory, Order, OrderItem, Product, ProductCategory,
+    ProductDailySales, ProductVariant, StockReservation,
+)
+from spt.rollups import rebuild_rollups
+
+PREFIX = 'load-'
+SKU_PREFIX = ORDER_PREFIX = 'LOAD-'
+CITIES = [
+    ('Chennai', 'Tamil Nadu', '600'), ('Coimbatore', 'Tamil Nadu', '641'), ('Madurai', 'Tamil Nadu', '625'),
+    ('Bengaluru', 'Karnataka', '560'), ('Hyderabad', 'Telangana', '500'), ('Kochi', 'Kerala', '682'),
+    ('Mumbai', 'Maharashtra', '400'), ('Pune', 'Maharashtra', '411'), ('Delhi', 'Delhi', '110'),
+]
+VARIANT_TYPES = [choice for choice, _ in ProductVariant.VARIANT_TYPES]
+# Lines per order and units per line, most often small
+LINES_PER_ORDER = [1, 1, 1, 2, 2, 3, 4, 5]
+UNITS_PER_LINE = [1, 1, 1, 1, 2, 2, 3, 5, 10, 20]
+
+
+def zipf_cum_weights(count, exponent):
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Table:
+    """Raw batched inserts into one model's table, with db-ready values"""
+
+    def __init__(self, model, fields, batch_size):
+        self.model = model
+        self.fields = [model._meta.get_field(name) for name in fields]
+        self.connection = connections[router.db_for_write(model)]
+        self.batch_size = batch_size
+        qn = self.connection.ops.quote_name
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            qn(model._meta.db_table),
+            ', '.join(qn(field.column) for field in self.fields),
+            ', '.join(['%s'] * len(self.fields)),
+        )
+
+    def prep(self, name, value):
+        """Convert a value the way the ORM would when saving ``name``"""
+        return self.model._meta.get_field(name).get_db_prep_save(value, self.connection)
+
+    def insert(self, rows):
+        count = 0
+        rows = iter(rows)
+        with self.connection.cursor() as cursor:
+            while batch := list(islice(rows, self.batch_size)):
+                with transaction.atomic(using=self.connection.alias):
+                    cursor.executemany(self.sql, batch)
+                count += len(batch)
+        return count
+
+    def next_id(self):
+        return (self.model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate seeded, skewed catalog, customer, cart and order data for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--variants-per-product', type=int, default=4, help='Up to this many per product')
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--customer-ratio', type=float, default=0.6, help='Share of users with a profile')
+        parser.add_argument('--carts', type=int, default=2000, help='Users with an open cart')
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help='Spread orders over this many past days')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--reset', action='store_true', help='Delete previously generated rows first')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild the sales rollups')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now().replace(microsecond=0)
+        if options['reset']:
+            self.phase('reset', self.reset)
+        elif User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError('Load data already exists; pass --reset to regenerate it')
+
+        self.phase('categories', self.generate_categories)
+        self.phase('products and variants', self.generate_catalog)
+        self.phase('users and customers', self.generate_users)
+        self.phase('carts', self.generate_carts)
+        self.phase('orders and lines', self.generate_orders)
+        if not options['skip_rollups']:
+            self.phase('sales rollups', rebuild_rollups)
+        transaction.on_commit(bump_catalog_version, robust=True)
+
+    def phase(self, name, function):
+        started = time.perf_counter()
+        result = function()
+        detail = f' ({result:,} rows)' if isinstance(result, int) else ''
+        self.stdout.write(f'{name}{detail}: {time.perf_counter() - started:.1f}s')
+
+    def rng(self, table):
+        return random.Random(f'{self.options["seed"]}:{table}')
+
+    def reset(self):
+        users = User.objects.filter(username__startswith=PREFIX)
+        orders = Order.objects.filter(order_number__startswith=ORDER_PREFIX)
+        products = Product.objects.filter(sku__startswith=SKU_PREFIX)
+        variants = ProductVariant.objects.filter(product__in=products)
+        deleted = 0
+        # Raw deletes, child tables first: the ORM would load every order to
+        # run its delete signals. The rollups are rebuilt afterwards.
+        with transaction.atomic():
+            for queryset in (
+                OrderItem.objects.filter(order__in=orders),
+                StockReservation.objects.filter(variant__in=variants),
+                CartItem.objects.filter(cart__user__in=users),
+                IdempotencyKey.objects.filter(user__in=users),
+                orders, Cart.objects.filter(user__in=users), Customer.objects.filter(user__in=users),
+                Inventory.objects.filter(variant__in=variants), ProductDailySales.objects.filter(product__in=products),
+                variants, products,
+                ProductCategory.objects.filter(name__startswith=PREFIX), users,
+            ):
+                sql, params = queryset.values('pk').query.sql_with_params()
+                table = connections['default'].ops.quote_name(queryset.model._meta.db_table)
+                with connections['default'].cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {table} WHERE id IN ({sql})', params)
+                    deleted += cursor.rowcount
+        return deleted
+
+    def generate_categories(self):
+        table = Table(ProductCategory, ['id', 'name', 'description', 'created_at', 'updated_at'], self.batch_size)
+        start = table.next_id()
+        stamp = table.prep('created_at', self.now - timedelta(days=self.options['days']))
+        self.category_ids = list(range(start, start + self.options['categories']))
+        return table.insert(
+            (pk, f'{PREFIX}category-{pk:04d}', 'Generated category', stamp, stamp) for pk in self.category_ids
+        )
+
+    def generate_catalog(self):
+        rng = self.rng('catalog')
+        products = Table(Product, [
+            'id', 'name', 'sku', 'description', 'category', 'base_price', 'is_active',
+            'total_stock', 'in_stock', 'created_at', 'updated_at',
+        ], self.batch_size)
+        variants = Table(ProductVariant, [
+            'id', 'product', 'variant_name', 'variant_type', 'additional_price', 'stock_quantity',
+            'sku', 'created_at', 'updated_at',
+        ], self.batch_size)
+        product_id, variant_id = products.next_id(), variants.next_id()
+        # (variant_id, product_id, base_price, additional_price) per variant, by product
+        self.variants_by_product = []
+        product_rows, variant_rows = [], []
+        for index in range(self.options['products']):
+            created = self.now - timedelta(days=rng.uniform(0, self.options['days']))
+            stamp = products.prep('created_at', created)
+            base_price = Decimal(rng.choice([50, 120, 350, 450, 900, 4500, 12000])) + rng.randrange(100)
+            product_variants, total = [], 0
+            for j in range(rng.randint(1, self.options['variants_per_product'])):
+                stock = 0 if rng.random() < 0.05 else rng.randint(1, 500)
+                extra = Decimal(rng.choice([0, 0, 10, 25, 50]))
+                total += stock
+                variant_rows.append((
+                    variant_id, product_id, f'Option {j}', VARIANT_TYPES[j % len(VARIANT_TYPES)],
+                    variants.prep('additional_price', extra), stock,
+                    f'{SKU_PREFIX}{product_id}-{j}', stamp, stamp,
+                ))
+                product_variants.append((variant_id, product_id, base_price, extra))
+                variant_id += 1
+            product_rows.append((
+                product_id, f'Product {index} {rng.choice(["cement", "bricks", "TMT rod", "sand", "tiles"])}',
+                f'{SKU_PREFIX}P{product_id}', 'Generated product', rng.choice(self.category_ids),
+                products.prep('base_price', base_price), True, total, total > 0, stamp, stamp,
+            ))
+            self.variants_by_product.append(product_variants)
+            product_id += 1
+        count = products.insert(product_rows) + variants.insert(variant_rows)
+        # Hot products: popularity by rank over a shuffled order.
+        rng.shuffle(self.variants_by_product)
+        self.product_weights = zipf_cum_weights(len(self.variants_by_product), 1.1)
+        return count
+
+    def generate_users(self):
+        rng = self.rng('users')
+        users = Table(User, [
+            'id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+            'is_staff', 'is_active', 'date_joined',
+        ], self.batch_size)
+        customers = Table(Customer, [
+            'user', 'phone', 'address', 'city', 'state', 'pincode', 'created_at', 'updated_at',
+        ], self.batch_size)
+        password = make_password(None)
+        start = users.next_id()
+        self.user_ids = list(range(start, start + self.options['users']))
+        joined = users.prep('date_joined', self.now - timedelta(days=self.options['days'] + 1))
+        user_rows, customer_rows = [], []
+        for pk in self.user_ids:
+            user_rows.append((
+                pk, password, False, f'{PREFIX}user-{pk}', 'Load', f'User {pk}', f'{PREFIX}{pk}@example.com',
+                False, True, joined,
+            ))
+            if rng.random() < self.options['customer_ratio']:
+                city, state, pin = rng.choice(CITIES)
+                customer_rows.append((
+                    pk, f'9{rng.randrange(10 ** 9):09d}', f'{rng.randint(1, 200)} Main Road', city, state,
+                    f'{pin}{rng.randrange(1000):03d}', joined, joined,
+                ))
+        count = users.insert(user_rows) + customers.insert(customer_rows)
+        # Heavy buyers: orders per user by rank over a shuffled order.
+        rng.shuffle(self.user_ids)
+        self.user_weights = zipf_cum_weights(len(self.user_ids), 0.7)
+        return count
+
+    def pick_variant(self, rng):
+        variants = self.variants_by_product[bisect(self.product_weights, rng.random() * self.product_weights[-1])]
+        return variants[rng.randrange(len(variants))]
+
+    def generate_carts(self):
+        rng = self.rng('carts')
+        carts = Table(Cart, ['id', 'user', 'created_at', 'updated_at'], self.batch_size)
+        items = Table(CartItem, ['cart', 'product', 'variant', 'quantity', 'created_at', 'updated_at'], self.batch_size)
+        cart_id = carts.next_id()
+        cart_rows, item_rows = [], []
+        for user_id in rng.sample(self.user_ids, min(self.options['carts'], len(self.user_ids))):
+            stamp = carts.prep('created_at', self.now - timedelta(minutes=rng.randint(1, 60 * 24 * 14)))
+            cart_rows.append((cart_id, user_id, stamp, stamp))
+            chosen = {self.pick_variant(rng) for _ in range(rng.choice(LINES_PER_ORDER))}
+            item_rows.extend(
+                (cart_id, product_id, variant_id, rng.choice(UNITS_PER_LINE), stamp, stamp)
+                for variant_id, product_id, _, _ in chosen
+            )
+            cart_id += 1
+        return carts.insert(cart_rows) + items.insert(item_rows)
+
+    def order_days(self, rng):
+        """Cumulative weight of each past day (0 = ``--days`` ago)"""
+        days = self.options['days']
+        start = self.now - timedelta(days=days)
+        weights = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            season = 1 + 0.35 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 80) / 365)
+            weekly = 1.25 if day.weekday() < 5 else 0.7
+            growth = 0.6 + 0.8 * offset / max(days - 1, 1)
+            weights.append(season * weekly * growth * rng.uniform(0.85, 1.15))
+        return start, list(accumulate(weights))
+
+    def status_for(self, rng, age):
+        if age < timedelta(days=2):
+            return rng.choices(['PENDING', 'CONFIRMED', 'PROCESSING'], [5, 3, 2])[0]
+        if age < timedelta(days=7):
+            return rng.choices(['PROCESSING', 'SHIPPED', 'CANCELLED'], [3, 6, 1])[0]
+        return 'CANCELLED' if rng.random() < 0.06 else 'DELIVERED'
+
+    def generate_orders(self):
+        rng = self.rng('orders')
+        orders = Table(Order, [
+            'id', 'user', 'order_number', 'status', 'total_amount', 'shipping_address', 'shipping_city',
+            'shipping_state', 'shipping_pincode', 'tracking_number', 'created_at', 'updated_at',
+        ], self.batch_size)
+        items = Table(OrderItem, [
+            'order', 'product', 'variant', 'quantity', 'price_at_purchase', 'variant_price_at_purchase',
+        ], self.batch_size)
+        start, day_weights = self.order_days(rng)
+        per_day = [0] * len(day_weights)
+        for _ in range(self.options['orders']):
+            per_day[bisect(day_weights, rng.random() * day_weights[-1])] += 1
+        first_id = orders.next_id()
+        prices = {}
+
+        def price(variant):
+            # Unit price, and price_at_purchase / variant_price_at_purchase as stored
+            if variant not in prices:
+                _, _, base_price, extra = variant
+                prices[variant] = (
+                    base_price + extra,
+                    items.prep('price_at_purchase', base_price),
+                    items.prep('variant_price_at_purchase', extra),
+                )
+            return prices[variant]
+
+        def rows():
+            # Orders come out in date order, so ids grow with created_at.
+            order_id = first_id
+            for offset, count in enumerate(per_day):
+                day = start + timedelta(days=offset)
+                for seconds in sorted(rng.randrange(86400) for _ in range(count)):
+                    created = day + timedelta(seconds=seconds)
+                    stamp = orders.prep('created_at', created)
+                    status = self.status_for(rng, self.now - created)
+                    user_id = self.user_ids[bisect(self.user_weights, rng.random() * self.user_weights[-1])]
+                    city, state, pin = CITIES[user_id % len(CITIES)]
+                    total, lines = Decimal('0.00'), []
+                    for variant in {self.pick_variant(rng) for _ in range(rng.choice(LINES_PER_ORDER))}:
+                        unit, unit_value, variant_value = price(variant)
+                        quantity = rng.choice(UNITS_PER_LINE)
+                        total += unit * quantity
+                        lines.append((order_id, variant[1], variant[0], quantity, unit_value, variant_value))
+                    yield (
+                        order_id, user_id, f'{ORDER_PREFIX}{order_id:010d}', status,
+                        orders.prep('total_amount', total), f'{user_id % 200 + 1} Main Road', city, state,
+                        f'{pin}{user_id % 1000:03d}', f'TRK{order_id:010d}' if status in ('SHIPPED', 'DELIVERED') else None,
+                        stamp, stamp,
+                    ), lines
+                    order_id += 1
+
+        count = 0
+        pairs = rows()
+        while batch := list(islice(pairs, self.batch_size)):
+            count += orders.insert(order for order, _ in batch)
+            count += items.insert(line for _, lines in batch for line in lines)
+        self.reset_sequences([Order, OrderItem, Cart, CartItem, Customer, User, Product, ProductVariant, ProductCategory])
+        return count
+
+    def reset_sequences(self, models):
+        """Move backends with sequences (PostgreSQL, Oracle) past the ids set here"""
+        connection = connections['default']
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
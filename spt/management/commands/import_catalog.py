@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from spt.catalog_import import CatalogImportError, import_catalog, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update products and variants, keyed by SKU, from a CSV or JSON Lines feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        started = time.perf_counter()
+        try:
+            with open(path, newline='', encoding='utf-8') as feed:
+                importer = import_catalog(read_rows(feed, input_format), batch_size=options['batch_size'])
+        except (OSError, CatalogImportError) as exc:
+            raise CommandError(exc)
+
+        for number, message in importer.errors:
+            self.stderr.write(f'line {number}: {message}')
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"Products: {stats['products_created']} created, {stats['products_updated']} updated, "
+            f"{stats['products_unchanged']} unchanged. Variants: {stats['variants_created']} created, "
+            f"{stats['variants_updated']} updated, {stats['variants_unchanged']} unchanged. "
+            f"{stats['rows_rejected']} rows rejected; {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from spt.events import stock_group
+from spt.models import Product
+from spt.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = 'Open many stock sockets in-process and measure event fan-out through the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=500)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--product', type=int, help='Product id (default: the first product)')
+
+    def handle(self, *args, **options):
+        product_id = options['product'] or Product.objects.values_list('pk', flat=True).first()
+        if product_id is None:
+            raise CommandError('No products; run add_sample_products first')
+        if get_channel_layer() is None:
+            raise CommandError('CHANNEL_LAYERS is not configured')
+        asyncio.run(self.run(product_id, options['sockets'], options['events']))
+
+    async def run(self, product_id, sockets, events):
+        application = URLRouter(websocket_urlpatterns)
+        communicators = [WebsocketCommunicator(application, f'/ws/stock/{product_id}/') for _ in range(sockets)]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(communicator.connect(timeout=30) for communicator in communicators))
+        if not all(connected for connected, _ in results):
+            raise CommandError('Some sockets were refused')
+        await asyncio.gather(*(communicator.receive_json_from(timeout=30) for communicator in communicators))
+        connect_time = time.perf_counter() - started
+        self.stdout.write(f'{sockets} sockets connected in {connect_time:.2f}s ({sockets / connect_time:,.0f}/s)')
+
+        channel_layer = get_channel_layer()
+        latencies, missed = [], 0
+        for sequence in range(events):
+            sent = time.perf_counter()
+            await channel_layer.group_send(stock_group(product_id), {
+                'type': 'send.event', 'payload': {'type': 'stock', 'product_id': product_id, 'sequence': sequence},
+            })
+            received = await asyncio.gather(
+                *(communicator.receive_json_from(timeout=10) for communicator in communicators),
+                return_exceptions=True,
+            )
+            # Time until the last socket got the event.
+            latencies.append(time.perf_counter() - sent)
+            missed += sum(1 for message in received if isinstance(message, Exception))
+
+        await asyncio.gather(*(communicator.disconnect() for communicator in communicators))
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'{events} events x {sockets} sockets: fan-out p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+            f'p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms, {missed} missed deliveries'
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from spt.stock import find_stock_drift, reconcile_stock
+
+
+class Command(BaseCommand):
+    help = 'Repair drift between Product.total_stock/in_stock and variant stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted products')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        drifted = list(find_stock_drift().values_list('pk', flat=True))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} products have drifted stock totals')
+            return
+
+        repaired = 0
+        for start in range(0, len(drifted), batch_size):
+            with transaction.atomic():
+                repaired += reconcile_stock(drifted[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled stock totals for {repaired} products'))
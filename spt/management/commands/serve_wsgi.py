@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve WSGI_APPLICATION with Django's threaded WSGI server, without autoreload, "
+        'static files or request logging (runserver is the ASGI one while daphne is installed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+
+    def handle(self, *args, **options):
+        server = ThreadedWSGIServer((options['host'], options['port']), QuietWSGIRequestHandler)
+        server.set_app(get_internal_wsgi_application())
+        self.stdout.write(f"Serving WSGI on http://{options['host']}:{options['port']}/")
+        self.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
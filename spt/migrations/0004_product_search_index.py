@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from spt.search import install_product_search_index, uninstall_product_search_index
+
+
+def install(apps, schema_editor):
+    install_product_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_product_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spt', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:32
+
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+
+
+def populate_stock_totals(apps, schema_editor):
+    Product = apps.get_model('spt', 'Product')
+    ProductVariant = apps.get_model('spt', 'ProductVariant')
+    variant_total = Coalesce(Subquery(
+        ProductVariant.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(total=Sum('stock_quantity')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+    Product.objects.update(
+        total_stock=variant_total,
+        in_stock=Case(When(GreaterThan(variant_total, 0), then=Value(True)), default=Value(False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spt', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'created_at'], name='spt_product_in_stock_idx'),
+        ),
+        migrations.RunPython(populate_stock_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spt', '0012_product_stock_not_editable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='spt.product')),
+                ('document', models.TextField(db_column='spt_product_fts')),
+            ],
+            options={
+                'db_table': 'spt_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
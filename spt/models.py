@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
@@ -21,21 +24,44 @@ class ProductCategory(models.Model):
 class Product(models.Model):
     """Product Model"""
     name = models.CharField(max_length=200)
+    # Supplier key used by catalog imports (see spt.catalog_import)
+    sku = models.CharField(max_length=100, unique=True, blank=True, null=True)
     description = models.TextField()
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='products')
     base_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     image_url = models.URLField(blank=True, null=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # Sum of variant stock, maintained incrementally by spt.stock; never
+    # written by save() on an existing row (see below)
+    total_stock = models.IntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='spt_product_created_id_idx'),
+            models.Index(fields=['in_stock', 'created_at'], name='spt_product_in_stock_idx'),
+        ]
+
+    # Columns only spt.stock writes, with F() deltas
+    STOCK_FIELDS = ('total_stock', 'in_stock')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Writing back the in-memory counters would undo concurrent stock
+        # deltas, so updates leave them out unless named explicitly.
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STOCK_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_image_url(self):
         """Get image URL - prefer uploaded image, fallback to image_url"""
         if self.image:
@@ -44,7 +70,24 @@ class Product(models.Model):
 
     def get_total_stock(self):
         """Get total stock across all variants"""
-        return sum(v.stock_quantity for v in self.variants.all())
+        return self.total_stock
+
+
+class ProductSearchIndex(models.Model):
+    """A product's row in the FTS5 search index.
+
+    The table is created and kept in step by ``spt.search``; the model only
+    lets product queries join it (see ``ProductSearchFilter``).
+    """
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING, related_name='search_index',
+    )
+    # FTS5's hidden column named after the table, the operand of MATCH and bm25()
+    document = models.TextField(db_column='spt_product_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'spt_product_fts'
 
 
 class ProductVariant(models.Model):
@@ -68,10 +111,24 @@ class ProductVariant(models.Model):
     class Meta:
         ordering = ['variant_type', 'variant_name']
         unique_together = ['product', 'variant_name', 'variant_type']
+        indexes = [
+            models.Index(fields=['variant_type', 'variant_name', 'id'], name='spt_variant_ordering_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.variant_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stock()
+        return instance
+
+    def remember_stock(self):
+        """Snapshot product and stock so a later save can apply the delta"""
+        if 'product_id' in self.__dict__ and 'stock_quantity' in self.__dict__:
+            self._stock_snapshot = (self.product_id, self.stock_quantity)
+
 
 class Customer(models.Model):
     """Customer Profile Model"""
@@ -97,14 +154,38 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart of {self.user.username}"
 
+    def _summary_aggregates(self):
+        line_total = ExpressionWrapper(
+            F('quantity') * (
+                F('product__base_price')
+                + Coalesce(F('variant__additional_price'), Value(Decimal('0.00')))
+            ),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        return {'total': Sum(line_total), 'item_count': Sum('quantity')}
+
+    @staticmethod
+    def _format_summary(summary):
+        total = summary['total'] or Decimal('0.00')
+        return {
+            'total': total.quantize(Decimal('0.01')),
+            'item_count': summary['item_count'] or 0,
+        }
+
+    def get_summary(self):
+        """Cart total and item count from a single aggregate query"""
+        return self._format_summary(self.items.aggregate(**self._summary_aggregates()))
+
+    async def aget_summary(self):
+        return self._format_summary(await self.items.aaggregate(**self._summary_aggregates()))
+
     def get_total(self):
         """Calculate cart total"""
-        total = sum((item.get_item_total() for item in self.items.all()), Decimal('0.00'))
-        return total
+        return self.get_summary()['total']
 
     def get_item_count(self):
         """Get total items in cart"""
-        return sum((item.quantity for item in self.items.all()), 0)
+        return self.get_summary()['item_count']
 
 
 class CartItem(models.Model):
@@ -124,10 +205,10 @@ class CartItem(models.Model):
 
     def get_item_total(self):
         """Calculate total price for this item"""
-        price = Decimal(str(self.product.base_price))
+        price = self.product.base_price
         if self.variant:
-            price += Decimal(str(self.variant.additional_price))
-        return price * Decimal(str(self.quantity))
+            price += self.variant.additional_price
+        return price * self.quantity
 
 
 class Order(models.Model):
@@ -155,10 +236,26 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='spt_order_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='spt_order_created_id_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='spt_order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_status()
+        return instance
+
+    def remember_status(self):
+        """Snapshot status and tracking number so a later save can tell if they changed"""
+        if 'status' in self.__dict__ and 'tracking_number' in self.__dict__:
+            self._status_snapshot = (self.status, self.tracking_number)
+
 
 class OrderItem(models.Model):
     """Order Item Model"""
@@ -190,3 +287,71 @@ class Inventory(models.Model):
     def __str__(self):
         return f"Inventory: {self.variant.product.name} - {self.variant.variant_name}"
 
+
+class StockReservation(models.Model):
+    """Stock held for a cart while its owner checks out"""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['cart', 'variant']
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id} for cart {self.cart_id}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a request sent with an ``Idempotency-Key`` header"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+class OrderNumberSequence(models.Model):
+    """Named counter that order number blocks are allocated from"""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class DailySalesRollup(models.Model):
+    """Orders and revenue per day and status, maintained by spt.rollups"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ['date', 'status']
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.order_count}"
+
+
+class ProductDailySales(models.Model):
+    """Units sold and revenue per day and product, maintained by spt.rollups"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ['date', 'product']
+        verbose_name_plural = "Product daily sales"
+
+    def __str__(self):
+        return f"{self.date} {self.product_id}: {self.quantity}"
@@ -0,0 +1,184 @@
+"""
+Pagination classes for the spt API.
+
+``PageNumberPagination`` stays the default. Clients that walk a whole
+collection can ask for keyset (cursor) pagination with ``?pagination=cursor``
+or by following a ``next`` link carrying ``?cursor=``. Keyset pages seek
+directly to the last row seen instead of counting the table and scanning an
+``OFFSET``, and rows inserted while a client is paging never shift later pages.
+Keyset pages always follow the paginator's own ordering, so a request that
+also asks for another order (``?search=`` relevance, ``?ordering=``) gets 400.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """``Q`` selecting the rows strictly after ``values`` in ``ordering``.
+
+    ``ordering`` is a sequence of field names as passed to ``order_by``; the
+    last one must be unique (normally ``id``) so the order is total.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        clause = Q(**{f'{name}__{lookup}': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            clause &= Q(**{previous.lstrip('-'): value})
+        condition |= clause
+    return condition
+
+
+def encode_cursor(values):
+    def default(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+    payload = json.dumps(values, default=default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """The ``ordering`` values in ``cursor``, converted by ``model``'s fields.
+
+    A cursor that does not decode, or whose values the fields reject, raises
+    ``NotFound`` rather than failing later in the query.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise NotFound('Invalid cursor')
+    try:
+        values = [model._meta.get_field(field.lstrip('-')).to_python(value) for field, value in zip(ordering, values)]
+    except (TypeError, ValueError, ValidationError):
+        raise NotFound('Invalid cursor')
+    if any(value is None or isinstance(value, (list, dict)) for value in values):
+        raise NotFound('Invalid cursor')
+    return values
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only keyset pagination over a fixed, unique ``ordering``"""
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_page_queryset(self, queryset, request):
+        """The rows of the requested page plus one, to detect a next page"""
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+
+        # The cursor only encodes ``ordering``; an order picked by a filter
+        # backend (search relevance, ``?ordering=``) cannot be resumed.
+        if queryset.query.order_by and tuple(queryset.query.order_by) != tuple(self.ordering):
+            raise ParseError('Keyset pagination cannot be combined with search relevance or ?ordering=; use page numbers.')
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(keyset_filter(self.ordering, decode_cursor(cursor, queryset.model, self.ordering)))
+        return queryset[:self.current_page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.current_page_size
+        self.page = rows[:self.current_page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(values))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def wants_keyset(request, cursor_query_param='cursor'):
+    """Whether the request selected keyset pagination"""
+    return (
+        request.query_params.get('pagination') == 'cursor'
+        or cursor_query_param in request.query_params
+    )
+
+
+class SelectablePagination(PageNumberPagination):
+    """Page-number pagination unless the request selects keyset pagination"""
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if wants_keyset(request, self.keyset_class.cursor_query_param):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CreatedAtKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class VariantKeysetPagination(KeysetPagination):
+    ordering = ('variant_type', 'variant_name', 'id')
+
+
+class ProductPagination(SelectablePagination):
+    keyset_class = CreatedAtKeysetPagination
+
+
+class VariantPagination(SelectablePagination):
+    keyset_class = VariantKeysetPagination
@@ -0,0 +1,161 @@
+"""
+Time-limited stock reservations backed by the ``Inventory`` model.
+
+When a buyer starts checkout, ``reserve_cart`` holds the stock for every
+variant line of their cart until ``expires_at``. ``Inventory`` keeps the
+counters per variant:
+
+* ``total_stock`` mirrors ``ProductVariant.stock_quantity``;
+* ``reserved_stock`` is the sum of unreleased reservations;
+* ``available_stock`` is ``total_stock - reserved_stock``.
+
+Counters only ever move with ``F()`` updates, and a cart's reservations are
+taken with one ``UPDATE ... WHERE available_stock >= n`` (``n`` picked per
+row by a ``CASE``), so concurrent reservations cannot promise the same units
+twice. Checkout consumes a cart's reservations instead of re-validating
+those lines (see ``spt.checkout``), and ``manage.py expire_reservations``
+returns expired holds in batches.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Inventory, ProductVariant, StockReservation
+from .stock import delta_case, take_stock
+
+DEFAULT_TTL = 15 * 60
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL))
+
+
+def ensure_inventory(variant_ids):
+    """Create missing ``Inventory`` rows, seeded from the variants' stock"""
+    existing = set(Inventory.objects.filter(variant_id__in=variant_ids).values_list('variant_id', flat=True))
+    missing = set(variant_ids) - existing
+    if not missing:
+        return
+    Inventory.objects.bulk_create(
+        [
+            Inventory(variant_id=pk, total_stock=stock, reserved_stock=0, available_stock=stock)
+            for pk, stock in ProductVariant.objects.filter(pk__in=missing).values_list('pk', 'stock_quantity')
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def release_quantities(released, consumed=None):
+    """Return reserved units to the pool.
+
+    ``released`` maps variant ids to the reserved units being dropped.
+    ``consumed`` maps variant ids to how many of those units were sold: they
+    leave ``total_stock`` instead of going back to ``available_stock``.
+    """
+    consumed = consumed or {}
+    released = {key: quantity for key, quantity in released.items() if quantity}
+    if not released:
+        return
+    returned = {key: quantity - consumed.get(key, 0) for key, quantity in released.items()}
+    Inventory.objects.filter(variant_id__in=released).update(
+        reserved_stock=F('reserved_stock') - delta_case('variant_id', released),
+        available_stock=F('available_stock') + delta_case('variant_id', returned),
+        total_stock=F('total_stock') - delta_case('variant_id', consumed),
+    )
+
+
+def release_cart_reservations(cart):
+    """Drop every reservation held by ``cart``"""
+    with transaction.atomic():
+        rows = list(cart.reservations.values_list('pk', 'variant_id', 'quantity'))
+        if not rows:
+            return
+        release_quantities({variant_id: quantity for _, variant_id, quantity in rows})
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+
+
+def reserve_cart(cart, ttl=None):
+    """Hold stock for every variant line of ``cart``.
+
+    Existing reservations of the cart are replaced, which also extends the
+    TTL. Raises ``spt.checkout.InsufficientStock`` listing every line that
+    cannot be held; in that case no stock is reserved.
+    """
+    from .checkout import InsufficientStock, shortage_line
+
+    expires_at = timezone.now() + (ttl or get_reservation_ttl())
+    with transaction.atomic():
+        release_cart_reservations(cart)
+
+        items = list(cart.items.filter(variant__isnull=False).select_related('product', 'variant'))
+        requested = defaultdict(int)
+        for item in items:
+            requested[item.variant_id] += item.quantity
+        ensure_inventory(list(requested))
+
+        # One UPDATE holds every line, or none if any lacks the stock.
+        if requested:
+            quantities = delta_case('variant_id', requested)
+            short = take_stock(
+                Inventory.objects.filter(variant_id__in=requested, available_stock__gte=quantities),
+                requested, 'variant_id', 'available_stock',
+                reserved_stock=F('reserved_stock') + quantities,
+                available_stock=F('available_stock') - quantities,
+                updated_at=timezone.now(),
+            )
+            if short:
+                raise InsufficientStock([
+                    shortage_line(item, short[item.variant_id]) for item in items if item.variant_id in short
+                ])
+
+        return StockReservation.objects.bulk_create([
+            StockReservation(cart=cart, variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+            for variant_id, quantity in requested.items()
+        ])
+
+
+def expire_reservations(batch_size=1000, now=None):
+    """Release expired reservations in batches; returns how many were released"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', 'variant_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return released
+            quantities = defaultdict(int)
+            for _, variant_id, quantity in batch:
+                quantities[variant_id] += quantity
+            release_quantities(quantities)
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in batch]).delete()
+        released += len(batch)
+
+
+def reconcile_inventory(variant_ids=None):
+    """Recompute ``Inventory`` rows (all, or those of ``variant_ids``) from variant stock and live reservations"""
+    reserved = Coalesce(Subquery(
+        StockReservation.objects.filter(variant=OuterRef('variant')).order_by().values('variant')
+        .annotate(total=Sum('quantity')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+    stock = Subquery(
+        ProductVariant.objects.filter(pk=OuterRef('variant')).values('stock_quantity')[:1],
+        output_field=IntegerField(),
+    )
+    inventory = Inventory.objects.all()
+    if variant_ids is not None:
+        inventory = inventory.filter(variant_id__in=variant_ids)
+    return inventory.update(
+        total_stock=stock,
+        reserved_stock=reserved,
+        available_stock=stock - reserved,
+    )
@@ -0,0 +1,159 @@
+"""
+Daily sales rollups read by the admin dashboard.
+
+``DailySalesRollup`` holds the order count and revenue per day and status, and
+``ProductDailySales`` the units and revenue per day and product. They are kept
+current in the same transaction as the write that changes them:
+
+* a new order adds to its day and status (``spt.signals``);
+* order lines add to their products when saved, or through
+  ``record_order_items`` for checkout's ``bulk_create``;
+* a status change moves the order between status rows;
+* deleting an order subtracts it and its lines.
+
+Counters are only ever incremented, with ``INSERT ... ON CONFLICT DO UPDATE``
+where the backend supports it, so concurrent checkouts never lose an update.
+Writes that bypass the ORM hooks (``QuerySet.update`` of statuses, editing
+order lines) are repaired by ``manage.py backfill_sales_rollups``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connections, router, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Order, OrderItem, ProductDailySales
+
+
+def sale_date(order):
+    return timezone.localdate(order.created_at)
+
+
+def line_revenue():
+    """Expression for an order line's revenue"""
+    return ExpressionWrapper(
+        (F('price_at_purchase') + F('variant_price_at_purchase')) * F('quantity'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def _upsert_add(model, keys, fields, rows, connection):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = [*keys, *fields]
+    db_fields = [model._meta.get_field(name) for name in names]
+    column = {name: qn(field.column) for name, field in zip(names, db_fields)}
+    updates = ', '.join(f'{column[name]} = {table}.{column[name]} + excluded.{column[name]}' for name in fields)
+    sql = (
+        f'INSERT INTO {table} ({", ".join(column.values())}) VALUES ({", ".join(["%s"] * len(names))}) '
+        f'ON CONFLICT ({", ".join(column[name] for name in keys)}) DO UPDATE SET {updates}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(row[name], connection) for name, field in zip(names, db_fields)]
+            for row in rows
+        ])
+
+
+def add_to_rollup(model, keys, fields, rows):
+    """Add each row's ``fields`` onto the rollup row matching its ``keys``"""
+    rows = [row for row in rows if any(row[name] for name in fields)]
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.features.supports_update_conflicts_with_target:
+            _upsert_add(model, keys, fields, rows, connection)
+            return
+        for row in rows:
+            updated = model.objects.filter(**{name: row[name] for name in keys}).update(
+                **{name: F(name) + row[name] for name in fields}
+            )
+            if not updated:
+                model.objects.create(**row)
+
+
+def _add_orders(rows):
+    add_to_rollup(DailySalesRollup, ('date', 'status'), ('order_count', 'revenue'), rows)
+
+
+def _add_products(rows):
+    add_to_rollup(ProductDailySales, ('date', 'product_id'), ('quantity', 'revenue'), rows)
+
+
+def record_order(order, sign=1):
+    _add_orders([{
+        'date': sale_date(order), 'status': order.status,
+        'order_count': sign, 'revenue': sign * order.total_amount,
+    }])
+
+
+def record_order_items(order, items, sign=1):
+    """Add ``items`` (lines of ``order``) to their products' daily sales"""
+    date = sale_date(order)
+    totals = defaultdict(lambda: [0, Decimal('0.00')])
+    for item in items:
+        totals[item.product_id][0] += item.quantity
+        totals[item.product_id][1] += (item.price_at_purchase + item.variant_price_at_purchase) * item.quantity
+    _add_products([
+        {'date': date, 'product_id': product_id, 'quantity': sign * quantity, 'revenue': sign * revenue}
+        for product_id, (quantity, revenue) in totals.items()
+    ])
+
+
+def move_order_status(order, old_status):
+    date = sale_date(order)
+    _add_orders([
+        {'date': date, 'status': old_status, 'order_count': -1, 'revenue': -order.total_amount},
+        {'date': date, 'status': order.status, 'order_count': 1, 'revenue': order.total_amount},
+    ])
+
+
+def remove_order(order):
+    record_order(order, sign=-1)
+    record_order_items(order, order.items.only('product_id', 'quantity', 'price_at_purchase', 'variant_price_at_purchase'), sign=-1)
+
+
+def rebuild_rollups(since=None, batch_size=1000):
+    """Recompute both rollups from orders, for days from ``since`` (all when None)"""
+    orders = Order.objects.all()
+    items = OrderItem.objects.all()
+    daily = DailySalesRollup.objects.all()
+    products = ProductDailySales.objects.all()
+    if since is not None:
+        orders = orders.filter(created_at__date__gte=since)
+        items = items.filter(order__created_at__date__gte=since)
+        daily = daily.filter(date__gte=since)
+        products = products.filter(date__gte=since)
+
+    order_rows = (
+        orders.annotate(day=TruncDate('created_at')).values('day', 'status')
+        .annotate(order_count=Count('pk'), total=Sum('total_amount')).order_by()
+    )
+    item_rows = (
+        items.annotate(day=TruncDate('order__created_at')).values('day', 'product_id')
+        .annotate(units=Sum('quantity'), total=Sum(line_revenue())).order_by()
+    )
+    with transaction.atomic():
+        daily.delete()
+        products.delete()
+        _bulk_insert(DailySalesRollup, (
+            DailySalesRollup(date=row['day'], status=row['status'],
+                             order_count=row['order_count'], revenue=row['total'] or 0)
+            for row in order_rows.iterator()
+        ), batch_size)
+        _bulk_insert(ProductDailySales, (
+            ProductDailySales(date=row['day'], product_id=row['product_id'],
+                              quantity=row['units'] or 0, revenue=row['total'] or 0)
+            for row in item_rows.iterator()
+        ), batch_size)
+
+
+def _bulk_insert(model, objects, batch_size):
+    # bulk_create materializes its input; feed it one batch at a time.
+    while batch := list(islice(objects, batch_size)):
+        model.objects.bulk_create(batch)
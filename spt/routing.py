@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .consumers import OrderConsumer, StockConsumer
+
+websocket_urlpatterns = [
+    path('ws/orders/<int:order_id>/', OrderConsumer.as_asgi()),
+    path('ws/stock/<int:product_id>/', StockConsumer.as_asgi()),
+]
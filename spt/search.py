@@ -0,0 +1,126 @@
+"""
+Full-text search index for products.
+
+On SQLite the product name and description are indexed in an FTS5 virtual
+table using ``spt_product`` as its external content. Triggers keep the index
+in step with every insert, update and delete, including bulk writes that
+bypass model signals. Other database backends have no index and search falls
+back to ``SearchFilter``'s ``icontains`` lookups.
+"""
+import re
+
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+from django.db.models import BooleanField, F, FloatField, Func, Value
+
+FTS_TABLE = 'spt_product_fts'
+
+CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, description,
+    content='spt_product', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON spt_product BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+END
+""",
+    f'{FTS_TABLE}_ad': f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON spt_product BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+END
+""",
+    f'{FTS_TABLE}_au': f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON spt_product BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+END
+""",
+}
+
+_available = {}
+
+
+def install_product_search_index(connection):
+    """Create the FTS5 table and triggers if they are missing.
+
+    SQLite drops a table's triggers whenever Django rebuilds it for a schema
+    change, so this also runs after every ``migrate``; when any piece had to be
+    recreated the index is rebuilt from ``spt_product``. Returns False when the
+    backend has no FTS5 support.
+    """
+    _available.pop(connection.alias, None)
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        expected = {FTS_TABLE, *TRIGGERS}
+        placeholders = ', '.join(['%s'] * len(expected))
+        cursor.execute(f'SELECT name FROM sqlite_master WHERE name IN ({placeholders})', sorted(expected))
+        if {row[0] for row in cursor.fetchall()} == expected:
+            return True
+        try:
+            cursor.execute(CREATE_TABLE)
+        except OperationalError:
+            # SQLite compiled without FTS5.
+            return False
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_product_search_index(connection):
+    _available.pop(connection.alias, None)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def search_index_available(using=DEFAULT_DB_ALIAS):
+    """Whether the FTS5 product index exists on the ``using`` database"""
+    if using not in _available:
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            _available[using] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _available[using] = cursor.fetchone() is not None
+    return _available[using]
+
+
+def build_match_expression(terms):
+    """FTS5 query matching every term as a prefix.
+
+    Each word is quoted so user input can never be parsed as FTS5 syntax.
+    Returns an empty string when no searchable words remain.
+    """
+    words = []
+    for term in terms:
+        words.extend(re.findall(r'\w+', term))
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+class SearchMatch(Func):
+    """Products whose joined FTS5 index row matches a match expression"""
+    template = '%(expressions)s'
+    arg_joiner = ' MATCH '
+    output_field = BooleanField()
+
+    def __init__(self, match):
+        super().__init__(F('search_index__document'), Value(match))
+
+
+class SearchRank(Func):
+    """bm25 relevance from the joined FTS5 index row (lower is better)"""
+    function = 'bm25'
+    output_field = FloatField()
+
+    def __init__(self):
+        super().__init__(F('search_index__document'))
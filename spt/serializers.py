@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING, Any
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import (
     ProductCategory, Product, ProductVariant, Customer,
     Cart, CartItem, Order, OrderItem
@@ -17,6 +18,11 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         model = ProductVariant
         fields = ['id', 'variant_name', 'variant_type', 'additional_price', 'stock_quantity', 'sku']
 
+    @classmethod
+    def get_eager_queryset(cls):
+        """Variant queryset restricted to the columns this serializer emits"""
+        return ProductVariant.objects.only('product', *cls.Meta.fields)
+
 
 class ProductSerializer(serializers.ModelSerializer):
     variants = ProductVariantSerializer(many=True, read_only=True)
@@ -24,7 +30,19 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'category', 'category_name', 'base_price', 'image_url', 'is_active', 'variants', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'category', 'category_name', 'base_price', 'image_url', 'is_active', 'total_stock', 'in_stock', 'variants', 'created_at', 'updated_at']
+        read_only_fields = ['total_stock', 'in_stock']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load every relation rendered by this serializer up front.
+
+        Any new field that follows a relation must be added here, otherwise
+        it will issue one query per product.
+        """
+        return queryset.select_related('category').prefetch_related(
+            Prefetch('variants', queryset=ProductVariantSerializer.get_eager_queryset())
+        )
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -51,11 +69,52 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'items', 'total', 'item_count', 'created_at', 'updated_at']
 
+    @staticmethod
+    def get_prefetches():
+        """Prefetches covering every relation rendered for the cart's items"""
+        return [Prefetch('items', queryset=CartItem.objects.select_related('product', 'variant'))]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.prefetch_related(*cls.get_prefetches())
+
+    def to_representation(self, instance):
+        # total and item_count share one aggregate query; async views pass
+        # the summary in the context instead.
+        self._summary = self.context.get('summary') or instance.get_summary()
+        return super().to_representation(instance)
+
     def get_total(self, obj: Cart) -> Any:
-        return obj.get_total()
+        return self._summary['total']
 
     def get_item_count(self, obj: Cart) -> int:
-        return obj.get_item_count()
+        return self._summary['item_count']
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """One line of a batch cart mutation"""
+    OPERATIONS = ['add', 'set', 'remove']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.IntegerField(required=False)
+    variant_id = serializers.IntegerField(required=False, allow_null=True)
+    item_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(required=False, default=1)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'remove':
+            if 'item_id' not in attrs and 'product_id' not in attrs:
+                raise serializers.ValidationError('remove requires item_id or product_id')
+        else:
+            if 'product_id' not in attrs:
+                raise serializers.ValidationError(f"{attrs['op']} requires product_id")
+            if attrs['op'] == 'add' and attrs['quantity'] < 1:
+                raise serializers.ValidationError('add requires a positive quantity')
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -79,6 +138,15 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'order_number', 'username', 'status', 'total_amount', 'shipping_address', 'shipping_city', 'shipping_state', 'shipping_pincode', 'tracking_number', 'items', 'created_at', 'updated_at']
 
+    @staticmethod
+    def get_prefetches():
+        """Prefetches covering every relation rendered for the order's items"""
+        return [Prefetch('items', queryset=OrderItem.objects.select_related('product', 'variant'))]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related('user').prefetch_related(*cls.get_prefetches())
+
 
 class CustomerSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
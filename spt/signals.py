@@ -0,0 +1,101 @@
+"""
+Model signal handlers for the spt app
+"""
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .events import publish_order
+from .search import install_product_search_index
+from .stock import apply_stock_changes
+from .models import ProductCategory, Product, ProductVariant, Order, OrderItem
+from .rollups import move_order_status, record_order, record_order_items, remove_order
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Bump the catalog version once the change is committed"""
+    transaction.on_commit(bump_catalog_version, robust=True)
+
+
+def ensure_product_search_index(using, **kwargs):
+    """Restore search triggers dropped by table rebuilds during ``migrate``"""
+    install_product_search_index(connections[using])
+
+
+@receiver(pre_save, sender=ProductVariant)
+def snapshot_variant_stock(sender, instance, raw=False, **kwargs):
+    """Load the stored stock of variants saved without being fetched first"""
+    if raw or instance._state.adding or hasattr(instance, '_stock_snapshot'):
+        return
+    stored = ProductVariant.objects.filter(pk=instance.pk).values_list('product_id', 'stock_quantity').first()
+    if stored is not None:
+        instance._stock_snapshot = stored
+
+
+@receiver(post_save, sender=ProductVariant)
+def track_variant_stock(sender, instance, created, raw=False, **kwargs):
+    """Propagate a variant's stock change to its product's totals"""
+    if raw:
+        return
+    old_product_id, old_stock = (None, 0) if created else getattr(instance, '_stock_snapshot', (None, 0))
+    changes = [(instance.pk, instance.product_id, instance.stock_quantity)]
+    if old_product_id is not None:
+        changes.append((instance.pk, old_product_id, -old_stock))
+    apply_stock_changes(changes)
+    instance.remember_stock()
+
+
+@receiver(post_delete, sender=ProductVariant)
+def release_variant_stock(sender, instance, origin=None, **kwargs):
+    # ``origin`` is what delete() was called on. Cascading from a product or
+    # category, the product (and the variant's Inventory row) goes too, so
+    # there is no counter left to adjust.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Product, ProductCategory):
+        return
+    apply_stock_changes([(instance.pk, instance.product_id, -instance.stock_quantity)])
+
+
+@receiver(pre_save, sender=Order)
+def snapshot_order_status(sender, instance, raw=False, **kwargs):
+    """Load the stored status of orders saved without being fetched first"""
+    if raw or instance._state.adding or hasattr(instance, '_status_snapshot'):
+        return
+    stored = Order.objects.filter(pk=instance.pk).values_list('status', 'tracking_number').first()
+    if stored is not None:
+        instance._status_snapshot = stored
+
+
+@receiver(post_save, sender=Order)
+def track_order_status(sender, instance, created, raw=False, **kwargs):
+    """Keep the sales rollups in step and push changes to the order's trackers"""
+    if raw:
+        return
+    if created:
+        record_order(instance)
+    else:
+        old = getattr(instance, '_status_snapshot', None)
+        if old != (instance.status, instance.tracking_number):
+            if old is not None and old[0] != instance.status:
+                move_order_status(instance, old[0])
+            publish_order(instance)
+    instance.remember_status()
+
+
+@receiver(post_save, sender=OrderItem)
+def track_order_item_sales(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_order_items(instance.order, [instance])
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_sales(sender, instance, **kwargs):
+    remove_order(instance)
@@ -0,0 +1,130 @@
+"""
+Incremental maintenance of denormalized stock counters.
+
+``Product.total_stock`` and ``Product.in_stock`` mirror the sum of the
+product's ``ProductVariant.stock_quantity``, and ``Inventory.total_stock``
+mirrors the variant's own stock (see ``spt.reservations``). Every path that
+changes variant stock reports the change here as a ``(variant_id, product_id,
+delta)`` tuple: model saves and deletes through ``spt.signals``, and bulk
+writes (checkout) by calling ``apply_stock_changes`` directly. Catalog imports,
+which touch thousands of variants at once, recompute the affected totals with
+``reconcile_stock`` instead.
+Counters are adjusted with ``F()`` expressions in one ``UPDATE`` per table, so
+concurrent writers never overwrite each other, and the new figures are pushed
+to stock subscribers (``spt.events``). ``manage.py reconcile_stock`` repairs
+any drift.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .events import publish_stock
+from .models import Inventory, Product, ProductVariant
+
+
+def delta_case(field, deltas):
+    """``CASE`` picking each row's delta from ``{key: delta}`` by ``field``"""
+    return Case(
+        *[When(**{field: key}, then=Value(delta)) for key, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def take_stock(rows, requested, key, available, **values):
+    """Run the guarded ``UPDATE`` of ``rows`` in a savepoint.
+
+    ``requested`` maps ``key`` values to quantities. Returns ``{}`` when every
+    row was updated. Otherwise the update is rolled back and the rows whose
+    ``available`` column is still below their quantity are returned, mapped
+    to what is left.
+    """
+    while True:
+        savepoint = transaction.savepoint()
+        if rows.update(**values) == len(requested):
+            transaction.savepoint_commit(savepoint)
+            return {}
+        transaction.savepoint_rollback(savepoint)
+        short = {
+            pk: stock for pk, stock in rows.model.objects.filter(**{f'{key}__in': requested})
+            .values_list(key, available) if stock < requested[pk]
+        }
+        # Empty only if stock was added since the update; try again.
+        if short:
+            return short
+
+
+def apply_stock_changes(changes, inventory=True):
+    """Apply ``(variant_id, product_id, delta)`` stock changes to the counters.
+
+    Pass ``inventory=False`` when the caller has already adjusted the
+    variants' ``Inventory`` rows itself (checkout does, to honour
+    reservations).
+    """
+    per_product = defaultdict(int)
+    per_variant = defaultdict(int)
+    for variant_id, product_id, delta in changes:
+        if product_id is not None:
+            per_product[product_id] += delta
+        if variant_id is not None:
+            per_variant[variant_id] += delta
+    per_product = {key: delta for key, delta in per_product.items() if delta}
+    per_variant = {key: delta for key, delta in per_variant.items() if delta}
+
+    if per_product:
+        new_total = F('total_stock') + delta_case('pk', per_product)
+        # in_stock is derived from the same new-total expression rather than
+        # from the column being written. It is assigned first because some
+        # backends (MySQL) apply SET clauses left to right, so a later clause
+        # would read the already updated total.
+        Product.objects.filter(pk__in=per_product).update(
+            in_stock=Case(When(GreaterThan(new_total, 0), then=Value(True)), default=Value(False)),
+            total_stock=new_total,
+            updated_at=timezone.now(),
+        )
+        transaction.on_commit(bump_catalog_version, robust=True)
+        publish_stock(per_product, per_variant)
+
+    if inventory and per_variant:
+        variant_delta = delta_case('variant_id', per_variant)
+        Inventory.objects.filter(variant_id__in=per_variant).update(
+            total_stock=F('total_stock') + variant_delta,
+            available_stock=F('available_stock') + variant_delta,
+        )
+
+
+def variant_stock_total():
+    """Expression for a product's stock summed from its variants"""
+    return Coalesce(Subquery(
+        ProductVariant.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(total=Sum('stock_quantity')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def find_stock_drift():
+    """Products whose stored totals disagree with their variants"""
+    actual = variant_stock_total()
+    return Product.objects.alias(actual_stock=actual).filter(
+        ~Q(total_stock=F('actual_stock'))
+        | Q(in_stock=True, actual_stock__lte=0)
+        | Q(in_stock=False, actual_stock__gt=0)
+    )
+
+
+def reconcile_stock(product_ids):
+    """Recompute totals for ``product_ids`` from their variants"""
+    actual = variant_stock_total()
+    updated = Product.objects.filter(pk__in=product_ids).update(
+        total_stock=actual,
+        in_stock=Case(When(GreaterThan(actual, 0), then=Value(True)), default=Value(False)),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        transaction.on_commit(bump_catalog_version, robust=True)
+    return updated
@@ -1,3 +1,1568 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import checkout, events, idempotency, instrumentation
+from .cache import check_catalog_cache, get_cache_stats, single_flight
+from .catalog_import import CatalogImporter
+from .exports import ExportError, export_queryset
+from .admin_views import dashboard_context
+from .channel_layers import SQLiteChannelLayer
+from .models import (
+    ProductCategory, Product, ProductVariant, Cart, CartItem, Order, Inventory, StockReservation,
+    IdempotencyKey, DailySalesRollup, ProductDailySales, OrderItem, Customer,
+)
+from .idempotency import expire_idempotency_keys
+from .instrumentation import QueryRecorder, get_query_stats, reset_query_stats
+from .order_numbers import BlockSequence, order_sequence
+from .pagination import encode_cursor
+from .reservations import expire_reservations
+from .rollups import rebuild_rollups
+from .stock import find_stock_drift
+from .routing import websocket_urlpatterns
+from .urls import router, urlpatterns
+
+
+def make_catalog(products=3, variants_per_product=2, category_name='Cement'):
+    """Create a small catalog and return the category"""
+    category, _ = ProductCategory.objects.get_or_create(name=category_name)
+    for i in range(products):
+        product = Product.objects.create(
+            name=f'{category_name} product {i}',
+            description=f'{category_name} description {i}',
+            category=category,
+            base_price=Decimal('100.00') + i,
+        )
+        for j in range(variants_per_product):
+            ProductVariant.objects.create(
+                product=product,
+                variant_name=f'Grade {j}',
+                variant_type='MATERIAL',
+                additional_price=Decimal(j),
+                stock_quantity=10,
+                sku=f'{category_name}-{product.id}-{j}',
+            )
+    return category
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductQueryPlanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_product_list_query_count_is_constant(self):
+        make_catalog(products=1)
+        small = self.count_queries('/api/products/')
+        make_catalog(products=15, category_name='Bricks')
+        self.assertEqual(self.count_queries('/api/products/'), small)
+
+    def test_by_category_query_count_is_constant(self):
+        category = make_catalog(products=1)
+        url = f'/api/products/by_category/?category_id={category.id}'
+        small = self.count_queries(url)
+        make_catalog(products=15)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_by_category_requires_category_id(self):
+        response = self.client.get('/api/products/by_category/')
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTestsMixin:
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        make_catalog(products=2)
+
+    def test_second_request_is_a_hit(self):
+        first = self.client.get('/api/products/')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/products/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(first.json(), second.json())
+        stats = get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_write_invalidates_cached_responses(self):
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductCategory.objects.create(name='Bricks')
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(get_cache_stats()['misses'], 2)
+
+
+class LocMemCatalogCacheTests(CatalogCacheTestsMixin, TestCase):
+    def test_per_process_backend_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_catalog_cache(None)], ['spt.W001'])
+        with override_settings(CATALOG_CACHE_ENABLED=False):
+            self.assertEqual(check_catalog_cache(None), [])
+
+
+class FileBasedCatalogCacheTests(CatalogCacheTestsMixin, TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cache_dir,
+            }
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+    def test_shared_backend_passes_check(self):
+        self.assertEqual(check_catalog_cache(None), [])
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        make_catalog(products=2)
+
+    def test_matching_etag_returns_304(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_variant_change_changes_product_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        ProductVariant.objects.first().delete()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_retrieve_is_conditional(self):
+        user = User.objects.create_user('buyer', password='pw')
+        order = Order.objects.create(
+            user=user, order_number='ORD-1', total_amount=Decimal('10.00'),
+            shipping_address='a', shipping_city='b', shipping_state='c', shipping_pincode='1',
+        )
+        self.client.force_authenticate(user)
+        url = f'/api/orders/{order.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        order.status = 'SHIPPED'
+        order.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        make_catalog(products=5, variants_per_product=3)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+        return seen
+
+    def test_walks_products_in_page_number_order(self):
+        expected = [p['id'] for p in self.client.get('/api/products/?page_size=100').json()['results']]
+        self.assertEqual(self.walk('/api/products/?pagination=cursor&page_size=2'), expected)
+
+    def test_walks_variants_in_meta_ordering(self):
+        expected = list(ProductVariant.objects.order_by('variant_type', 'variant_name', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/variants/?pagination=cursor&page_size=4'), expected)
+
+    def test_inserts_do_not_shift_later_pages(self):
+        first = self.client.get('/api/products/?pagination=cursor&page_size=2').json()
+        make_catalog(products=2, category_name='Bricks')
+        second = self.client.get(first['next']).json()
+        ids = {item['id'] for item in first['results']} | {item['id'] for item in second['results']}
+        self.assertEqual(len(ids), 4)
+        self.assertFalse(Product.objects.filter(id__in=ids, category__name='Bricks').exists())
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/products/?cursor=garbage').status_code, 404)
+
+    def test_keyset_rejects_another_requested_order(self):
+        for query in ('search=cement', 'ordering=base_price', 'ordering=-created_at'):
+            response = self.client.get(f'/api/products/?pagination=cursor&{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(self.client.get(f'/api/products/?{query}').status_code, 200, query)
+        self.assertEqual(self.client.get('/api/variants/?pagination=cursor&search=Grade').status_code, 200)
+
+    def test_wrong_typed_cursor_values_are_404(self):
+        for values in (['x', 'y'], [None, None], [{'a': 1}, 1], ['2020-01-01', 'abc'], ['2020-01-01', [1]]):
+            cursor = encode_cursor(values)
+            self.assertEqual(self.client.get(f'/api/products/?cursor={cursor}').status_code, 404, values)
+        staff = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/api/admin-orders/', {'after': encode_cursor(['x', 'abc'])}).status_code, 404)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = ProductCategory.objects.create(name='Cement')
+        self.portland = Product.objects.create(
+            name='Portland Cement 50kg', description='General purpose cement',
+            category=category, base_price=Decimal('350.00'),
+        )
+        self.white = Product.objects.create(
+            name='White Cement', description='Decorative finish',
+            category=category, base_price=Decimal('500.00'),
+        )
+        Product.objects.create(
+            name='Clay Bricks', description='Standard red bricks',
+            category=category, base_price=Decimal('4500.00'),
+        )
+
+    def search(self, term):
+        response = self.client.get('/api/products/', {'search': term})
+        return [item['id'] for item in response.json()['results']]
+
+    def test_prefix_match(self):
+        self.assertCountEqual(self.search('cem'), [self.portland.id, self.white.id])
+        self.assertEqual(self.search('portl cem'), [self.portland.id])
+
+    def test_ranked_by_relevance(self):
+        # "cement" appears in both fields of the Portland product.
+        self.assertEqual(self.search('cement'), [self.portland.id, self.white.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.white.name = 'Pigment'
+        self.white.description = 'Colour additive'
+        self.white.save()
+        self.portland.delete()
+        self.assertEqual(self.search('cement'), [])
+        self.assertEqual(self.search('pigm'), [self.white.id])
+
+    def test_fts_syntax_in_input_is_not_interpreted(self):
+        self.assertEqual(self.search('"cement" OR NEAR('), [])
+
+    def test_index_is_joined_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('cement')
+        page = next(query['sql'] for query in queries.captured_queries if 'bm25' in query['sql'])
+        self.assertEqual(page.count(' MATCH '), 1)
+        self.assertIn('INNER JOIN "spt_product_fts"', page)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        make_catalog(products=3, variants_per_product=2)
+        bricks = make_catalog(products=1, variants_per_product=1, category_name='Bricks')
+        Product.objects.filter(category=bricks).update(base_price=Decimal('4500.00'))
+
+    def test_facets_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/facets/')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        data = response.json()
+        self.assertEqual([(c['name'], c['count']) for c in data['category']], [('Cement', 3), ('Bricks', 1)])
+        self.assertEqual(data['variant_type'], [{'value': 'MATERIAL', 'count': 4}])
+        self.assertEqual(data['variant'][0], {'variant_type': 'MATERIAL', 'variant_name': 'Grade 0', 'count': 4})
+        self.assertEqual(
+            [(b['bucket'], b['count']) for b in data['price']],
+            [('0-100', 0), ('100-500', 3), ('500-1000', 0), ('1000-5000', 1), ('5000+', 0)],
+        )
+
+    def test_facets_follow_search(self):
+        data = self.client.get('/api/products/facets/', {'search': 'bricks'}).json()
+        self.assertEqual([(c['name'], c['count']) for c in data['category']], [('Bricks', 1)])
+
+
+class StockTotalTests(TestCase):
+    def setUp(self):
+        make_catalog(products=1, variants_per_product=2)
+        self.product = Product.objects.get()
+
+    def test_variant_writes_maintain_totals(self):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock), (20, True))
+
+        variant = self.product.variants.first()
+        variant.stock_quantity = 0
+        variant.save()
+        variant.stock_quantity = 5
+        variant.save()
+        ProductVariant.objects.exclude(pk=variant.pk).delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock), (5, True))
+
+        deferred = ProductVariant.objects.only('id').get(pk=variant.pk)
+        deferred.stock_quantity = 0
+        deferred.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock), (0, False))
+
+    def test_product_save_keeps_concurrent_stock_deltas(self):
+        stale = Product.objects.get()
+        variant = self.product.variants.first()
+        variant.stock_quantity = 40
+        variant.save()
+        stale.name = 'Renamed'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.total_stock, self.product.in_stock), ('Renamed', 50, True))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', password='pw', is_staff=True))
+        response = client.patch(f'/api/products/{self.product.id}/', {'total_stock': 0, 'in_stock': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock), (50, True))
+
+    def test_in_stock_filter(self):
+        make_catalog(products=1, variants_per_product=0, category_name='Bricks')
+        client = APIClient()
+        with override_settings(CATALOG_CACHE_ENABLED=False):
+            ids = [p['id'] for p in client.get('/api/products/?in_stock=true').json()['results']]
+        self.assertEqual(ids, [self.product.id])
+
+    def test_reconcile_command_repairs_drift(self):
+        from django.core.management import call_command
+        Product.objects.update(total_stock=999, in_stock=False)
+        call_command('reconcile_stock', stdout=open('/dev/null', 'w'))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock), (20, True))
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_catalog(products=5, variants_per_product=2)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill(self, count):
+        variants = ProductVariant.objects.select_related('product').exclude(cartitem__cart=self.cart)
+        for variant in variants[:count]:
+            CartItem.objects.create(cart=self.cart, product=variant.product, variant=variant, quantity=3)
+
+    def test_cart_total_and_count(self):
+        product = Product.objects.first()
+        CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        self.fill(2)
+        expected = product.base_price * 2 + sum(
+            (item.get_item_total() for item in self.cart.items.exclude(variant=None)), Decimal('0.00')
+        )
+        data = self.client.get('/api/cart/').json()
+        self.assertEqual(Decimal(str(data['total'])), expected)
+        self.assertEqual(data['item_count'], 8)
+
+    def test_cart_query_count_is_constant(self):
+        self.fill(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/cart/')
+        self.fill(8)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/cart/')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('contractor', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_catalog(products=3, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.order_by('id'))
+
+    def op(self, op, variant=None, **extra):
+        if variant is not None:
+            extra.update(product_id=variant.product_id, variant_id=variant.id)
+        return {'op': op, **extra}
+
+    def quantities(self):
+        return dict(CartItem.objects.values_list('variant_id', 'quantity'))
+
+    def test_batch_applies_operations_in_order(self):
+        v = self.variants
+        self.client.post('/api/cart/add/', {'product_id': v[0].product_id, 'variant_id': v[0].id, 'quantity': 2})
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            self.op('add', v[0], quantity=3),
+            self.op('add', v[1], quantity=1),
+            self.op('add', v[1], quantity=4),
+            self.op('set', v[2], quantity=7),
+            self.op('add', v[2], quantity=1),
+            self.op('add', v[3], quantity=1),
+            self.op('remove', v[3]),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {v[0].id: 5, v[1].id: 5, v[2].id: 8})
+        self.assertEqual(response.json()['item_count'], 18)
+
+    def test_lines_without_variant_accumulate(self):
+        product = Product.objects.first()
+        for _ in range(2):
+            self.client.post('/api/cart/batch/', {'operations': [
+                {'op': 'add', 'product_id': product.id, 'quantity': 2},
+            ]}, format='json')
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [4])
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        other = self.variants[-1]
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            self.op('add', self.variants[0], quantity=1),
+            {'op': 'add', 'product_id': self.variants[0].product_id, 'variant_id': other.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['operations'][0]['index'], 1)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CheckoutTests(TestCase):
+    shipping = {'address': '1 Site Road', 'city': 'Chennai', 'state': 'TN', 'pincode': '600001'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_catalog(products=2, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.select_related('product').order_by('id'))
+        self.cart = Cart.objects.create(user=self.user)
+
+    def add(self, variant, quantity):
+        CartItem.objects.create(cart=self.cart, product=variant.product, variant=variant, quantity=quantity)
+
+    def test_checkout_creates_order_and_takes_stock(self):
+        self.add(self.variants[0], 4)
+        self.add(self.variants[1], 6)
+        response = self.client.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total_amount, sum((v.product.base_price + v.additional_price) * q
+                                                 for v, q in [(self.variants[0], 4), (self.variants[1], 6)]))
+        self.assertEqual(
+            list(ProductVariant.objects.filter(pk__in=[self.variants[0].pk, self.variants[1].pk])
+                 .order_by('id').values_list('stock_quantity', flat=True)),
+            [6, 4],
+        )
+        self.assertEqual(Product.objects.get(pk=self.variants[0].product_id).total_stock, 10)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_all_insufficient_lines_are_reported_and_nothing_is_written(self):
+        self.add(self.variants[0], 11)
+        self.add(self.variants[1], 1)
+        self.add(self.variants[2], 50)
+        response = self.client.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [line['variant_id'] for line in response.json()['insufficient']],
+            [self.variants[0].id, self.variants[2].id],
+        )
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[1].pk).stock_quantity, 10)
+        self.assertEqual(self.cart.items.count(), 3)
+
+    def test_conditional_update_guards_against_overselling(self):
+        self.add(self.variants[0], 8)
+        real_f = checkout.F
+
+        def concurrent_checkout(*args):
+            # Another buyer takes stock between validation and the update.
+            ProductVariant.objects.filter(pk=self.variants[0].pk).update(stock_quantity=5)
+            return real_f(*args)
+
+        with mock.patch.object(checkout, 'F', concurrent_checkout):
+            response = self.client.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['insufficient'][0]['available'], 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        response = self.client.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.json(), {'error': 'Cart is empty'})
+
+
+class StockReservationTests(TestCase):
+    shipping = CheckoutTests.shipping
+
+    def setUp(self):
+        make_catalog(products=1, variants_per_product=1)
+        self.variant = ProductVariant.objects.select_related('product').get()
+        self.buyers = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(name, password='pw')
+            client = APIClient()
+            client.force_authenticate(user)
+            cart = Cart.objects.create(user=user)
+            self.buyers.append((client, cart))
+
+    def add(self, cart, quantity):
+        CartItem.objects.create(cart=cart, product=self.variant.product, variant=self.variant, quantity=quantity)
+
+    def inventory(self):
+        return Inventory.objects.values('total_stock', 'reserved_stock', 'available_stock').get(variant=self.variant)
+
+    def test_reserve_holds_stock_from_other_carts(self):
+        (first, first_cart), (second, second_cart) = self.buyers
+        self.add(first_cart, 7)
+        self.add(second_cart, 4)
+
+        response = first.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reservations'], [{'variant_id': self.variant.id, 'quantity': 7}])
+        self.assertEqual(self.inventory(), {'total_stock': 10, 'reserved_stock': 7, 'available_stock': 3})
+
+        response = second.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['insufficient'][0]['available'], 3)
+        response = second.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_consumes_reservation(self):
+        (first, first_cart), _ = self.buyers
+        self.add(first_cart, 7)
+        first.post('/api/cart/reserve/')
+        response = first.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.inventory(), {'total_stock': 3, 'reserved_stock': 0, 'available_stock': 3})
+        self.assertEqual(ProductVariant.objects.get().stock_quantity, 3)
+
+    def test_expired_reservations_are_released(self):
+        (first, first_cart), (second, second_cart) = self.buyers
+        self.add(first_cart, 7)
+        self.add(second_cart, 4)
+        first.post('/api/cart/reserve/')
+
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(self.inventory(), {'total_stock': 10, 'reserved_stock': 0, 'available_stock': 10})
+        response = second.post('/api/orders/', self.shipping, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.inventory(), {'total_stock': 6, 'reserved_stock': 0, 'available_stock': 6})
+
+
+class IdempotencyKeyTests(TestCase):
+    shipping = CheckoutTests.shipping
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_catalog(products=1, variants_per_product=1)
+        self.variant = ProductVariant.objects.get()
+
+    def add_to_cart(self, key, quantity=2):
+        return self.client.post(
+            '/api/cart/add/',
+            {'product_id': self.variant.product_id, 'variant_id': self.variant.id, 'quantity': quantity},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retried_cart_add_is_replayed(self):
+        first = self.add_to_cart('add-1')
+        with self.assertNumQueries(1):
+            retry = self.add_to_cart('add-1')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_retried_checkout_creates_one_order(self):
+        self.add_to_cart('add-1')
+        first = self.client.post('/api/orders/', self.shipping, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        retry = self.client.post('/api/orders/', self.shipping, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json()['order_number'], first.json()['order_number'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.add_to_cart('add-1')
+        self.assertEqual(self.add_to_cart('add-1', quantity=5).status_code, 422)
+
+    def test_in_progress_key_conflicts(self):
+        IdempotencyKey.objects.create(user=self.user, key='add-1', request_hash='fingerprint')
+        with mock.patch.object(idempotency, 'request_fingerprint', return_value='fingerprint'):
+            self.assertEqual(self.add_to_cart('add-1').status_code, 409)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_key_past_ttl_is_not_replayed(self):
+        self.add_to_cart('add-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        retry = self.add_to_cart('add-1', quantity=5)
+        self.assertEqual(retry.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.assertEqual(CartItem.objects.get().quantity, 7)
+        record = IdempotencyKey.objects.get()
+        self.assertEqual(record.status_code, 201)
+        self.assertGreater(record.created_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.add_to_cart('add-1', quantity=5)['Idempotent-Replayed'], 'true')
+
+    def test_expired_keys_are_deleted(self):
+        self.add_to_cart('add-1')
+        self.assertEqual(expire_idempotency_keys(now=timezone.now() + timedelta(days=2)), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OrderNumberTests(TestCase):
+    def test_block_sequences_never_overlap(self):
+        # Two sequences on one row behave like two worker processes.
+        first = BlockSequence('test', block_size=3)
+        second = BlockSequence('test', block_size=3)
+        values = [first.next_value(), second.next_value(), first.next_value(), first.next_value(),
+                  first.next_value(), second.next_value()]
+        self.assertEqual(values, [1, 4, 2, 3, 7, 5])
+
+    def test_checkout_uses_sequential_numbers(self):
+        user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=1, variants_per_product=1)
+        variant = ProductVariant.objects.get()
+        numbers = []
+        for _ in range(2):
+            cart, _ = Cart.objects.get_or_create(user=user)
+            CartItem.objects.create(cart=cart, product_id=variant.product_id, variant=variant, quantity=1)
+            numbers.append(checkout.place_order(user, cart, CheckoutTests.shipping).order_number)
+        prefix = f"ORD-{timezone.localdate():%Y%m%d}-"
+        self.assertTrue(all(number.startswith(prefix) for number in numbers))
+        self.assertLess(numbers[0], numbers[1])
+
+    def test_failed_checkout_gives_its_number_back(self):
+        user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=1, variants_per_product=1)
+        variant = ProductVariant.objects.get()
+        cart = Cart.objects.create(user=user)
+        item = CartItem.objects.create(cart=cart, product_id=variant.product_id, variant=variant, quantity=50)
+        before = checkout.generate_order_number()
+        with self.assertRaises(checkout.InsufficientStock):
+            checkout.place_order(user, cart, CheckoutTests.shipping)
+        CartItem.objects.filter(pk=item.pk).update(quantity=1)
+        number = checkout.place_order(user, cart, CheckoutTests.shipping).order_number
+        self.assertEqual(int(number.rsplit('-', 1)[1]), int(before.rsplit('-', 1)[1]) + 1)
+
+    def test_failing_commit_hook_keeps_the_order_and_its_number(self):
+        user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=1, variants_per_product=1)
+        variant = ProductVariant.objects.get()
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_id=variant.product_id, variant=variant, quantity=1)
+
+        def bump_catalog_version():
+            raise RuntimeError('cache down')
+
+        with mock.patch('spt.stock.bump_catalog_version', bump_catalog_version), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            order = checkout.place_order(user, cart, CheckoutTests.shipping)
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assertNotEqual(checkout.generate_order_number(), order.order_number)
+
+    def test_benchmark_needs_scratch_db_and_cleans_up(self):
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': ''}):
+            with self.assertRaises(CommandError):
+                call_command('bench_order_numbers', stdout=io.StringIO())
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': 'scratch.sqlite3'}):
+            call_command('bench_order_numbers', '--count', '3', stdout=io.StringIO())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(User.objects.filter(username='bench-order-numbers').exists())
+
+    def test_order_view_opts_out_of_atomic_requests(self):
+        view = next(p.callback for p in router.urls if p.name == 'order-list')
+        self.assertIn('default', view._non_atomic_requests)
+
+
+class OrderNumberCommitTests(TransactionTestCase):
+    def test_number_is_not_released_after_commit(self):
+        user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=1, variants_per_product=1)
+        variant = ProductVariant.objects.get()
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_id=variant.product_id, variant=variant, quantity=1)
+
+        def hook():
+            raise RuntimeError('hook failed')
+
+        def record_order_items(order, items):
+            transaction.on_commit(hook)
+
+        with mock.patch('spt.checkout.record_order_items', record_order_items):
+            with self.assertRaises(RuntimeError):
+                checkout.place_order(user, cart, CheckoutTests.shipping)
+        order = Order.objects.get()
+        self.assertNotEqual(checkout.generate_order_number(), order.order_number)
+
+
+class AsyncViewTests(TestCase):
+    shipping = CheckoutTests.shipping
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_catalog(products=1, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.order_by('id'))
+
+    def test_async_cart_matches_sync_cart(self):
+        for variant in self.variants:
+            response = self.client.post('/api/async/cart/add/', {
+                'product_id': variant.product_id, 'variant_id': variant.id, 'quantity': 3,
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        item_id = response.json()['id']
+        response = self.client.post('/api/async/cart/update_quantity/', {'item_id': item_id, 'quantity': 5}, format='json')
+        self.assertEqual(response.json()['quantity'], 5)
+
+        async_cart = self.client.get('/api/async/cart/').json()
+        self.assertEqual(async_cart, self.client.get('/api/cart/').json())
+        self.assertEqual(async_cart['item_count'], 8)
+
+    def test_async_orders_match_sync_orders(self):
+        self.client.post('/api/cart/add/', {
+            'product_id': self.variants[0].product_id, 'variant_id': self.variants[0].id, 'quantity': 2,
+        }, format='json')
+        order_id = self.client.post('/api/orders/', self.shipping, format='json').json()['id']
+
+        self.assertEqual(self.client.get('/api/async/orders/').json(), self.client.get('/api/orders/').json())
+        self.assertEqual(
+            self.client.get('/api/async/orders/?pagination=cursor').json(),
+            self.client.get('/api/orders/?pagination=cursor').json(),
+        )
+        response = self.client.get(f'/api/async/orders/{order_id}/track/')
+        self.assertEqual(response.json(), self.client.get(f'/api/orders/{order_id}/').json())
+        response = self.client.get(f'/api/async/orders/{order_id}/track/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unported_actions_still_work(self):
+        response = self.client.post('/api/async/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': self.variants[0].product_id, 'variant_id': self.variants[0].id},
+        ]}, format='json')
+        self.assertEqual(response.json()['item_count'], 1)
+        self.assertEqual(APIClient().get('/api/async/cart/').status_code, 403)
+
+    def test_benchmark_needs_scratch_db_and_cleans_up(self):
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': ''}):
+            with self.assertRaises(CommandError):
+                call_command('bench_async_views', stdout=io.StringIO())
+        from .management.commands import bench_async_views
+        # The requests themselves need a server thread outside the test transaction.
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': 'scratch.sqlite3'}), \
+                mock.patch.object(bench_async_views.Command, 'bench', side_effect=RuntimeError('interrupted')):
+            with self.assertRaises(RuntimeError):
+                call_command('bench_async_views', stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username='bench-async-views').exists())
+        self.assertEqual(CartItem.objects.count(), 0)
+
+
+class WebSocketEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=1, variants_per_product=2)
+        self.variant = ProductVariant.objects.order_by('id').first()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product_id=self.variant.product_id, variant=self.variant, quantity=1)
+        self.order = checkout.place_order(self.user, cart, CheckoutTests.shipping)
+
+    def connect(self, path, user=None):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        return communicator
+
+    def committed(self, change):
+        """Run ``change`` in a sync thread and deliver its on_commit events"""
+        def run():
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+        return sync_to_async(run)()
+
+    async def test_order_status_is_pushed(self):
+        communicator = self.connect(f'/ws/orders/{self.order.pk}/', self.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['status'], 'PENDING')
+
+        def ship():
+            order = Order.objects.get(pk=self.order.pk)
+            order.status, order.tracking_number = 'SHIPPED', 'TRK1'
+            order.save()
+            order.save()  # unchanged: no second event
+        await self.committed(ship)
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['status'], event['tracking_number']), ('SHIPPED', 'TRK1'))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_order_socket_requires_owner(self):
+        other = await User.objects.acreate(username='other')
+        for user in (None, other):
+            connected, code = await self.connect(f'/ws/orders/{self.order.pk}/', user).connect()
+            self.assertFalse(connected)
+
+    async def test_stock_changes_are_pushed(self):
+        communicator = self.connect(f'/ws/stock/{self.variant.product_id}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        initial = await communicator.receive_json_from()
+        self.assertEqual(initial['total_stock'], 19)
+        self.assertEqual(len(initial['variants']), 2)
+
+        def restock():
+            variant = ProductVariant.objects.get(pk=self.variant.pk)
+            variant.stock_quantity = 30
+            variant.save()
+        await self.committed(restock)
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['total_stock'], 40)
+        self.assertEqual(event['variants'], [{'variant_id': self.variant.pk, 'stock_quantity': 30}])
+        await communicator.disconnect()
+
+
+    def test_stock_is_not_read_without_subscribers(self):
+        variant = ProductVariant.objects.get(pk=self.variant.pk)
+        variant.stock_quantity = 30
+        with mock.patch.object(events, 'stock_payloads', wraps=events.stock_payloads) as payloads:
+            with self.captureOnCommitCallbacks(execute=True):
+                variant.save()
+        payloads.assert_not_called()
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = f'{self.tempdir}/channels.sqlite3'
+
+    def layer(self, **config):
+        return SQLiteChannelLayer(self.path, **config)
+
+    async def test_group_send_reaches_other_processes(self):
+        # Two layer instances on one file stand in for two worker processes.
+        sender, receiver = self.layer(), self.layer()
+        first, second = await receiver.new_channel(), await receiver.new_channel()
+        await receiver.group_add('stock_1', first)
+        await receiver.group_add('stock_1', second)
+        await sender.group_send('stock_1', {'type': 'send.event', 'payload': {'raw': b'\x00\x01'}})
+
+        for channel in (first, second):
+            message = await asyncio.wait_for(receiver.receive(channel), 5)
+            self.assertEqual(message, {'type': 'send.event', 'payload': {'raw': b'\x00\x01'}})
+
+        await receiver.group_discard('stock_1', second)
+        await sender.group_send('stock_1', {'type': 'send.event', 'n': 2})
+        self.assertEqual((await asyncio.wait_for(receiver.receive(first), 5))['n'], 2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(receiver.receive(second), 0.2)
+
+    async def test_occupied_groups(self):
+        layer = self.layer()
+        await layer.group_add('stock_1', await layer.new_channel())
+        self.assertEqual(await layer.occupied_groups(['stock_1', 'stock_2']), {'stock_1'})
+
+    async def test_capacity_and_expiry(self):
+        layer = self.layer(capacity=2, expiry=0.2, cleanup_interval=0)
+        await layer.send('orders', {'type': 'a'})
+        await layer.send('orders', {'type': 'b'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('orders', {'type': 'c'})
+
+        await layer.group_add('stock_1', 'orders')
+        await asyncio.sleep(0.3)
+        # The unread messages expired, which also ends the group membership.
+        await layer.send('other', {'type': 'd'})
+        await layer.group_send('stock_1', {'type': 'e'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive('orders'), 0.2)
+
+
+DASHBOARD_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'admin_dashboard.html': '', 'admin_orders.html': '', 'admin_products.html': '',
+        })],
+        'context_processors': ['django.contrib.auth.context_processors.auth'],
+    },
+}]
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        make_catalog(products=2, variants_per_product=1)
+        self.variants = list(ProductVariant.objects.select_related('product').order_by('id'))
+        caches['default'].clear()
+
+    def buy(self, *lines):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        for variant, quantity in lines:
+            CartItem.objects.create(cart=cart, product=variant.product, variant=variant, quantity=quantity)
+        return checkout.place_order(self.user, cart, CheckoutTests.shipping)
+
+    def rollup_rows(self):
+        return (
+            sorted(DailySalesRollup.objects.filter(order_count__gt=0).values_list('date', 'status', 'order_count', 'revenue')),
+            sorted(ProductDailySales.objects.filter(quantity__gt=0).values_list('date', 'product_id', 'quantity', 'revenue')),
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        first = self.buy((self.variants[0], 2), (self.variants[1], 1))
+        second = self.buy((self.variants[0], 3))
+        third = self.buy((self.variants[1], 4))
+
+        order = Order.objects.get(pk=first.pk)
+        order.status = 'SHIPPED'
+        order.save()
+        Order.objects.get(pk=third.pk).delete()
+
+        incremental = self.rollup_rows()
+        self.assertEqual(
+            [(status, count) for _, status, count, _ in incremental[0]],
+            [('PENDING', 1), ('SHIPPED', 1)],
+        )
+        self.assertEqual(
+            [(product_id, quantity) for _, product_id, quantity, _ in incremental[1]],
+            [(self.variants[0].product_id, 5), (self.variants[1].product_id, 1)],
+        )
+        rebuild_rollups()
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(sum(row[3] for row in incremental[0]), first.total_amount + second.total_amount)
+
+    @override_settings(TEMPLATES=DASHBOARD_TEMPLATES)
+    def test_dashboard_reads_rollups(self):
+        self.buy((self.variants[0], 2))
+        self.buy((self.variants[1], 1))
+        admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(admin)
+
+        response = self.client.get('/api/admin-dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_orders'], 2)
+        self.assertEqual(response.context['orders_last_30'], 2)
+        self.assertEqual(
+            [product['total_sold'] for product in response.context['top_products']],
+            [2, 1],
+        )
+        self.assertEqual(response.context['total_products'], 2)
+        self.assertEqual(response.context['daily_chart_data']['orders'], [2])
+        # rollups, customer and product counts, top products, low stock
+        with self.assertNumQueries(4):
+            dashboard_context()
+
+    @override_settings(TEMPLATES=DASHBOARD_TEMPLATES)
+    def test_dashboard_status_counts_and_cache(self):
+        delivered = self.buy((self.variants[0], 2))
+        self.buy((self.variants[1], 1))
+        order = Order.objects.get(pk=delivered.pk)
+        order.status = 'DELIVERED'
+        order.save()
+        admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(admin)
+
+        response = self.client.get('/api/admin-dashboard/')
+        self.assertEqual(response.context['completed_orders'], 1)
+        self.assertEqual(response.context['pending_orders'], 1)
+        self.assertEqual(response.context['status_chart_data']['labels'], ['Pending', 'Delivered'])
+        self.assertEqual(
+            Decimal(response.context['top_products'][0]['total_revenue']),
+            (self.variants[0].product.base_price + self.variants[0].additional_price) * 2,
+        )
+
+        # Served from the cache until it expires, even after new orders.
+        self.buy((self.variants[1], 1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/admin-dashboard/')
+        self.assertEqual(response.context['total_orders'], 2)
+        self.assertFalse([q for q in queries if 'spt_dailysalesrollup' in q['sql']])
+
+    def test_single_flight_serves_stale_value_during_refresh(self):
+        cache = caches['default']
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(single_flight(cache, 'test:sf', compute, 60), 1)
+        self.assertEqual(single_flight(cache, 'test:sf', compute, 60), 1)
+
+        stale = (time.time() - 1, 1)
+        cache.set('test:sf', stale, 60)
+        cache.add('test:sf:lock', 1)  # another caller is refreshing
+        self.assertEqual(single_flight(cache, 'test:sf', compute, 60), 1)
+        self.assertEqual(len(calls), 1)
+        cache.delete('test:sf:lock')
+        self.assertEqual(single_flight(cache, 'test:sf', compute, 60), 2)
+
+
+@override_settings(TEMPLATES=DASHBOARD_TEMPLATES)
+class AdminOrderListTests(TestCase):
+    def setUp(self):
+        make_catalog(products=2, variants_per_product=1)
+        variants = list(ProductVariant.objects.select_related('product'))
+        user = User.objects.create_user('buyer', password='pw')
+        for i in range(25):
+            order = Order.objects.create(
+                user=user, order_number=f'ORD-{i}', total_amount=Decimal('10.00'),
+                status='DELIVERED' if i % 5 == 0 else 'PENDING',
+                shipping_address='1 Road', shipping_city='Chennai', shipping_state='TN', shipping_pincode='600001',
+            )
+            for variant in variants:
+                OrderItem.objects.create(order=order, product=variant.product, variant=variant,
+                                         quantity=1, price_at_purchase=Decimal('5.00'))
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+
+    def test_keyset_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/admin-orders/').context
+        self.assertEqual(len(first['orders']), 20)
+        self.assertEqual(first['estimated_total'], 25)
+        self.assertIsNone(first['previous_cursor'])
+        self.assertEqual(first['statuses'], [value for value, _ in Order.STATUS_CHOICES])
+        self.assertEqual(first['status_choices'], Order.STATUS_CHOICES)
+        # session + user, rollup total, orders, items with products and variants
+        self.assertEqual(len(queries), 5)
+
+        second = self.client.get('/api/admin-orders/', {'after': first['next_cursor']}).context
+        self.assertEqual(len(second['orders']), 5)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(
+            [o.order_number for o in first['orders'] + second['orders']],
+            [f'ORD-{i}' for i in reversed(range(25))],
+        )
+        back = self.client.get('/api/admin-orders/', {'before': second['previous_cursor']}).context
+        self.assertEqual(back['orders'], first['orders'])
+        self.assertIsNone(back['previous_cursor'])
+        self.assertEqual(self.client.get('/api/admin-orders/', {'after': 'junk'}).status_code, 404)
+
+    def test_status_filter(self):
+        context = self.client.get('/api/admin-orders/', {'status': 'DELIVERED'}).context
+        self.assertEqual(len(context['orders']), 5)
+        self.assertEqual(context['estimated_total'], 5)
+        self.assertEqual(self.client.get('/api/admin-orders/', {'status': 'bogus'}).context['estimated_total'], 25)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        make_catalog(products=1, variants_per_product=2)
+        self.user = User.objects.create_user('buyer', password='pw')
+        for i, status in enumerate(['PENDING', 'DELIVERED', 'PENDING']):
+            order = Order.objects.create(
+                user=self.user, order_number=f'ORD-{i}', total_amount=Decimal('10.00'), status=status,
+                shipping_address='1 Road', shipping_city='Chennai', shipping_state='TN', shipping_pincode='600001',
+            )
+            for variant in ProductVariant.objects.select_related('product'):
+                OrderItem.objects.create(order=order, product=variant.product, variant=variant, quantity=2,
+                                         price_at_purchase=Decimal('5.00'), variant_price_at_purchase=Decimal('1.00'))
+        self.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+
+    def test_csv_export_is_streamed_and_filtered(self):
+        self.client.force_login(self.admin)
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get('/api/admin-export/items/', {'status': 'PENDING'})
+            self.assertTrue(response.streaming)
+            rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['item_id', 'order_id', 'order_number'])
+        self.assertEqual(len(rows), 1 + 4)
+        self.assertEqual({row[2] for row in rows[1:]}, {'ORD-0', 'ORD-2'})
+        self.assertEqual({row[-1] for row in rows[1:]}, {'12.00'})
+
+        today = timezone.localdate()
+        response = self.client.get('/api/admin-export/orders/', {'end': str(today - timedelta(days=1))})
+        self.assertEqual(b''.join(response.streaming_content).decode().count('\n'), 1)
+        self.assertEqual(self.client.get('/api/admin-export/orders/', {'status': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin-export/users/').status_code, 404)
+
+    def test_date_range_includes_the_whole_end_day(self):
+        day = timezone.localdate() - timedelta(days=3)
+        midnight = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        for order, created_at in zip(Order.objects.order_by('id'), (
+            midnight - timedelta(microseconds=1), midnight + timedelta(hours=23, minutes=59), midnight + timedelta(days=1),
+        )):
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        numbers = [row[1] for row in export_queryset('orders', start=str(day), end=str(day))]
+        self.assertEqual(numbers, ['ORD-1'])
+        self.assertEqual(export_queryset('items', start=day, end=day).count(), 2)
+        with self.assertRaises(ExportError):
+            export_queryset('orders', end='2024-02-30')
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/admin-export/orders/').status_code, 302)
+
+    async def test_ndjson_export_streams_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.admin)
+        response = await client.get('/api/admin-export/orders/', {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        orders = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([order['order_number'] for order in orders], ['ORD-0', 'ORD-1', 'ORD-2'])
+        self.assertEqual(orders[0]['username'], 'buyer')
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_orders', 'orders', '--status', 'DELIVERED', '--format', 'ndjson', stdout=out)
+        self.assertEqual([json.loads(line)['order_number'] for line in out.getvalue().splitlines()], ['ORD-1'])
+
+    def test_benchmark_counts_rows_and_cleans_up(self):
+        from .management.commands import bench_exports
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': ''}):
+            with self.assertRaises(CommandError):
+                call_command('bench_exports', stdout=io.StringIO())
+        self.assertEqual(bench_exports.export('csv', 'items'), 6)
+        self.assertEqual(bench_exports.export('ndjson', 'items'), 6)
+
+        command = bench_exports.Command(stdout=io.StringIO())
+        command.ensure_items(7, 2, 10)
+        self.assertEqual(OrderItem.objects.count(), 14)
+        self.assertEqual(command.delete_items(), 12)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        self.assertEqual(Order.objects.count(), 3)
+
+
+class CatalogImportTests(TestCase):
+    header = 'product_sku,name,description,category,base_price,variant_sku,variant_name,variant_type,additional_price,stock_quantity\n'
+
+    def import_feed(self, text, suffix='.csv'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as feed:
+            feed.write(text)
+        self.addCleanup(os.unlink, feed.name)
+        out = io.StringIO()
+        call_command('import_catalog', feed.name, '--batch-size', '2', stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_import_creates_then_diffs_by_sku(self):
+        self.import_feed(
+            self.header
+            + 'P1,Cement,Bag,Cement,350,V1,Grade A,material,0,10\n'
+            + 'P1,Cement,Bag,Cement,350,V2,Grade B,MATERIAL,25,5\n'
+            + 'P2,Bricks,Red,Bricks,4500,V3,Red,COLOR,0,7\n'
+            + 'P3,Rods,,TMT,90,V4,10mm,SIZE,0,-1\n'
+        )
+        self.assertEqual(Product.objects.get(sku='P1').total_stock, 15)
+        self.assertEqual(ProductVariant.objects.get(sku='V1').variant_type, 'MATERIAL')
+        self.assertFalse(Product.objects.filter(sku='P3').exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            output = self.import_feed(
+                '{"product_sku": "P1", "name": "Cement", "description": "Bag", "category": "Cement", "base_price": "375.00"}\n'
+                '{"product_sku": "P2", "name": "Bricks", "description": "Red", "category": "Bricks", "base_price": "4500",'
+                ' "variant_sku": "V3", "variant_name": "Red", "variant_type": "COLOR", "stock_quantity": 7}\n'
+                '{"product_sku": "P2", "name": "Bricks", "description": "Red", "category": "Bricks", "base_price": "4500",'
+                ' "variant_sku": "V2", "variant_name": "Grade B", "variant_type": "MATERIAL", "stock_quantity": 8}\n',
+                suffix='.jsonl',
+            )
+        # P2 is in both batches of two rows.
+        self.assertIn('Products: 0 created, 1 updated, 2 unchanged. Variants: 0 created, 1 updated, 1 unchanged.', output)
+        variant_writes = [q for q in queries if q['sql'].startswith(('INSERT INTO "spt_productvariant"', 'UPDATE "spt_productvariant"'))]
+        self.assertEqual(len(variant_writes), 1)
+        self.assertEqual(Product.objects.get(sku='P1').base_price, Decimal('375.00'))
+        self.assertEqual(ProductVariant.objects.get(sku='V2').product.sku, 'P2')
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'total_stock')),
+            {'P1': 10, 'P2': 15},
+        )
+
+    def test_variant_key_collisions_are_reported(self):
+        self.import_feed(self.header + 'P1,Cement,Bag,Cement,350,V1,Grade A,MATERIAL,0,10\n')
+        err = io.StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write(
+                self.header
+                + 'P1,Cement,Bag,Cement,350,V2,Grade A,MATERIAL,0,5\n'  # stored under V1
+                + 'P1,Cement,Bag,Cement,350,V3,Grade B,MATERIAL,0,5\n'
+                + 'P1,Cement,Bag,Cement,350,V4,Grade B,MATERIAL,0,5\n'  # V3 took it first
+                + 'P1,Cement,Bag,Cement,350,V5,Grade C,MATERIAL,0,1\n'
+            )
+        self.addCleanup(os.unlink, feed.name)
+        out = io.StringIO()
+        call_command('import_catalog', feed.name, '--batch-size', '3', stdout=out, stderr=err)
+        self.assertIn('2 rows rejected', out.getvalue())
+        self.assertEqual(
+            err.getvalue().splitlines(),
+            ['line 2: variant Grade A (MATERIAL) of this product already has SKU V1',
+             'line 4: variant Grade B (MATERIAL) of this product already has SKU V3'],
+        )
+        self.assertEqual(sorted(ProductVariant.objects.values_list('sku', flat=True)), ['V1', 'V3', 'V5'])
+        self.assertEqual(Product.objects.get(sku='P1').total_stock, 16)
+
+    def test_failed_batch_is_reported_and_skipped(self):
+        importer = CatalogImporter(batch_size=1)
+        rows = [(2, {'product_sku': 'P1', 'name': 'Cement', 'category': 'Cement', 'base_price': '1'}),
+                (3, {'product_sku': 'P2', 'name': 'Bricks', 'category': 'Bricks', 'base_price': '1'})]
+        real_apply = importer.apply_products
+
+        def apply_products(products):
+            if 'P1' in products:
+                raise IntegrityError('UNIQUE constraint failed')
+            return real_apply(products)
+
+        with mock.patch.object(importer, 'apply_products', apply_products):
+            importer.run(rows)
+        self.assertEqual(importer.errors, [(2, 'lines 2-2 not imported: UNIQUE constraint failed')])
+        self.assertEqual((importer.stats['rows_rejected'], importer.stats['products_created']), (1, 1))
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['P2'])
+
+    def test_failed_batches_do_not_leave_categories_behind(self):
+        importer = CatalogImporter(batch_size=1)
+        rows = [(number, {'product_sku': f'P{number}', 'name': 'Sand', 'category': 'Sand', 'base_price': '1'})
+                for number in (2, 3, 4)]
+        real_apply = importer.apply_products
+
+        def apply_products(products):
+            if 'P4' not in products:
+                raise IntegrityError('UNIQUE constraint failed')
+            return real_apply(products)
+
+        with mock.patch.object(importer, 'apply_products', apply_products):
+            importer.run(rows)
+        self.assertEqual(importer.stats['rows_rejected'], 2)
+        self.assertEqual(Product.objects.get().category, ProductCategory.objects.get(name='Sand'))
+
+
+class LoadDataTests(TestCase):
+    args = ['generate_load_data', '--categories', '2', '--products', '6', '--users', '12', '--carts', '3',
+            '--orders', '60', '--days', '30', '--batch-size', '7']
+
+    def snapshot(self):
+        return list(Order.objects.order_by('id').values_list('order_number', 'user__username', 'status', 'total_amount'))
+
+    def test_generates_consistent_reproducible_data(self):
+        call_command(*self.args, stdout=io.StringIO())
+        first = self.snapshot()
+        self.assertEqual(len(first), 60)
+        self.assertFalse(find_stock_drift().exists())
+        self.assertEqual(DailySalesRollup.objects.aggregate(total=Sum('order_count'))['total'], 60)
+        for order in Order.objects.prefetch_related('items')[:10]:
+            self.assertEqual(order.total_amount, sum(
+                (item.price_at_purchase + item.variant_price_at_purchase) * item.quantity for item in order.items.all()
+            ))
+
+        with self.assertRaises(CommandError):
+            call_command(*self.args, stdout=io.StringIO())
+        call_command(*self.args, '--reset', stdout=io.StringIO())
+        self.assertEqual(
+            [row[2:] for row in self.snapshot()],
+            [row[2:] for row in first],
+        )
+
+
+class HTTPBenchmarkTests(SimpleTestCase):
+    def test_summary_and_regressions(self):
+        from .management.commands.bench_http import find_regressions, summarize
+        stats = summarize([i / 1000 for i in range(1, 101)], {200: 98, 400: 1, 500: 1}, elapsed=10)
+        self.assertEqual((stats['requests'], stats['rps']), (100, 10.0))
+        self.assertEqual((stats['p50_ms'], stats['p95_ms'], stats['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual((stats['errors'], stats['non_2xx']), (1, 2))
+
+        baseline = {'results': {'wsgi': {'endpoints': {'browse': stats}}}}
+        slower = dict(stats, p95_ms=120.0)
+        fewer = dict(stats, rps=8.0)
+        self.assertEqual(find_regressions({'wsgi': {'endpoints': {'browse': stats}}}, baseline, 0.15), [])
+        self.assertEqual(len(find_regressions({'wsgi': {'endpoints': {'browse': slower}}}, baseline, 0.15)), 1)
+        self.assertEqual(len(find_regressions({'wsgi': {'endpoints': {'browse': fewer}}}, baseline, 0.15)), 1)
+        self.assertEqual(find_regressions({'asgi': {'endpoints': {'browse': slower}}}, baseline, 0.15), [])
+
+    def test_requires_scratch_database(self):
+        with mock.patch.dict(os.environ, {'SPT_DB_PATH': ''}):
+            with self.assertRaises(CommandError):
+                call_command('bench_http', stdout=io.StringIO())
+
+
+# Queries one request may make, per (URL name, HTTP method), whatever the
+# size of the data it reads or renders: QueryBudgetTestsMixin checks every
+# entry against data sets of 1 and of 50 rows, so an N+1 fails both ways.
+# Every route in spt/urls.py needs an entry.
+QUERY_BUDGETS = {
+    ('api-root', 'get'): 2,
+    # Catalog reads: session, user, then the page (plus count and ETag queries)
+    ('category-list', 'get'): 5,
+    ('category-detail', 'get'): 4,
+    ('product-list', 'get'): 6,
+    ('product-by-category', 'get'): 4,
+    ('product-facets', 'get'): 3,
+    ('product-detail', 'get'): 5,
+    ('variant-list', 'get'): 4,
+    ('variant-detail', 'get'): 3,
+    # Catalog writes; deletes cascade to the variants in batches
+    ('category-list', 'post'): 4,
+    ('category-detail', 'put'): 5,
+    ('category-detail', 'patch'): 5,
+    ('category-detail', 'delete'): 15,
+    ('product-list', 'post'): 5,
+    ('product-detail', 'put'): 7,
+    ('product-detail', 'patch'): 6,
+    ('product-detail', 'delete'): 14,
+    ('variant-detail', 'put'): 7,
+    ('variant-detail', 'patch'): 6,
+    ('variant-detail', 'delete'): 10,
+    # Cart and orders, sync and async alike
+    ('cart-list', 'get'): 5,
+    ('cart-list', 'post'): 9,
+    ('cart-add', 'post'): 11,
+    ('cart-batch', 'post'): 10,
+    ('cart-remove', 'post'): 7,
+    ('cart-update-quantity', 'post'): 5,
+    ('order-list', 'get'): 4,
+    # Reserving and checkout run each guarded UPDATE in a savepoint
+    ('cart-reserve', 'post'): 16,
+    ('order-list', 'post'): 30,
+    ('order-detail', 'get'): 5,
+    ('order-track', 'get'): 5,
+    ('customer-list', 'get'): 4,
+    ('customer-list', 'post'): 5,
+    # Staff pages
+    ('admin_dashboard', 'get'): 6,
+    ('admin_orders', 'get'): 5,
+    ('admin_products', 'get'): 8,
+    ('admin_cache_stats', 'get'): 2,
+    ('admin_query_stats', 'get'): 2,
+    ('admin_export', 'get'): 3,
+}
+QUERY_BUDGETS.update({
+    (f'async-{name}', method): budget for (name, method), budget in list(QUERY_BUDGETS.items())
+    if name.startswith(('cart-', 'order-'))
+})
+
+UNBUDGETED_ROUTES = {
+    ('variant-list', 'post'): 'ProductVariantSerializer has no product field, so the API cannot create variants',
+}
+
+# The admin pages' templates are not part of this app; these walk the same
+# relations the pages display.
+BUDGET_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'admin_dashboard.html': '{% for variant in low_stock_items %}{{ variant.product.name }}{% endfor %}',
+            'admin_orders.html': (
+                '{% for order in orders %}{{ order.user.username }}{% for item in order.items.all %}'
+                '{{ item.product.name }}{{ item.variant.variant_name }}{% endfor %}{% endfor %}'
+            ),
+            'admin_products.html': (
+                '{% for product in products %}{{ product.category.name }}{{ product.total_variants }}'
+                '{% for variant in product.variants.all %}{{ variant.variant_name }}{% endfor %}{% endfor %}'
+            ),
+        })],
+        'context_processors': ['django.contrib.auth.context_processors.auth'],
+    },
+}]
+
+
+def budget_routes():
+    """``(URL name, method)`` for every route in spt/urls.py"""
+    routes = {('api-root', 'get')}
+    for pattern in router.urls:
+        # DRF adds HEAD, served by the GET handler, once a view has run.
+        routes.update((pattern.name, method) for method in getattr(pattern.callback, 'actions', {}) if method != 'head')
+    routes.update((pattern.name, 'get') for pattern in urlpatterns if getattr(pattern, 'name', None))
+    return routes - UNBUDGETED_ROUTES.keys()
+
+
+class QueryBudgetTestsMixin:
+    size = None
+
+    @classmethod
+    def setUpTestData(cls):
+        size = cls.size
+        cls.category = make_catalog(products=size, variants_per_product=2)
+        cls.spare_category = make_catalog(products=1, variants_per_product=size, category_name='Spare')
+        cls.spare = Product.objects.get(category=cls.spare_category)
+        cls.buyer = User.objects.create_user('buyer', password='pw')
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        Customer.objects.create(user=cls.buyer, phone='1', address='1 Road', city='Chennai', state='TN', pincode='600001')
+        variants = list(ProductVariant.objects.filter(product__category=cls.category).select_related('product'))
+        cls.variant = variants[0]
+        cart = Cart.objects.create(user=cls.buyer)
+        cls.cart_items = CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=variant.product, variant=variant, quantity=1) for variant in variants[::2]
+        ])
+        cls.orders = Order.objects.bulk_create([
+            Order(user=cls.buyer, order_number=f'BUDGET-{i}', total_amount=Decimal('100.00'), shipping_address='1 Road',
+                  shipping_city='Chennai', shipping_state='TN', shipping_pincode='600001')
+            for i in range(size)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=variant.product, variant=variant, quantity=1,
+                      price_at_purchase=variant.product.base_price)
+            for order in cls.orders for variant in variants[::2]
+        ])
+        rebuild_rollups()
+
+    def setUp(self):
+        self.buyer_client = APIClient()
+        self.buyer_client.force_login(self.buyer)
+        self.staff_client = APIClient()
+        self.staff_client.force_login(self.staff)
+
+    def budget_requests(self):
+        """``(URL name, method)`` -> (path, payload, staff)"""
+        category, spare, variant, order = self.category, self.spare, self.variant, self.orders[0]
+        item = self.cart_items[0]
+        product_payload = {'name': 'Renamed', 'description': 'Renamed', 'category': category.id, 'base_price': '5.00'}
+        requests = {
+            ('api-root', 'get'): ('/api/', None),
+            ('category-list', 'get'): ('/api/categories/', None),
+            ('category-list', 'post'): ('/api/categories/', {'name': 'Tiles'}),
+            ('category-detail', 'get'): (f'/api/categories/{category.id}/', None),
+            ('category-detail', 'put'): (f'/api/categories/{category.id}/', {'name': 'Renamed'}),
+            ('category-detail', 'patch'): (f'/api/categories/{category.id}/', {'name': 'Renamed'}),
+            ('category-detail', 'delete'): (f'/api/categories/{self.spare_category.id}/', None),
+            ('product-list', 'get'): ('/api/products/', None),
+            ('product-list', 'post'): ('/api/products/', product_payload),
+            ('product-by-category', 'get'): (f'/api/products/by_category/?category_id={category.id}', None),
+            ('product-facets', 'get'): ('/api/products/facets/', None),
+            ('product-detail', 'get'): (f'/api/products/{spare.id}/', None),
+            ('product-detail', 'put'): (f'/api/products/{spare.id}/', product_payload),
+            ('product-detail', 'patch'): (f'/api/products/{spare.id}/', {'name': 'Renamed'}),
+            ('product-detail', 'delete'): (f'/api/products/{spare.id}/', None),
+            ('variant-list', 'get'): ('/api/variants/', None),
+            ('variant-detail', 'get'): (f'/api/variants/{variant.id}/', None),
+            ('variant-detail', 'put'): (f'/api/variants/{variant.id}/', {
+                'variant_name': 'Renamed', 'variant_type': 'MATERIAL', 'additional_price': '1.00', 'stock_quantity': 5,
+                'sku': variant.sku,
+            }),
+            ('variant-detail', 'patch'): (f'/api/variants/{variant.id}/', {'stock_quantity': 5}),
+            ('variant-detail', 'delete'): (f'/api/variants/{spare.variants.first().id}/', None),
+            ('customer-list', 'get'): ('/api/customer/', None),
+            ('customer-list', 'post'): ('/api/customer/', {'city': 'Madurai'}),
+        }
+        for prefix, base in (('', '/api/'), ('async-', '/api/async/')):
+            requests.update({
+                (f'{prefix}cart-list', 'get'): (f'{base}cart/', None),
+                (f'{prefix}cart-list', 'post'): (f'{base}cart/', {}),
+                (f'{prefix}cart-add', 'post'): (f'{base}cart/add/', {
+                    'product_id': variant.product_id, 'variant_id': variant.id, 'quantity': 1,
+                }),
+                (f'{prefix}cart-batch', 'post'): (f'{base}cart/batch/', {'operations': [
+                    {'op': 'set', 'product_id': cart_item.product_id, 'variant_id': cart_item.variant_id, 'quantity': 2}
+                    for cart_item in self.cart_items
+                ]}),
+                (f'{prefix}cart-remove', 'post'): (f'{base}cart/remove/', {'item_id': item.id}),
+                (f'{prefix}cart-reserve', 'post'): (f'{base}cart/reserve/', {}),
+                (f'{prefix}cart-update-quantity', 'post'): (f'{base}cart/update_quantity/', {
+                    'item_id': item.id, 'quantity': 2,
+                }),
+                (f'{prefix}order-list', 'get'): (f'{base}orders/', None),
+                (f'{prefix}order-list', 'post'): (f'{base}orders/', CheckoutTests.shipping),
+                (f'{prefix}order-detail', 'get'): (f'{base}orders/{order.id}/', None),
+                (f'{prefix}order-track', 'get'): (f'{base}orders/{order.id}/track/', None),
+            })
+        for name, path in (
+            ('admin_dashboard', '/api/admin-dashboard/'), ('admin_orders', '/api/admin-orders/'),
+            ('admin_products', '/api/admin-products/'), ('admin_cache_stats', '/api/admin-cache-stats/'),
+            ('admin_query_stats', '/api/admin-query-stats/'),
+            ('admin_export', '/api/admin-export/items/'),
+        ):
+            requests[(name, 'get')] = (path, None)
+        return requests
+
+    def count_queries(self, route, path, payload):
+        client = self.staff_client if route[0].startswith('admin_') else self.buyer_client
+        # Every checkout then takes a fresh order-number block, whatever ran before.
+        order_sequence.reset()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, route[1])(path, payload, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 400, f'{route}: {response.status_code}')
+        return len(queries)
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(budget_routes() - QUERY_BUDGETS.keys(), set())
+        self.assertEqual(budget_routes() - self.budget_requests().keys(), set())
+
+    def test_query_budgets(self):
+        for route, (path, payload) in sorted(self.budget_requests().items()):
+            with self.subTest(route=route):
+                self.assertEqual(self.count_queries(route, path, payload), QUERY_BUDGETS.get(route), route)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False, ADMIN_DASHBOARD_CACHE_TIMEOUT=0, TEMPLATES=BUDGET_TEMPLATES)
+class SmallQueryBudgetTests(QueryBudgetTestsMixin, TestCase):
+    size = 1
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False, ADMIN_DASHBOARD_CACHE_TIMEOUT=0, TEMPLATES=BUDGET_TEMPLATES)
+class LargeQueryBudgetTests(QueryBudgetTestsMixin, TestCase):
+    size = 50
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        reset_query_stats()
+        make_catalog(products=2)
+
+    def test_server_timing_header_log_and_stats(self):
+        with self.assertLogs('spt.queries', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/')
+        count = len(queries)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{count} queries"', timing)
+        self.assertIn('render;dur=', timing)
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((entry['view'], entry['status'], entry['queries']), ('GET product-list', 200, count))
+        self.assertTrue(entry['slowest_sql'])
+
+        self.client.get('/api/products/')
+        stats = get_query_stats()['GET product-list']
+        self.assertEqual((stats['requests'], stats['queries']), (2, 2 * count))
+
+    def test_log_line_is_not_built_below_its_level(self):
+        logger = logging.getLogger('spt.queries')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        self.addCleanup(logger.setLevel, level)
+        with mock.patch.object(instrumentation, 'json') as json_module:
+            response = self.client.get('/api/products/')
+        json_module.dumps.assert_not_called()
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_duplicate_shapes_collapse_in_lists(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            list(Product.objects.filter(pk__in=[1, 2]))
+            list(Product.objects.filter(pk__in=[1, 2, 3]))
+            Product.objects.count()
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(list(recorder.duplicates().values()), [2])
+        self.assertIn('IN (...)', next(iter(recorder.duplicates())))
+
+    async def test_async_requests_are_counted(self):
+        user = await User.objects.acreate_user('buyer', password='pw')
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.get('/api/async/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+        self.assertEqual(get_query_stats()['GET async-cart-list']['requests'], 1)
@@ -4,7 +4,10 @@ from .views import (
     ProductCategoryViewSet, ProductViewSet, ProductVariantViewSet,
     CartViewSet, OrderViewSet, CustomerViewSet
 )
-from .admin_views import admin_dashboard, admin_orders, admin_products
+from .async_views import AsyncCartViewSet, AsyncOrderViewSet
+from .admin_views import (
+    admin_dashboard, admin_orders, admin_products, admin_cache_stats, admin_query_stats, admin_export
+)
 
 router = DefaultRouter()
 router.register(r'categories', ProductCategoryViewSet, basename='category')
@@ -13,6 +16,8 @@ router.register(r'variants', ProductVariantViewSet, basename='variant')
 router.register(r'cart', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'customer', CustomerViewSet, basename='customer')
+router.register(r'async/cart', AsyncCartViewSet, basename='async-cart')
+router.register(r'async/orders', AsyncOrderViewSet, basename='async-order')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -20,4 +25,7 @@ urlpatterns = [
     path('admin-dashboard/', admin_dashboard, name='admin_dashboard'),
     path('admin-orders/', admin_orders, name='admin_orders'),
     path('admin-products/', admin_products, name='admin_products'),
+    path('admin-cache-stats/', admin_cache_stats, name='admin_cache_stats'),
+    path('admin-query-stats/', admin_query_stats, name='admin_query_stats'),
+    path('admin-export/<str:kind>/', admin_export, name='admin_export'),
 ]
@@ -1,24 +1,53 @@
 from rest_framework import viewsets, status
+from rest_framework.filters import OrderingFilter
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db.models import Q
-from decimal import Decimal
-import uuid
-
+from django.utils.decorators import method_decorator
+from django.db.models import prefetch_related_objects
+
+from .cache import CatalogCacheMixin, cached_response
+from .cart import CartOperationError, apply_cart_operations
+from .checkout import EmptyCart, InsufficientStock, place_order
+from .conditional import ConditionalGetMixin, compute_validators, conditional_response
+from .facets import compute_facets
+from .filters import InStockFilter, ProductSearchFilter
+from .idempotency import idempotent
+from .pagination import ProductPagination, VariantPagination, CreatedAtKeysetPagination, wants_keyset
+from .reservations import release_cart_reservations, reserve_cart
 from .models import (
     ProductCategory, Product, ProductVariant, Customer,
-    Cart, CartItem, Order, OrderItem, Inventory
+    Cart, CartItem, Order
 )
 from .serializers import (
     ProductCategorySerializer, ProductSerializer, ProductVariantSerializer,
-    CustomerSerializer, CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer
+    CustomerSerializer, CartSerializer, CartItemSerializer, OrderSerializer,
+    CartBatchSerializer
 )
 
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class EagerLoadingMixin:
+    """Plan the queryset for the current action before it is serialized.
+
+    An optional ``get_<action>_queryset(queryset)`` hook narrows the queryset
+    for a single action, then the serializer's ``setup_eager_loading`` adds the
+    joins and prefetches for the relations it renders.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        hook = getattr(self, f'get_{self.action}_queryset', None)
+        if hook is not None:
+            queryset = hook(queryset)
+        setup_eager_loading = getattr(self.get_serializer_class(), 'setup_eager_loading', None)
+        if setup_eager_loading is not None:
+            queryset = setup_eager_loading(queryset)
+        return queryset
+
+
+class ProductCategoryViewSet(ConditionalGetMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     """ViewSet for Product Categories"""
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
@@ -28,54 +57,80 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
 
 
-class ProductVariantViewSet(viewsets.ModelViewSet):
+class ProductVariantViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     """ViewSet for Product Variants"""
     queryset = ProductVariant.objects.all()
     serializer_class = ProductVariantSerializer
     permission_classes = [AllowAny]
+    pagination_class = VariantPagination
     filterset_fields = ['product', 'variant_type']
     search_fields = ['variant_name', 'sku']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CatalogCacheMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     """ViewSet for Products"""
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = ProductPagination
+    filter_backends = [InStockFilter, ProductSearchFilter, OrderingFilter]
     filterset_fields = ['category', 'is_active']
     search_fields = ['name', 'description']
     ordering_fields = ['base_price', 'created_at', 'name']
+    validator_timestamps = ('updated_at', 'category__updated_at', 'variants__updated_at')
+    validator_counts = ('pk', 'variants')
+
+    def get_by_category_queryset(self, queryset):
+        return queryset.filter(category_id=self.request.query_params.get('category_id'))
 
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         """Get products by category"""
+        return cached_response(self, request, self._by_category)
+
+    def _by_category(self, request):
         category_id = request.query_params.get('category_id')
         if not category_id:
             return Response({'error': 'category_id required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        products = self.queryset.filter(category_id=category_id)
+        products = self.get_queryset()
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Facet counts for the current search and filters"""
+        return cached_response(self, request, self._facets)
+
+    def _facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_facets(queryset))
+
 
 class CartViewSet(viewsets.ViewSet):
     """ViewSet for Shopping Cart"""
     permission_classes = [IsAuthenticated]
 
+    def serialize_cart(self, cart):
+        """Serialize a cart with its items, products and variants loaded in one query"""
+        prefetch_related_objects([cart], *CartSerializer.get_prefetches())
+        return CartSerializer(cart).data
+
     def list(self, request):
         """Get user's cart"""
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_cart(cart))
 
+    @idempotent
     def create(self, request):
         """Clear and recreate cart"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
+        release_cart_reservations(cart)
         cart.items.all().delete()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_cart(cart))
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def add(self, request):
         """Add item to cart"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
@@ -91,19 +146,51 @@ class CartViewSet(viewsets.ViewSet):
         if variant_id:
             variant = get_object_or_404(ProductVariant, id=variant_id)
 
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, variant=variant,
-            defaults={'quantity': quantity}
-        )
-
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        operation = {'op': 'add', 'product_id': product.id, 'variant_id': variant.id if variant else None, 'quantity': quantity}
+        serializer = CartBatchSerializer(data={'operations': [operation]})
+        serializer.is_valid(raise_exception=True)
+        try:
+            apply_cart_operations(cart, serializer.validated_data['operations'])
+        except CartOperationError as exc:
+            return Response({'error': exc.errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
 
+        cart_item = CartItem.objects.filter(cart=cart, product=product, variant=variant).first()
+        cart_item.product, cart_item.variant = product, variant
         serializer = CartItemSerializer(cart_item)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        """Apply a list of add/set/remove operations in one transaction"""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            apply_cart_operations(cart, serializer.validated_data['operations'])
+        except CartOperationError as exc:
+            return Response({'error': 'Invalid cart operations', 'operations': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.serialize_cart(cart))
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def reserve(self, request):
+        """Hold stock for the cart's variant lines until checkout or expiry"""
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            reservations = reserve_cart(cart)
+        except InsufficientStock as exc:
+            return Response({'error': str(exc), 'insufficient': exc.lines}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'expires_at': reservations[0].expires_at if reservations else None,
+            'reservations': [
+                {'variant_id': reservation.variant_id, 'quantity': reservation.quantity}
+                for reservation in reservations
+            ],
+        })
+
+    @action(detail=False, methods=['post'])
+    @idempotent
     def remove(self, request):
         """Remove item from cart"""
         cart = get_object_or_404(Cart, user=request.user)
@@ -115,10 +202,10 @@ class CartViewSet(viewsets.ViewSet):
         cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
         cart_item.delete()
 
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_cart(cart))
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def update_quantity(self, request):
         """Update item quantity"""
         cart = get_object_or_404(Cart, user=request.user)
@@ -128,7 +215,7 @@ class CartViewSet(viewsets.ViewSet):
         if not item_id:
             return Response({'error': 'item_id required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart_item = get_object_or_404(CartItem.objects.select_related('product', 'variant'), id=item_id, cart=cart)
         cart_item.quantity = max(1, quantity)
         cart_item.save()
 
@@ -136,85 +223,56 @@ class CartViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class OrderViewSet(viewsets.ViewSet):
     """ViewSet for Orders"""
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
         """Get user's orders"""
-        orders = Order.objects.filter(user=request.user)
+        orders = OrderSerializer.setup_eager_loading(Order.objects.filter(user=request.user))
+        if wants_keyset(request):
+            paginator = CreatedAtKeysetPagination()
+            page = paginator.paginate_queryset(orders, request, view=self)
+            serializer = OrderSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data)
 
     def retrieve(self, request, pk=None):
         """Get specific order"""
-        order = get_object_or_404(Order, id=pk, user=request.user)
+        return conditional_response(request, self.get_order_validators(request, pk), self._retrieve, pk=pk)
+
+    def _retrieve(self, request, pk=None):
+        order = get_object_or_404(OrderSerializer.setup_eager_loading(Order.objects.all()), id=pk, user=request.user)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
+    def get_order_validators(self, request, pk):
+        """ETag / Last-Modified for a single order and its lines"""
+        orders = Order.objects.filter(id=pk, user=request.user)
+        return compute_validators(request, orders, counts=('pk', 'items'))
+
+    @idempotent
     def create(self, request):
         """Create order from cart"""
         cart = get_object_or_404(Cart, user=request.user)
 
-        if not cart.items.exists():
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Check stock availability for all items
-        for cart_item in cart.items.all():
-            if cart_item.variant:
-                if cart_item.variant.stock_quantity < cart_item.quantity:
-                    return Response(
-                        {'error': f'Not enough stock for {cart_item.product.name} ({cart_item.variant.variant_name}). Available: {cart_item.variant.stock_quantity}'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                total_stock = sum(v.stock_quantity for v in cart_item.product.variants.all())
-                if total_stock < cart_item.quantity:
-                    return Response(
-                        {'error': f'Not enough stock for {cart_item.product.name}. Available: {total_stock}'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-        # Create order
-        order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-        order = Order.objects.create(
-            user=request.user,
-            order_number=order_number,
-            total_amount=cart.get_total(),
-            shipping_address=request.data.get('address'),
-            shipping_city=request.data.get('city'),
-            shipping_state=request.data.get('state'),
-            shipping_pincode=request.data.get('pincode')
-        )
-
-        # Add items to order and update stock
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                price_at_purchase=cart_item.product.base_price,
-                variant_price_at_purchase=cart_item.variant.additional_price if cart_item.variant else Decimal('0.00')
-            )
-            
-            # Decrease stock
-            if cart_item.variant:
-                cart_item.variant.stock_quantity -= cart_item.quantity
-                cart_item.variant.save()
-
-        # Clear cart
-        cart.items.all().delete()
+        try:
+            order = place_order(request.user, cart, request.data)
+        except EmptyCart as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as exc:
+            return Response({'error': str(exc), 'insufficient': exc.lines}, status=status.HTTP_400_BAD_REQUEST)
 
+        prefetch_related_objects([order], *OrderSerializer.get_prefetches())
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['get'])
     def track(self, request, pk=None):
         """Track order status"""
-        order = get_object_or_404(Order, id=pk, user=request.user)
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        return conditional_response(request, self.get_order_validators(request, pk), self._retrieve, pk=pk)
 
 
 class CustomerViewSet(viewsets.ViewSet):